@@ -0,0 +1,82 @@
+# Lap cost versus grid size for the scalar, vector and sector lap kernels, and a
+# check that the vector kernel races like the scalar one. Races only use the vector
+# kernel from VectorLapKernel.min_grid cars; here it runs on every grid size.
+# Usage: python benchmark.py [laps]
+#        python benchmark.py parity [races]
+
+import sys
+import time
+
+import numpy as np
+
+# The test suite's race builder; importing it also points DB_PATH at a scratch database
+from tests.conftest import make_race
+from bot import VectorLapKernel
+
+GRID_SIZES = [20, 50, 100, 200, 500, 1000]
+
+VectorLapKernel.min_grid = 0
+
+# Per-race outcomes compared between kernels, with the relative tolerance on their means
+PARITY_STATS = {
+    "finish time": 0.01,
+    "best lap": 0.01,
+    "dnf rate": 0.15,
+    "pit stops": 0.10,
+    "overtakes": 0.20,
+    "tyre left": 0.10,
+    "fuel left": 0.05,
+}
+
+def time_laps(grid_size: int, kernel: str, laps: int) -> float:
+    race = make_race(kernel, seed=grid_size, laps=laps, grid_size=grid_size, forecast=["clear"] * (laps + 1),
+                     ai_only=True)
+    started = time.perf_counter()
+    race.run_to_finish()
+    return (time.perf_counter() - started) / laps * 1000
+
+def race_outcomes(kernel: str, races: int, weather: str) -> dict:
+    """Mean of each PARITY_STATS outcome over seeded 20-car races"""
+    outcomes = {name: [] for name in PARITY_STATS}
+    for seed in range(races):
+        race = make_race(kernel, seed=seed, laps=20, weather=weather, forecast=[weather] * 21, ai_only=True)
+        race.run_to_finish()
+        finishers = [d for d in race.drivers if not d.dnf]
+        outcomes["finish time"].append(np.mean([d.total_time for d in finishers]))
+        outcomes["best lap"].append(np.mean([d.best_lap for d in finishers]))
+        outcomes["dnf rate"].append(1 - len(finishers) / len(race.drivers))
+        outcomes["pit stops"].append(np.mean([d.pit_stops for d in race.drivers]))
+        outcomes["overtakes"].append(sum(d.overtakes_made for d in race.drivers))
+        outcomes["tyre left"].append(np.mean([d.tyre_condition for d in finishers]))
+        outcomes["fuel left"].append(np.mean([d.fuel_load for d in finishers]))
+    return {name: float(np.mean(values)) for name, values in outcomes.items()}
+
+def check_parity(races: int) -> bool:
+    """Print scalar against vector outcomes in the dry and the wet; False if any drifts past its tolerance"""
+    passed = True
+    print(f"{'weather':>8} {'outcome':>12} {'scalar':>10} {'vector':>10} {'diff':>7}")
+    for weather in ("clear", "rain"):
+        scalar = race_outcomes("scalar", races, weather)
+        vector = race_outcomes("vector", races, weather)
+        for name, tolerance in PARITY_STATS.items():
+            diff = abs(vector[name] - scalar[name]) / max(abs(scalar[name]), 1e-9)
+            ok = diff <= tolerance
+            passed = passed and ok
+            print(f"{weather:>8} {name:>12} {scalar[name]:>10.3f} {vector[name]:>10.3f} {diff:>6.1%}"
+                  f"{'' if ok else '  FAIL'}")
+    return passed
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "parity":
+        sys.exit(0 if check_parity(int(sys.argv[2]) if len(sys.argv) > 2 else 300) else 1)
+    
+    laps = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    time_laps(20, "vector", 2)
+    
+    print(f"{'cars':>6} {'scalar ms/lap':>14} {'vector ms/lap':>14} {'vector us/car':>14} {'vector speedup':>15} {'sector ms/lap':>14}")
+    for grid_size in GRID_SIZES:
+        scalar = time_laps(grid_size, "scalar", laps)
+        vector = time_laps(grid_size, "vector", laps)
+        sector = time_laps(grid_size, "sector", laps)
+        print(f"{grid_size:>6} {scalar:>14.2f} {vector:>14.2f} {vector * 1000 / grid_size:>14.1f} "
+              f"{scalar / vector:>14.2f}x {sector:>14.2f}")
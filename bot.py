@@ -7,22 +7,184 @@ from discord.ext import commands
 from discord import app_commands
 import asyncio
 import random
+import heapq
+from collections import deque
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+from operator import attrgetter
+from functools import partial
+from itertools import accumulate, product, repeat
+from types import MappingProxyType
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
 import json
+import os
+import pickle
+import signal
+import time
+import zlib
+import numpy as np
 
 # ============================================================================
 # DATABASE SYSTEM - COMPLETE
 # ============================================================================
 
+class PooledConnection:
+    """Connection borrowed from the Database pool; close() hands it back instead of closing it"""
+    def __init__(self, db: 'Database', conn: sqlite3.Connection):
+        self.db = db
+        self.conn = conn
+    
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+    
+    def close(self):
+        if self.conn is not None:
+            self.db.release(self.conn)
+            self.conn = None
+
 class Database:
-    def __init__(self, db_name="f1_racing.db"):
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=67108864",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA busy_timeout=5000",
+    )
+    CACHED_STATEMENTS = 256
+    
+    # Ordered schema changes on top of the CREATE TABLE baseline: (version, description, steps).
+    # A step is SQL or a (table, column, definition) column to add; every step is idempotent
+    # so databases patched before versioning existed are simply stamped.
+    MIGRATIONS = (
+        (1, "replay columns on race_history", (
+            ("race_history", "seed", "INTEGER"),
+            ("race_history", "race_inputs", "TEXT DEFAULT '[]'"),
+        )),
+        (2, "starting weather on weather_forecasts", (
+            ("weather_forecasts", "start_weather", "TEXT"),
+        )),
+        (3, "indexes for profile, stats, history, garage and daily lookups", (
+            "CREATE INDEX IF NOT EXISTS idx_race_history_user_time ON race_history (user_id, timestamp, position, track)",
+            "CREATE INDEX IF NOT EXISTS idx_race_history_user_finishes "
+            "ON race_history (user_id, dnf, position, fastest_lap, track, timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_cars_owner_active ON cars (owner_id, is_active)",
+            "CREATE INDEX IF NOT EXISTS idx_daily_challenges_date ON daily_challenges (valid_date)",
+            "CREATE INDEX IF NOT EXISTS idx_weather_forecasts_window "
+            "ON weather_forecasts (track, forecast_date, start_weather)",
+        )),
+        (4, "leaderboard score indexes on users", (
+            "CREATE INDEX IF NOT EXISTS idx_users_career_points ON users (career_points)",
+            "CREATE INDEX IF NOT EXISTS idx_users_money ON users (money)",
+            "CREATE INDEX IF NOT EXISTS idx_users_career_wins ON users (career_wins)",
+            "CREATE INDEX IF NOT EXISTS idx_users_skill_rating ON users (skill_rating)",
+        )),
+        (5, "pre-race state for rebuilding race_history rows", (
+            "CREATE TABLE IF NOT EXISTS race_start_states (start_id INTEGER PRIMARY KEY AUTOINCREMENT, state BLOB)",
+            ("race_history", "start_id", "INTEGER"),
+        )),
+    )
+    
+    LEADERBOARD_COLUMNS = ("career_points", "money", "career_wins", "skill_rating")
+    # Leaderboard pages walk a score index; drivers on equal scores are ordered by user_id
+    LEADERBOARD_QUERIES = {
+        'top': """SELECT user_id, driver_name, {column}, nationality, racing_number FROM users
+                  ORDER BY {column} DESC, user_id DESC LIMIT ?""",
+        'above': """SELECT user_id, driver_name, {column}, nationality, racing_number FROM users
+                    WHERE ({column}, user_id) > (?, ?) ORDER BY {column}, user_id LIMIT ?""",
+        'below': """SELECT user_id, driver_name, {column}, nationality, racing_number FROM users
+                    WHERE ({column}, user_id) < (?, ?) ORDER BY {column} DESC, user_id DESC LIMIT ?""",
+    }
+    
+    # Queries on the command paths; check_query_plans() expects each to be served by an index
+    HOT_QUERIES = {
+        'user': "SELECT * FROM users WHERE user_id = ?",
+        'active_car': "SELECT * FROM cars WHERE owner_id = ? AND is_active = 1 LIMIT 1",
+        'history': """SELECT position, track, weather, points, fastest_lap, timestamp, dnf, dnf_reason
+                      FROM race_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?""",
+        'best_results': """SELECT position, track, timestamp FROM race_history
+                           WHERE user_id = ? AND dnf = 0 ORDER BY position ASC LIMIT ?""",
+        'finish_summary': """SELECT COUNT(*), AVG(position), MIN(position), MAX(fastest_lap)
+                             FROM race_history WHERE user_id = ? AND dnf = 0""",
+        'best_tracks': """SELECT track, COUNT(*) as wins FROM race_history WHERE user_id = ? AND position = 1
+                          GROUP BY track ORDER BY wins DESC LIMIT 3""",
+        'race_craft': "SELECT SUM(overtakes_made), SUM(battles_won), SUM(pit_stops) FROM race_history WHERE user_id = ?",
+        'recent_form': "SELECT position, track FROM race_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT 5",
+        'daily_challenges': "SELECT COUNT(*) FROM daily_challenges WHERE valid_date = ?",
+        'forecast_window': """SELECT hourly_forecast FROM weather_forecasts
+                              WHERE track = ? AND forecast_date = ? AND start_weather = ?""",
+    }
+    HOT_QUERIES.update({
+        f"leaderboard_{page}_{column}": query.format(column=column)
+        for column, (page, query) in product(LEADERBOARD_COLUMNS, LEADERBOARD_QUERIES.items())
+    })
+    
+    def __init__(self, db_name="f1_racing.db", pool_size: int = 4):
         self.db_name = db_name
-        self.init_db()
+        self.pool_size = pool_size
+        self.pool: List[sqlite3.Connection] = []
+        self.pool_lock = threading.Lock()
+        # Background writes share one connection and take turns on it
+        self.write_lock = threading.Lock()
+        self.write_conn = None
+        # The schema is created on first use, so importing the bot touches no database file
+        self.setup_lock = threading.RLock()
+        self.ready = False
+        self.setting_up = False
+    
+    def setup(self):
+        with self.setup_lock:
+            if self.ready or self.setting_up:
+                return
+            self.setting_up = True
+            try:
+                self.init_db()
+                self.ready = True
+            finally:
+                self.setting_up = False
+    
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=self.CACHED_STATEMENTS)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def get_conn(self) -> PooledConnection:
+        if not self.ready:
+            self.setup()
+        with self.pool_lock:
+            conn = self.pool.pop() if self.pool else None
+        return PooledConnection(self, conn or self.connect())
+    
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self.pool_lock:
+            if len(self.pool) < self.pool_size:
+                self.pool.append(conn)
+                return
+        conn.close()
     
-    def get_conn(self):
-        return sqlite3.connect(self.db_name)
+    @contextmanager
+    def writer(self):
+        """The shared writer connection, one holder at a time; commits when the block succeeds"""
+        if not self.ready:
+            self.setup()
+        with self.write_lock:
+            if self.write_conn is None:
+                self.write_conn = self.connect()
+            try:
+                yield self.write_conn
+                self.write_conn.commit()
+            except Exception:
+                self.write_conn.rollback()
+                raise
     
     def init_db(self):
         conn = self.get_conn()
@@ -225,6 +387,9 @@ class Database:
             skill_xp_earned INTEGER DEFAULT 0,
             achievements_unlocked TEXT DEFAULT '[]',
             race_mode TEXT DEFAULT 'normal',
+            seed INTEGER,
+            race_inputs TEXT DEFAULT '[]',
+            start_id INTEGER,
             FOREIGN KEY (user_id) REFERENCES users(user_id)
         )''')
         
@@ -564,13 +729,85 @@ class Database:
             FOREIGN KEY (user_id) REFERENCES users(user_id)
         )''')
         
+        # RACE CHECKPOINTS TABLE - Latest lap snapshot of every race in flight
+        c.execute('''CREATE TABLE IF NOT EXISTS race_checkpoints (
+            channel_id INTEGER PRIMARY KEY,
+            lap INTEGER,
+            state BLOB,
+            saved_at TEXT
+        )''')
+        
+        # RACE START STATES TABLE - Grid, forecast and seed state before lap 1, shared by a race's history rows
+        c.execute('''CREATE TABLE IF NOT EXISTS race_start_states (
+            start_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            state BLOB
+        )''')
+        
+        # SCHEMA VERSION TABLE - One row per applied migration
+        c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_date TEXT
+        )''')
+        
         conn.commit()
+        self.migrate(conn)
         conn.close()
         
         self.seed_ai_drivers()
         self.seed_sponsors()
         self.seed_achievements()
         self.seed_daily_challenges()
+        
+        for name, detail in self.check_query_plans().items():
+            print(f"⚠️ Hot query '{name}' is not using an index: {detail}")
+    
+    def add_column(self, c: sqlite3.Cursor, table: str, column: str, definition: str):
+        c.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in c.fetchall()]:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    def migrate(self, conn: sqlite3.Connection) -> int:
+        """Apply every migration newer than the stored schema version, each in its own transaction"""
+        c = conn.cursor()
+        c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        version = c.fetchone()[0]
+        
+        for number, description, steps in self.MIGRATIONS:
+            if number <= version:
+                continue
+            
+            c.execute("BEGIN")
+            try:
+                for step in steps:
+                    if isinstance(step, tuple):
+                        self.add_column(c, *step)
+                    else:
+                        c.execute(step)
+                c.execute("INSERT INTO schema_version (version, description, applied_date) VALUES (?, ?, ?)",
+                          (number, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = number
+        return version
+    
+    def check_query_plans(self) -> Dict[str, str]:
+        """Hot queries whose EXPLAIN QUERY PLAN falls back to a full table scan"""
+        self.setup()
+        # A fresh connection, so no cached plan predates the current schema
+        conn = self.connect()
+        c = conn.cursor()
+        scans = {}
+        for name, query in self.HOT_QUERIES.items():
+            c.execute(f"EXPLAIN QUERY PLAN {query}", (0,) * query.count("?"))
+            for row in c.fetchall():
+                detail = row[-1]
+                if detail.startswith("SCAN") and "INDEX" not in detail:
+                    scans[name] = detail
+        conn.close()
+        return scans
     
     def seed_ai_drivers(self):
         conn = self.get_conn()
@@ -676,7 +913,7 @@ class Database:
         c = conn.cursor()
         today = datetime.now().strftime("%Y-%m-%d")
         
-        c.execute("SELECT COUNT(*) FROM daily_challenges WHERE valid_date = ?", (today,))
+        c.execute(self.HOT_QUERIES['daily_challenges'], (today,))
         if c.fetchone()[0] == 0:
             challenges = [
                 (f"Win a Race - {today}", "Win any race today", "win", 1, 10000, 50, today, "hard"),
@@ -690,12 +927,750 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', challenges)
             conn.commit()
         conn.close()
+    
+    def save_race_checkpoint(self, channel_id: int, lap: int, state: bytes):
+        """Replace the channel's checkpoint with a compressed race snapshot"""
+        state = zlib.compress(state, 1)
+        with self.writer() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO race_checkpoints (channel_id, lap, state, saved_at) VALUES (?, ?, ?, ?)",
+                (channel_id, lap, state, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+    
+    def delete_race_checkpoint(self, channel_id: int):
+        with self.writer() as conn:
+            conn.execute("DELETE FROM race_checkpoints WHERE channel_id = ?", (channel_id,))
+    
+    def load_race_checkpoints(self) -> List[tuple]:
+        """(channel_id, lap, snapshot) of every race that was running at shutdown"""
+        conn = self.get_conn()
+        c = conn.cursor()
+        c.execute("SELECT channel_id, lap, state FROM race_checkpoints ORDER BY saved_at")
+        checkpoints = [(channel_id, lap, zlib.decompress(state)) for channel_id, lap, state in c.fetchall()]
+        conn.close()
+        return checkpoints
+
+class SortedScores:
+    """Sorted multiset of one column's scores, held in chunks with a Fenwick tree over the chunk sizes"""
+    CHUNK = 512
+    
+    def __init__(self, values: List[float] = ()):
+        values = sorted(values)
+        self.chunks = [array('d', values[start:start + self.CHUNK]) for start in range(0, len(values), self.CHUNK)]
+        self.reindex()
+    
+    def reindex(self):
+        """Rebuild the chunk maxima and the Fenwick tree after chunks were split or dropped"""
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.tree = [0] * (len(self.chunks) + 1)
+        for index, chunk in enumerate(self.chunks):
+            self.grow(index, len(chunk))
+    
+    def grow(self, index: int, delta: int):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+    
+    def count_before(self, index: int) -> int:
+        """Number of scores in the chunks ahead of this one"""
+        total = 0
+        while index:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+    
+    def __len__(self) -> int:
+        return self.count_before(len(self.chunks))
+    
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+    
+    def add(self, value: float):
+        if not self.chunks:
+            self.chunks.append(array('d', [value]))
+            self.reindex()
+            return
+        index = min(bisect_left(self.maxes, value), len(self.chunks) - 1)
+        chunk = self.chunks[index]
+        insort(chunk, value)
+        self.maxes[index] = chunk[-1]
+        self.grow(index, 1)
+        if len(chunk) > 2 * self.CHUNK:
+            self.chunks[index:index + 1] = [chunk[:self.CHUNK], chunk[self.CHUNK:]]
+            self.reindex()
+    
+    def remove(self, value: float) -> bool:
+        """Drop one copy of the score, False if it is not held"""
+        index = bisect_left(self.maxes, value)
+        if index == len(self.chunks):
+            return False
+        chunk = self.chunks[index]
+        position = bisect_left(chunk, value)
+        if chunk[position] != value:
+            return False
+        del chunk[position]
+        if chunk:
+            self.maxes[index] = chunk[-1]
+            self.grow(index, -1)
+        else:
+            del self.chunks[index]
+            self.reindex()
+        return True
+    
+    def count_above(self, value: float) -> int:
+        """Number of scores strictly higher than the value"""
+        index = bisect_right(self.maxes, value)
+        if index == len(self.chunks):
+            return 0
+        chunk = self.chunks[index]
+        return len(self) - self.count_before(index + 1) + len(chunk) - bisect_right(chunk, value)
+
+class LeaderboardRanks:
+    """Every driver's score per leaderboard column in a sorted multiset, so a rank or a move is O(log n)"""
+    def __init__(self, columns: tuple):
+        self.columns = columns
+        self.scores: Dict[str, SortedScores] = {}
+        self.lock = threading.Lock()
+    
+    @property
+    def loaded(self) -> bool:
+        return bool(self.scores)
+    
+    def load(self, c: sqlite3.Cursor):
+        scores = {}
+        for column in self.columns:
+            c.execute(f"SELECT {column} FROM users ORDER BY {column}")
+            scores[column] = SortedScores([float(row[0]) for row in c.fetchall()])
+        with self.lock:
+            self.scores = scores
+    
+    def invalidate(self):
+        with self.lock:
+            self.scores = {}
+    
+    def rank(self, column: str, value: float) -> Optional[int]:
+        """1 + the number of drivers with a strictly higher score"""
+        with self.lock:
+            scores = self.scores.get(column)
+            if scores is None:
+                return None
+            return scores.count_above(value) + 1
+    
+    def apply(self, changes: List[tuple]):
+        """Move drivers to their new scores; changes are (old, new) score rows, old None for a new driver"""
+        with self.lock:
+            if not self.scores:
+                return
+            for index, column in enumerate(self.columns):
+                scores = self.scores[column]
+                for old, new in changes:
+                    if old is not None and old[index] == new[index]:
+                        continue
+                    if old is not None and not scores.remove(float(old[index])):
+                        # The ranks drifted from the table; rebuild them from it on next use
+                        self.scores = {}
+                        return
+                    scores.add(float(new[index]))
+
+class Repository:
+    """Awaitable queries for the bot commands; SQL runs on the database threads, the event loop only awaits it"""
+    def __init__(self, db: Database):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=db.pool_size, thread_name_prefix="db")
+        self.ranks = LeaderboardRanks(Database.LEADERBOARD_COLUMNS)
+    
+    async def run(self, func, *args):
+        """Run a blocking database call on the repository threads"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    def fetch_one(self, query: str, params: tuple = ()) -> Optional[Dict]:
+        conn = self.db.get_conn()
+        try:
+            c = conn.cursor()
+            c.execute(query, params)
+            row = c.fetchone()
+            return dict(zip([description[0] for description in c.description], row)) if row else None
+        finally:
+            conn.close()
+    
+    def fetch_all(self, query: str, params: tuple = ()) -> List[tuple]:
+        conn = self.db.get_conn()
+        try:
+            c = conn.cursor()
+            c.execute(query, params)
+            return c.fetchall()
+        finally:
+            conn.close()
+    
+    def fetch_dicts(self, query: str, params: tuple = ()) -> List[Dict]:
+        conn = self.db.get_conn()
+        try:
+            c = conn.cursor()
+            c.execute(query, params)
+            columns = [description[0] for description in c.description]
+            return [dict(zip(columns, row)) for row in c.fetchall()]
+        finally:
+            conn.close()
+    
+    def read_scores(self, c: sqlite3.Cursor, user_ids: List[int]) -> Dict[int, tuple]:
+        """Leaderboard scores of the given drivers, read inside the caller's transaction"""
+        scores = {}
+        user_ids = list(set(user_ids))
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            c.execute(f"SELECT user_id, {', '.join(self.ranks.columns)} FROM users "
+                      f"WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk)
+            scores.update((row[0], row[1:]) for row in c.fetchall())
+        return scores
+    
+    @contextmanager
+    def ranked_writer(self, user_ids: List[int]):
+        """Writer transaction that moves the drivers' leaderboard ranks along with their scores"""
+        applied = False
+        try:
+            with self.db.writer() as conn:
+                c = conn.cursor()
+                before = self.read_scores(c, user_ids) if self.ranks.loaded else None
+                yield c
+                if before is not None:
+                    after = self.read_scores(c, user_ids)
+                    self.ranks.apply([(before.get(user_id), scores) for user_id, scores in after.items()])
+                    applied = True
+        except Exception:
+            # The commit failed after the ranks moved; rebuild them from the table on next use
+            if applied:
+                self.ranks.invalidate()
+            raise
+    
+    def load_ranks(self):
+        """Build the in-memory ranks, holding the writer so no result lands half way through"""
+        if self.ranks.loaded:
+            return
+        with self.db.writer() as conn:
+            if not self.ranks.loaded:
+                self.ranks.load(conn.cursor())
+    
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        return await self.run(self.fetch_one, Database.HOT_QUERIES['user'], (user_id,))
+    
+    async def is_registered(self, user_id: int) -> bool:
+        return await self.run(self.fetch_one, "SELECT 1 AS registered FROM users WHERE user_id = ?", (user_id,)) is not None
+    
+    async def get_active_car(self, user_id: int) -> Optional[Dict]:
+        return await self.run(self.fetch_one, Database.HOT_QUERIES['active_car'], (user_id,))
+    
+    async def create_user(self, user_id: int, driver_name: str, nationality: str) -> bool:
+        """Insert the driver and their starting car; False if they were already registered"""
+        return await self.run(self.insert_user, user_id, driver_name, nationality)
+    
+    def insert_user(self, user_id: int, driver_name: str, nationality: str) -> bool:
+        with self.ranked_writer([user_id]) as c:
+            c.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
+            if c.fetchone():
+                return False
+            
+            c.execute('''INSERT INTO users (user_id, driver_name, nationality, created_date, racing_number)
+                         VALUES (?, ?, ?, ?, ?)''',
+                      (user_id, driver_name, nationality, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                       random.randint(1, 99)))
+            
+            # Create default car
+            c.execute('''INSERT INTO cars (owner_id, car_name, is_active)
+                         VALUES (?, ?, 1)''',
+                      (user_id, f"{driver_name}'s Car"))
+        return True
+    
+    async def apply_upgrade(self, user_id: int, component: str, new_value: float, cost: int) -> bool:
+        """Charge the upgrade and set the component; False if the driver can no longer afford it"""
+        return await self.run(self.write_upgrade, user_id, component, new_value, cost)
+    
+    def write_upgrade(self, user_id: int, component: str, new_value: float, cost: int) -> bool:
+        with self.ranked_writer([user_id]) as c:
+            c.execute("UPDATE users SET money = money - ? WHERE user_id = ? AND money >= ?", (cost, user_id, cost))
+            if c.rowcount == 0:
+                return False
+            c.execute(f"UPDATE cars SET {component} = ? WHERE owner_id = ? AND is_active = 1", (new_value, user_id))
+        return True
+    
+    async def get_ai_profiles(self) -> List[Dict]:
+        return await self.run(self.fetch_dicts, "SELECT * FROM ai_profiles ORDER BY ai_id")
+    
+    async def get_best_results(self, user_id: int, limit: int = 3) -> List[tuple]:
+        """(position, track, timestamp) of the driver's best finishes"""
+        return await self.run(self.fetch_all, Database.HOT_QUERIES['best_results'], (user_id, limit))
+    
+    async def get_history(self, user_id: int, limit: int = 10) -> List[tuple]:
+        return await self.run(self.fetch_all, Database.HOT_QUERIES['history'], (user_id, limit))
+    
+    async def get_race_summary(self, user_id: int) -> Dict:
+        """Finishing record, best tracks, race craft totals and recent form from race_history"""
+        return await self.run(self.read_race_summary, user_id)
+    
+    def read_race_summary(self, user_id: int) -> Dict:
+        conn = self.db.get_conn()
+        try:
+            c = conn.cursor()
+            c.execute(Database.HOT_QUERIES['finish_summary'], (user_id,))
+            races, avg_pos, best_pos, best_lap = c.fetchone()
+            
+            c.execute(Database.HOT_QUERIES['best_tracks'], (user_id,))
+            best_tracks = c.fetchall()
+            
+            c.execute(Database.HOT_QUERIES['race_craft'], (user_id,))
+            overtakes, battles, pit_stops = c.fetchone()
+            
+            c.execute(Database.HOT_QUERIES['recent_form'], (user_id,))
+            recent = c.fetchall()
+        finally:
+            conn.close()
+        
+        return {
+            'races': races, 'avg_position': avg_pos, 'best_position': best_pos, 'best_lap': best_lap,
+            'best_tracks': best_tracks, 'overtakes': overtakes, 'battles': battles, 'pit_stops': pit_stops,
+            'recent': recent
+        }
+    
+    async def get_leaderboard(self, column: str, limit: int = 10) -> List[tuple]:
+        """(driver_name, value, nationality, racing_number) of the top drivers by a leaderboard column"""
+        rows = await self.run(self.fetch_all, Database.LEADERBOARD_QUERIES['top'].format(column=column), (limit,))
+        return [row[1:] for row in rows]
+    
+    async def get_rank(self, user_id: int, column: str) -> Optional[tuple]:
+        """(rank, value) of the driver by a leaderboard column, None if not registered"""
+        return await self.run(self.read_rank, user_id, column)
+    
+    def read_rank(self, user_id: int, column: str) -> Optional[tuple]:
+        self.load_ranks()
+        row = self.fetch_one(f"SELECT {column} FROM users WHERE user_id = ?", (user_id,))
+        if not row:
+            return None
+        return self.ranks.rank(column, row[column]), row[column]
+    
+    async def get_page_around(self, user_id: int, column: str, size: int = 10) -> List[tuple]:
+        """(rank, driver_name, value, nationality, racing_number, user_id) of the drivers either side of this one"""
+        return await self.run(self.read_page_around, user_id, column, size)
+    
+    def read_page_around(self, user_id: int, column: str, size: int) -> List[tuple]:
+        self.load_ranks()
+        conn = self.db.get_conn()
+        try:
+            c = conn.cursor()
+            c.execute(f"SELECT user_id, driver_name, {column}, nationality, racing_number FROM users WHERE user_id = ?",
+                      (user_id,))
+            me = c.fetchone()
+            if not me:
+                return []
+            
+            c.execute(Database.LEADERBOARD_QUERIES['above'].format(column=column), (me[2], user_id, size // 2))
+            above = c.fetchall()[::-1]
+            c.execute(Database.LEADERBOARD_QUERIES['below'].format(column=column),
+                      (me[2], user_id, size - 1 - len(above)))
+            below = c.fetchall()
+        finally:
+            conn.close()
+        
+        return [(self.ranks.rank(column, value), name, value, nationality, number, driver_id)
+                for driver_id, name, value, nationality, number in above + [me] + below]
+    
+    async def record_race_results(self, user_updates: List[tuple], history_rows: List[tuple]):
+        """Apply career updates and race_history rows, from one or many races, in a single transaction"""
+        await self.run(self.write_race_results, user_updates, history_rows)
+    
+    def write_race_results(self, user_updates: List[tuple], history_rows: List[tuple]):
+        with self.ranked_writer([row[-1] for row in user_updates]) as c:
+            # A history row ends with its race's start state; each race stores it once
+            start_ids = {}
+            rows = []
+            for row in history_rows:
+                start_state = row[-1]
+                if start_state is not None and start_state not in start_ids:
+                    c.execute("INSERT INTO race_start_states (state) VALUES (?)", (start_state,))
+                    start_ids[start_state] = c.lastrowid
+                rows.append(row[:-1] + (start_ids.get(start_state),))
+            
+            c.executemany('''UPDATE users SET
+                career_points = career_points + ?,
+                money = money + ?,
+                race_starts = race_starts + 1,
+                career_wins = career_wins + ?,
+                career_podiums = career_podiums + ?,
+                fastest_laps = fastest_laps + ?,
+                dnf_count = dnf_count + ?,
+                total_distance = total_distance + ?,
+                total_race_time = total_race_time + ?,
+                last_race_date = ?
+                WHERE user_id = ?''', user_updates)
+            
+            c.executemany('''INSERT INTO race_history (
+                user_id, position, points, fastest_lap, timestamp, track, weather,
+                grid_position, positions_gained, pit_stops, dnf, dnf_reason,
+                overtakes_made, overtakes_lost, battles_won, battles_lost,
+                top_speed, avg_lap_time, race_time, gap_to_winner,
+                tire_strategy, money_earned, race_mode, seed, race_inputs, start_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    
+    async def get_race_start(self, race_id: int) -> Optional[tuple]:
+        return await self.run(self.read_race_start, race_id)
+    
+    def read_race_start(self, race_id: int) -> Optional[tuple]:
+        """(start state, race inputs) of a race_history row, None if it was stored without a start state"""
+        row = self.fetch_one("""SELECT race_start_states.state, race_history.race_inputs FROM race_history
+                                JOIN race_start_states ON race_start_states.start_id = race_history.start_id
+                                WHERE race_history.race_id = ?""", (race_id,))
+        return (row['state'], row['race_inputs']) if row else None
+    
+    async def load_race_checkpoints(self) -> List[tuple]:
+        return await self.run(self.db.load_race_checkpoints)
+    
+    async def delete_race_checkpoint(self, channel_id: int):
+        await self.run(self.db.delete_race_checkpoint, channel_id)
+
+class ResultWriter:
+    """Write-behind queue for race results; races finishing within one window share a transaction"""
+    def __init__(self, repository: Repository, window: float = 2.0, max_rows: int = 500,
+                 lag_warning: float = 10.0, log_interval: float = 300.0):
+        self.repository = repository
+        self.window = window
+        self.max_rows = max_rows
+        self.lag_warning = lag_warning
+        self.log_interval = log_interval
+        self.last_log = time.monotonic()
+        self.user_updates: List[tuple] = []
+        self.history_rows: List[tuple] = []
+        self.oldest: Optional[float] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        
+        self.batches = 0
+        self.rows_written = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+    
+    @property
+    def lag(self) -> float:
+        """Seconds the oldest unwritten result has been waiting"""
+        return time.monotonic() - self.oldest if self.oldest is not None else 0.0
+    
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'pending': len(self.history_rows), 'lag': self.lag, 'last_lag': self.last_lag,
+            'max_lag': self.max_lag, 'batches': self.batches, 'rows_written': self.rows_written
+        }
+    
+    def submit(self, user_updates: List[tuple], history_rows: List[tuple]):
+        """Queue one race's rows; they are written at most one window later"""
+        if not history_rows:
+            return
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.user_updates.extend(user_updates)
+        self.history_rows.extend(history_rows)
+        
+        if len(self.history_rows) >= self.max_rows:
+            if self.flush_task:
+                self.flush_task.cancel()
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush())
+        elif self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush_later())
+    
+    def take(self) -> tuple:
+        """Detach the pending rows so new results start a fresh batch"""
+        batch = (self.user_updates, self.history_rows, self.oldest)
+        self.user_updates, self.history_rows, self.oldest = [], [], None
+        return batch
+    
+    def requeue(self, batch: tuple):
+        user_updates, history_rows, oldest = batch
+        self.user_updates[:0] = user_updates
+        self.history_rows[:0] = history_rows
+        self.oldest = oldest if self.oldest is None else min(oldest, self.oldest)
+    
+    def record(self, batch: tuple):
+        lag = time.monotonic() - batch[2]
+        self.batches += 1
+        self.rows_written += len(batch[1])
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+    
+    async def flush_later(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
+    
+    async def flush(self):
+        """Write every pending result in one transaction; failed batches are retried next window"""
+        self.flush_task = None
+        if not self.history_rows:
+            return
+        
+        batch = self.take()
+        try:
+            await self.repository.record_race_results(batch[0], batch[1])
+        except Exception as e:
+            print(f"Error writing {len(batch[1])} race results: {e}")
+            self.requeue(batch)
+            if self.flush_task is None:
+                self.flush_task = asyncio.get_running_loop().create_task(self.flush_later())
+        else:
+            self.record(batch)
+        self.report()
+    
+    def report(self):
+        """Log queue depth and lag every log_interval, and at once when results fall lag_warning behind"""
+        metrics = self.metrics()
+        now = time.monotonic()
+        lag = max(metrics['lag'], metrics['last_lag'])
+        if lag > self.lag_warning:
+            print(f"⚠️ Race results are {lag:.1f}s behind: {metrics['pending']} rows pending, "
+                  f"last batch {metrics['last_lag']:.1f}s")
+        elif now - self.last_log >= self.log_interval:
+            print(f"📊 Result writer: {metrics['pending']} pending, lag {metrics['last_lag']:.2f}s "
+                  f"(max {metrics['max_lag']:.2f}s), {metrics['batches']} batches, {metrics['rows_written']} rows")
+        else:
+            return
+        self.last_log = now
+    
+    async def drain(self):
+        """Write whatever is still queued before the event loop stops"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.history_rows:
+            await self.flush()
+    
+    def close(self):
+        """Write whatever is still queued, blocking; used once the event loop has stopped"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.history_rows:
+            batch = self.take()
+            self.repository.write_race_results(batch[0], batch[1])
+            self.record(batch)
+
+# ============================================================================
+# TRACK REGISTRY
+# ============================================================================
+
+class TrackRegistry:
+    """Read-only track data loaded once, with track x weather x compound coefficient tables"""
+    REQUIRED_FIELDS = (
+        "name", "country", "length", "corners", "base_lap_time",
+        "overtake_difficulty", "tyre_wear", "fuel_usage", "sector_lengths",
+    )
+    OPTIONAL_FIELDS = {
+        "characteristic": "Custom Circuit", "drs_zones": 2, "elevation_change": 0, "avg_speed": 200,
+        "key_corners": [], "street_circuit": False, "drs_gap_threshold": 1.0,
+    }
+    # Numeric fields as (type, minimum, maximum); numeric strings from hand-edited files are coerced
+    NUMERIC_FIELDS = {
+        "length": (float, 0.1, 50.0), "corners": (int, 1, 100), "base_lap_time": (float, 10.0, 600.0),
+        "overtake_difficulty": (float, 0.0, 100.0), "tyre_wear": (float, 0.1, 10.0), "fuel_usage": (float, 0.1, 10.0),
+        "drs_zones": (int, 0, 10), "elevation_change": (float, 0.0, 1000.0), "avg_speed": (float, 1.0, 500.0),
+        "drs_gap_threshold": (float, 0.0, 10.0),
+    }
+    
+    COMPOUNDS = ("soft", "medium", "hard", "inter", "wet")
+    WEATHERS = ("clear", "partly_cloudy", "cloudy", "light_rain", "rain", "heavy_rain")
+    COMPOUND_WEAR = {"soft": 4.5, "medium": 2.8, "hard": 1.6, "inter": 3.2, "wet": 2.8}
+    RAIN_MULTIPLIER = {"light_rain": 2.0, "rain": 3.0, "heavy_rain": 4.5}
+    DRY_TYRES_IN_RAIN = 2.5
+    STREET_INCIDENTS = 1.4
+    
+    def __init__(self, tracks: Dict[str, Dict]):
+        self.tracks = MappingProxyType({key: MappingProxyType(data) for key, data in tracks.items()})
+        self.index = {key: i for i, key in enumerate(tracks)}
+        self.weather_index = {weather: i for i, weather in enumerate(self.WEATHERS)}
+        self.compound_index = {compound: i for i, compound in enumerate(self.COMPOUNDS)}
+        
+        shape = (len(tracks), len(self.WEATHERS), len(self.COMPOUNDS))
+        self.tyre_wear_table = np.empty(shape)
+        self.incident_table = np.empty(shape)
+        # calculate_dps weather factor is the constant part plus rain_skill times its weight
+        self.grip_table = np.empty(shape)
+        self.rain_skill_table = np.zeros(shape)
+        
+        for t, data in enumerate(tracks.values()):
+            for w, weather in enumerate(self.WEATHERS):
+                raining = "rain" in weather
+                for c, compound in enumerate(self.COMPOUNDS):
+                    wet_tyres = compound in ("inter", "wet")
+                    dry_in_rain = self.DRY_TYRES_IN_RAIN if raining and not wet_tyres else 1.0
+                    
+                    self.tyre_wear_table[t, w, c] = data["tyre_wear"] * self.COMPOUND_WEAR[compound] * dry_in_rain
+                    self.incident_table[t, w, c] = (
+                        self.RAIN_MULTIPLIER.get(weather, 1.0) * dry_in_rain *
+                        (self.STREET_INCIDENTS if data["street_circuit"] else 1.0)
+                    )
+                    
+                    if raining and wet_tyres:
+                        self.grip_table[t, w, c] = 0.0
+                        self.rain_skill_table[t, w, c] = 1.2
+                    elif raining:
+                        self.grip_table[t, w, c] = 15.0
+                    elif wet_tyres and weather == "clear":
+                        self.grip_table[t, w, c] = 20.0
+                    else:
+                        self.grip_table[t, w, c] = 50.0
+        
+        # Per (track, weather) compound dicts for the scalar lap loop
+        self.tyre_wear = self.compound_dicts(self.tyre_wear_table)
+        self.incidents = self.compound_dicts(self.incident_table)
+        self.grip = [
+            [dict(zip(self.COMPOUNDS, zip(grip_row, rain_row))) for grip_row, rain_row in zip(grip, rain)]
+            for grip, rain in zip(self.grip_table.tolist(), self.rain_skill_table.tolist())
+        ]
+    
+    def __contains__(self, track: str) -> bool:
+        return track in self.tracks
+    
+    def __getitem__(self, track: str):
+        return self.tracks[track]
+    
+    def compound_dicts(self, table: np.ndarray) -> List[List[Dict[str, float]]]:
+        return [[dict(zip(self.COMPOUNDS, row)) for row in by_weather] for by_weather in table.tolist()]
+    
+    @classmethod
+    def coerce_number(cls, field: str, value) -> Optional[float]:
+        """The field's value as its numeric type, or None if it is not a number in range"""
+        kind, minimum, maximum = cls.NUMERIC_FIELDS[field]
+        if isinstance(value, bool):
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        if not np.isfinite(number) or not minimum <= number <= maximum:
+            return None
+        if kind is int:
+            return int(number) if number.is_integer() else None
+        if isinstance(value, str):
+            return int(number) if number.is_integer() else number
+        return value
+    
+    @classmethod
+    def validate(cls, key: str, data: Dict) -> Optional[Dict]:
+        """Track entry with defaults filled in and numbers coerced, or None if it cannot be raced"""
+        if not isinstance(data, dict):
+            print(f"❌ Track {key} is not an object")
+            return None
+        missing = [field for field in cls.REQUIRED_FIELDS if field not in data]
+        if missing:
+            print(f"❌ Track {key} is missing {', '.join(missing)}")
+            return None
+        
+        track = {**cls.OPTIONAL_FIELDS, **data}
+        for field, (kind, minimum, maximum) in cls.NUMERIC_FIELDS.items():
+            number = cls.coerce_number(field, track[field])
+            if number is None:
+                print(f"❌ Track {key} has {field} {track[field]!r}, expected a number from {minimum} to {maximum}")
+                return None
+            track[field] = number
+        
+        if isinstance(track["street_circuit"], str):
+            track["street_circuit"] = track["street_circuit"].strip().lower() in ("true", "yes", "1")
+        track["street_circuit"] = bool(track["street_circuit"])
+        track["name"] = str(track["name"])
+        track["country"] = str(track["country"])
+        
+        try:
+            sectors = [float(length) for length in track["sector_lengths"]]
+        except (TypeError, ValueError):
+            sectors = []
+        if len(sectors) != 3 or not all(np.isfinite(sectors)) or min(sectors) <= 0:
+            print(f"❌ Track {key} needs three positive sector lengths")
+            return None
+        if abs(sum(sectors) - 1) > 1e-6:
+            sectors = [length / sum(sectors) for length in sectors]
+        track["sector_lengths"] = tuple(sectors)
+        if isinstance(track["key_corners"], str) or not isinstance(track["key_corners"], (list, tuple)):
+            track["key_corners"] = [track["key_corners"]]
+        track["key_corners"] = tuple(str(corner) for corner in track["key_corners"])
+        return track
+    
+    @classmethod
+    def load(cls, path: str, custom_path: Optional[str] = None) -> 'TrackRegistry':
+        """Built-in tracks from path, extended with the custom tracks file if it exists"""
+        with open(path, encoding="utf-8") as f:
+            tracks = {key: cls.validate(key, data) for key, data in json.load(f).items()}
+        
+        if custom_path and os.path.exists(custom_path):
+            try:
+                with open(custom_path, encoding="utf-8") as f:
+                    custom = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"❌ Error loading custom tracks: {e}")
+                custom = {}
+            if not isinstance(custom, dict):
+                print("❌ Custom tracks file must map track names to track objects")
+                custom = {}
+            for key, data in custom.items():
+                if key in tracks:
+                    print(f"❌ Custom track {key} clashes with a built-in track")
+                    continue
+                tracks[key] = cls.validate(key, data)
+        
+        return cls({key: data for key, data in tracks.items() if data is not None})
+
+TRACK_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACKS = TrackRegistry.load(
+    os.getenv('TRACKS_FILE', os.path.join(TRACK_DIR, "tracks.json")),
+    os.getenv('CUSTOM_TRACKS_FILE', os.path.join(TRACK_DIR, "custom_tracks.json"))
+)
 
 # ============================================================================
 # RACE ENGINE - ULTRA REALISTIC
 # ============================================================================
 
+class CarPerformance:
+    """Fixed-layout record of the car stats the race engine reads"""
+    DEFAULTS = {
+        "engine_power": 50, "aero": 50, "handling": 50, "ers_power": 50,
+        "brake_power": 50, "drs_efficiency": 1.0, "tyre_wear_rate": 1.0,
+        "fuel_efficiency": 1.0, "battery_capacity": 50, "cooling_efficiency": 50,
+        "reliability": 100,
+    }
+    __slots__ = tuple(DEFAULTS)
+    
+    def __init__(self, stats: Optional[Dict] = None):
+        stats = stats or {}
+        for field, default in self.DEFAULTS.items():
+            setattr(self, field, stats.get(field, default))
+    
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+    
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
+
 class Driver:
+    __slots__ = (
+        "id", "name", "skill", "aggression", "consistency", "is_ai",
+        "rain_skill", "overtaking_skill", "defending_skill", "quali_skill",
+        "tire_management", "fuel_management", "race_craft", "car",
+        "position", "grid_position", "lap", "total_time", "gap_to_leader", "gap_to_front",
+        "lap_time", "best_lap", "theoretical_best",
+        "tyre_compound", "tyre_condition", "tyre_age", "tyre_temp",
+        "pit_stops", "pit_window_open", "pit_strategy",
+        "fuel_load", "fuel_mix", "fuel_per_lap",
+        "ers_charge", "ers_mode", "ers_deployed_lap", "battery_temp",
+        "engine_mode", "engine_temp", "engine_wear_lap", "brake_temp", "brake_wear",
+        "drs_available", "drs_uses", "slipstream_active",
+        "push_mode", "defending", "attacking", "in_battle", "battle_partner",
+        "dnf", "dnf_reason", "damage", "damage_locations", "penalties", "penalty_time", "warnings",
+        "overtakes_made", "overtakes_lost", "positions_gained", "laps_led", "battles_won", "battles_lost",
+        "mistakes_count", "perfect_corners", "lock_ups", "spins",
+        "sector_times", "sector_bests", "focus", "fatigue", "confidence",
+        "radio_messages", "team_orders", "dm_channel_id", "last_dm_update",
+        "dps_constant", "quali_pace", "stint", "stint_start",
+    )
+    # Everything a lap can change; race workers send these instead of a full snapshot
+    LAP_STATE = tuple(
+        field for field in __slots__[__slots__.index("position"):]
+        if field not in ("grid_position", "dm_channel_id", "last_dm_update", "quali_pace")
+    )
+    
     def __init__(self, driver_id, name, skill, aggression, consistency, is_ai=False, car_stats=None, advanced_stats=None):
         self.id = driver_id
         self.name = name
@@ -721,12 +1696,7 @@ class Driver:
             self.fuel_management = 50
             self.race_craft = 50
         
-        self.car_stats = car_stats or {
-            'engine_power': 50, 'aero': 50, 'handling': 50,
-            'reliability': 100, 'tyre_wear_rate': 1.0,
-            'fuel_efficiency': 1.0, 'ers_power': 50, 'drs_efficiency': 1.0,
-            'brake_power': 50, 'cooling_efficiency': 50
-        }
+        self.car = CarPerformance(car_stats)
         
         self.position = 0
         self.grid_position = 0
@@ -799,14 +1769,177 @@ class Driver:
         self.fatigue = 0.0
         self.confidence = 50.0
         
-        self.radio_messages = []
+        self.radio_messages = deque(maxlen=5)
         self.team_orders = None
         
         self.dm_channel_id = None
         self.last_dm_update = 0
+        
+        # Race constants filled in by RaceEngine.compile_race
+        self.dps_constant = 0.0
+        self.quali_pace = 0.0
+        
+        # Endurance stints
+        self.stint = 1
+        self.stint_start = 0
+    
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+    
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
+    
+    def copy_state(self, other: 'Driver'):
+        """Overwrite this driver's state with another driver's"""
+        self.__setstate__(other.__getstate__())
+
+class LapResult:
+    """Plain-value outcome of one simulated lap, so a finished race can be played back lap by lap"""
+    LEADERBOARD_ROWS = 20
+    
+    def __init__(self, race: 'RaceEngine'):
+        self.lap = race.current_lap
+        self.first_lap = race.current_lap
+        self.total_laps = race.total_laps
+        self.events = list(race.lap_events)
+        self.order = [d.id for d in race.running_order]
+        self.leaderboard = [
+            (d.position, d.name, d.is_ai, d.tyre_compound, d.gap_to_leader, d.drs_available, d.in_battle)
+            for d in race.running_order[:self.LEADERBOARD_ROWS]
+        ]
+        self.retired = [(d.name, d.dnf_reason) for d in race.drivers if d.dnf]
+        fastest = min(race.running_order, key=attrgetter("best_lap"), default=None)
+        self.fastest = (fastest.name, fastest.best_lap) if fastest else None
+        self.weather = race.weather
+        self.safety_car = race.safety_car
+        self.virtual_safety_car = race.virtual_safety_car
+        self.drs_enabled = race.drs_enabled
+        self.finished = race.race_finished
+    
+    @staticmethod
+    def combine(results: List['LapResult'], max_events: int) -> 'LapResult':
+        """Fold consecutive laps into the last one, keeping the most recent events"""
+        combined = results[-1]
+        combined.first_lap = results[0].first_lap
+        combined.events = [event for result in results for event in result.events][-max_events:]
+        return combined
 
 class RaceEngine:
-    def __init__(self, track="Monza", laps=15, weather="clear", qualifying=True, race_mode="normal"):
+    PLAYER_PIT_LABELS = {"soft": "Soft", "medium": "Medium", "hard": "Hard", "inter": "Inters", "wet": "Wets"}
+    SNAPSHOT_EXCLUDE = ("events", "race_control_channel", "dm_messages", "lap_kernel", "on_input", "qualifying_session")
+    # Race fields a lap can change, sent by race workers alongside Driver.LAP_STATE
+    LAP_STATE = (
+        "current_lap", "weather", "raining", "weather_forecast", "forecast_offset",
+        "track_temp", "track_grip", "track_evolution", "rubbered_in", "compiled_key",
+        "safety_car", "virtual_safety_car", "safety_car_laps", "vsc_laps", "drs_enabled",
+        "race_finished", "grid_version", "order_version", "lap_events",
+    )
+    EVENT_HISTORY = 500
+    INCIDENT_HISTORY = 100
+    
+    # Endurance races render once per block of laps and roll the weather forecast forward
+    ENDURANCE_MAX_LAPS = 400
+    ENDURANCE_LAPS_PER_UPDATE = 10
+    ENDURANCE_STINT_LAPS = 40
+    ENDURANCE_CHECKPOINT_LAPS = 10
+    # Per-lap wear and incident odds are tuned for grand prix distances. Endurance cars run at a fixed fraction
+    # of them, so attrition grows with distance: about 5% of the grid retires in 60 laps and 40% in 400
+    ENDURANCE_HAZARD_SCALE = 0.06
+    FORECAST_WINDOW = 20
+    DRIVER_CHANGE_TIME = 3.0
+    
+    WEATHER_TRANSITIONS = {
+        "clear": {"clear": 0.7, "partly_cloudy": 0.25, "cloudy": 0.05},
+        "partly_cloudy": {"clear": 0.2, "partly_cloudy": 0.5, "cloudy": 0.25, "light_rain": 0.05},
+        "cloudy": {"partly_cloudy": 0.15, "cloudy": 0.5, "light_rain": 0.3, "rain": 0.05},
+        "light_rain": {"cloudy": 0.2, "light_rain": 0.4, "rain": 0.35, "heavy_rain": 0.05},
+        "rain": {"light_rain": 0.25, "rain": 0.5, "heavy_rain": 0.2, "cloudy": 0.05},
+        "heavy_rain": {"rain": 0.6, "heavy_rain": 0.35, "light_rain": 0.05}
+    }
+    WEATHER_STEPS = {
+        current: (list(transitions), list(accumulate(transitions.values())))
+        for current, transitions in WEATHER_TRANSITIONS.items()
+    }
+    
+    WEATHER_TEMPS = {
+        "clear": (28, 35),
+        "partly_cloudy": (24, 30),
+        "cloudy": (20, 26),
+        "light_rain": (18, 24),
+        "rain": (16, 22),
+        "heavy_rain": (14, 20)
+    }
+    
+    WEATHER_GRIP = {
+        "clear": 100,
+        "partly_cloudy": 98,
+        "cloudy": 95,
+        "light_rain": 65,
+        "rain": 50,
+        "heavy_rain": 35
+    }
+    
+    # Event records are (code, lap, driver_id, other_id, value) and only formatted by render_event
+    EVENT_FORMATS = {
+        "pole": "🏁 **POLE POSITION:** {a} - {v:.3f}s",
+        "p2": "🥈 **P2:** {a} - +{v:.3f}s",
+        "p3": "🥉 **P3:** {a} - +{v:.3f}s",
+        "weather": "🌦️ **WEATHER CHANGE:** {v[0]} → {v[1]} {v[2]}",
+        "track_wet": "⚠️ **TRACK IS GETTING WET** - Drivers may pit for inters/wets",
+        "drs_enabled": "💨 **DRS ENABLED**",
+        "rubbered_in": "🏁 Track is now fully rubbered in - Grip improved",
+        "fastest_lap": "⏱️ **FASTEST LAP:** {a} - {v[0]:.3f}s (Avg: {v[1]:.3f}s/sector)",
+        "penalty_served": "⏱️ {a} serves 5s time penalty",
+        "out_of_fuel": "⛽ **{a} - OUT OF FUEL!**",
+        "engine_overheat": "🔥 **{a} - ENGINE FAILURE!** (Overheating)",
+        "overtake": "🎯 **OVERTAKE!** {a} passes {b} for P{v} (Clean move)",
+        "battle_won": "⚔️ **BATTLE!** {a} edges past {b} for P{v}",
+        "battle_held": "⚔️ **WHEEL TO WHEEL!** {a} vs {b} - {b} holds position",
+        "dive_bomb": "💥 **AGGRESSIVE!** {a} dive-bombs {b} for P{v}",
+        "warning": "⚠️ {a} - Warning for aggressive driving",
+        "dive_failed": "💥 **DIVE FAILED!** {a} locks up - Minor damage",
+        "contact": "💥 **CONTACT!** {a} and {b} collide! Damage: {a} ({v[0]:.0f}%) {b} ({v[1]:.0f}%)",
+        "collision_penalty": "⚠️ {a} - {v} time penalty for causing collision",
+        "move_failed": "🔄 {a} attempts a move on {b} but can't make it stick",
+        "lock_up": "⚠️ {a} - Lock-up! Minor damage ({v:.0f}%)",
+        "spin": "🌪️ {a} - SPIN! Lost ~{v[0]} positions ({v[1]:.0f}% damage)",
+        "big_moment": "🚨 {a} - BIG MOMENT! Heavy damage ({v:.0f}%)",
+        "huge_crash": "💥 {a} - **HUGE CRASH!**",
+        "dnf_accident": "❌ {a} - **DNF** (Accident)",
+        "failure": "💥 {a} - **{v} FAILURE!**",
+        "vsc": "🟡 **VIRTUAL SAFETY CAR**",
+        "safety_car": "🚨 **SAFETY CAR DEPLOYED**",
+        "safety_car_in": "🏁 **SAFETY CAR IN THIS LAP**",
+        "green_flag": "🟢 **RACING RESUMES!**",
+        "vsc_ending": "🟢 **VSC ENDING - Green flag!**",
+        "pit": "🔧 **PIT:** {a} - {v[0]:.2f}s ({v[1]}) | {v[2]} | {v[3]}",
+        "repairs": "   🔨 Repairs: {v:.0f}% damage fixed",
+        "driver_change": "👥 {a} - Driver change, stint {v} begins",
+    }
+    
+    WEATHER_EMOJI = {
+        "clear": "☀️", "partly_cloudy": "⛅", "cloudy": "☁️",
+        "light_rain": "🌦️", "rain": "🌧️", "heavy_rain": "⛈️"
+    }
+    WEATHER_LABELS = {
+        "clear": "Clear", "partly_cloudy": "Partly Cloudy", "cloudy": "Cloudy",
+        "light_rain": "Light Rain", "rain": "Rain", "heavy_rain": "Heavy Rain"
+    }
+    COMPOUND_LABELS = {
+        "soft": "🔴 SOFT", "medium": "🟡 MEDIUM", "hard": "⚪ HARD",
+        "inter": "🟢 INTER", "wet": "🔵 WET"
+    }
+    COMPOUND_EMOJI = {"soft": "🔴", "medium": "🟡", "hard": "⚪", "inter": "🟢", "wet": "🔵"}
+    
+    def __init__(self, track="Monza", laps=15, weather="clear", qualifying=True, race_mode="normal", kernel="scalar",
+                 seed: Optional[int] = None, forecast_ensemble: Optional[List[List[str]]] = None):
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.inputs = []
+        self.start_state: Optional[bytes] = None
+        self.on_input = None
+        
         self.track = track
         self.total_laps = laps
         self.current_lap = 0
@@ -830,14 +1963,27 @@ class RaceEngine:
         
         self.qualifying_mode = qualifying
         self.race_mode = race_mode
+        self.endurance = race_mode == "endurance"
+        self.laps_per_update = self.ENDURANCE_LAPS_PER_UPDATE if self.endurance else 1
+        self.checkpoint_interval = self.ENDURANCE_CHECKPOINT_LAPS if self.endurance else 1
+        self.stint_length = self.ENDURANCE_STINT_LAPS
+        self.hazard_scale = self.ENDURANCE_HAZARD_SCALE if self.endurance else 1.0
         self.race_started = False
         self.race_finished = False
         
         self.drivers: List[Driver] = []
-        self.events = []
+        self.driver_names: Dict[int, str] = {}
+        # Player cars driven by the AI strategy, used by strategy rollouts
+        self.autopilot = set()
+        self.events = deque(maxlen=self.EVENT_HISTORY)
+        self.running_order: List[Driver] = []
+        self.grid_version = 0
+        self.order_version = 0
+        self.qualifying_session = None
+        self.dps_cache: Dict[int, float] = {}
         self.lap_events = []
         self.sector_events = []
-        self.incidents = []
+        self.incidents = deque(maxlen=self.INCIDENT_HISTORY)
         
         self.marshals_active = False
         self.debris_on_track = False
@@ -845,269 +1991,160 @@ class RaceEngine:
         self.pit_lane_open = True
         self.pit_lane_speed_limit = 80
         
-        self.track_data = {
-            "Monza": {
-                "name": "Autodromo Nazionale di Monza",
-                "country": "🇮🇹 Italy",
-                "length": 5.793,
-                "corners": 11,
-                "base_lap_time": 80.0,
-                "overtake_difficulty": 30,
-                "tyre_wear": 1.0,
-                "fuel_usage": 1.1,
-                "characteristic": "High Speed Temple",
-                "drs_zones": 2,
-                "elevation_change": 15,
-                "avg_speed": 264,
-                "sector_lengths": [0.30, 0.35, 0.35],
-                "key_corners": ["Variante del Rettifilo", "Curva di Lesmo", "Parabolica"]
-            },
-            "Monaco": {
-                "name": "Circuit de Monaco",
-                "country": "🇲🇨 Monaco",
-                "length": 3.337,
-                "corners": 19,
-                "base_lap_time": 72.0,
-                "overtake_difficulty": 90,
-                "tyre_wear": 0.7,
-                "fuel_usage": 0.85,
-                "characteristic": "Street Circuit Jewel",
-                "drs_zones": 1,
-                "elevation_change": 42,
-                "avg_speed": 160,
-                "sector_lengths": [0.33, 0.33, 0.34],
-                "key_corners": ["Sainte Devote", "Swimming Pool", "Rascasse"]
-            },
-            "Spa": {
-                "name": "Circuit de Spa-Francorchamps",
-                "country": "🇧🇪 Belgium",
-                "length": 7.004,
-                "corners": 19,
-                "base_lap_time": 105.0,
-                "overtake_difficulty": 40,
-                "tyre_wear": 1.2,
-                "fuel_usage": 1.15,
-                "characteristic": "Ardennes Roller Coaster",
-                "drs_zones": 2,
-                "elevation_change": 104,
-                "avg_speed": 237,
-                "sector_lengths": [0.35, 0.30, 0.35],
-                "key_corners": ["Eau Rouge", "Pouhon", "Blanchimont"]
-            },
-            "Silverstone": {
-                "name": "Silverstone Circuit",
-                "country": "🇬🇧 Great Britain",
-                "length": 5.891,
-                "corners": 18,
-                "base_lap_time": 88.0,
-                "overtake_difficulty": 50,
-                "tyre_wear": 1.1,
-                "fuel_usage": 1.05,
-                "characteristic": "High Speed Challenge",
-                "drs_zones": 2,
-                "elevation_change": 18,
-                "avg_speed": 241,
-                "sector_lengths": [0.32, 0.36, 0.32],
-                "key_corners": ["Maggotts-Becketts", "Copse", "Stowe"]
-            },
-            "Suzuka": {
-                "name": "Suzuka International Racing Course",
-                "country": "🇯🇵 Japan",
-                "length": 5.807,
-                "corners": 18,
-                "base_lap_time": 90.0,
-                "overtake_difficulty": 60,
-                "tyre_wear": 1.15,
-                "fuel_usage": 1.08,
-                "characteristic": "Technical Figure-8",
-                "drs_zones": 1,
-                "elevation_change": 45,
-                "avg_speed": 232,
-                "sector_lengths": [0.34, 0.33, 0.33],
-                "key_corners": ["130R", "Spoon Curve", "Degner"]
-            },
-            "Singapore": {
-                "name": "Marina Bay Street Circuit",
-                "country": "🇸🇬 Singapore",
-                "length": 4.940,
-                "corners": 23,
-                "base_lap_time": 95.0,
-                "overtake_difficulty": 70,
-                "tyre_wear": 0.9,
-                "fuel_usage": 0.95,
-                "characteristic": "Night Street Challenge",
-                "drs_zones": 3,
-                "elevation_change": 23,
-                "avg_speed": 187,
-                "sector_lengths": [0.33, 0.34, 0.33],
-                "key_corners": ["Turn 1", "Singapore Sling", "Anderson Bridge"]
-            },
-            "Interlagos": {
-                "name": "Autódromo José Carlos Pace",
-                "country": "🇧🇷 Brazil",
-                "length": 4.309,
-                "corners": 15,
-                "base_lap_time": 70.0,
-                "overtake_difficulty": 45,
-                "tyre_wear": 1.05,
-                "fuel_usage": 1.0,
-                "characteristic": "Anti-Clockwise Classic",
-                "drs_zones": 2,
-                "elevation_change": 45,
-                "avg_speed": 222,
-                "sector_lengths": [0.30, 0.40, 0.30],
-                "key_corners": ["Senna S", "Descida do Lago", "Juncao"]
-            },
-            "Austin": {
-                "name": "Circuit of the Americas",
-                "country": "🇺🇸 USA",
-                "length": 5.513,
-                "corners": 20,
-                "base_lap_time": 92.0,
-                "overtake_difficulty": 48,
-                "tyre_wear": 1.08,
-                "fuel_usage": 1.06,
-                "characteristic": "Modern American Classic",
-                "drs_zones": 2,
-                "elevation_change": 41,
-                "avg_speed": 215,
-                "sector_lengths": [0.35, 0.32, 0.33],
-                "key_corners": ["Turn 1", "Esses", "Turn 19"]
-            },
-        }
-        
-        if track not in self.track_data:
+        if track not in TRACKS:
             self.track = "Monza"
+        self.track_index = TRACKS.index[self.track]
         
-        self.weather_forecast = [weather] * (laps + 1)
-        self.generate_weather_forecast()
+        self.weather_forecast = [weather] * ((self.FORECAST_WINDOW if self.endurance else laps) + 1)
+        self.forecast_offset = 0
+        if forecast_ensemble:
+            self.apply_forecast(forecast_ensemble[self.rng.randrange(len(forecast_ensemble))])
+        else:
+            self.generate_weather_forecast()
         
         self.race_control_channel = None
         self.dm_messages = {}
+        
+        self.kernel = kernel
+        self.lap_kernel = self.build_lap_kernel()
+        
+        track_info = self.track_data[self.track]
+        self.base_lap_time = track_info["base_lap_time"]
+        self.sector_lengths = track_info["sector_lengths"]
+        self.track_fuel_usage = track_info["fuel_usage"]
+        self.overtake_base_chance = 100 - track_info["overtake_difficulty"]
+        self.drs_gap_threshold = track_info["drs_gap_threshold"]
+        self.street_circuit = track_info["street_circuit"]
+        self.raining = "rain" in self.weather
+        self.compiled_key = None
     
     def generate_weather_forecast(self):
-        weather_states = ["clear", "partly_cloudy", "cloudy", "light_rain", "rain", "heavy_rain"]
-        weather_transitions = {
-            "clear": {"clear": 0.7, "partly_cloudy": 0.25, "cloudy": 0.05},
-            "partly_cloudy": {"clear": 0.2, "partly_cloudy": 0.5, "cloudy": 0.25, "light_rain": 0.05},
-            "cloudy": {"partly_cloudy": 0.15, "cloudy": 0.5, "light_rain": 0.3, "rain": 0.05},
-            "light_rain": {"cloudy": 0.2, "light_rain": 0.4, "rain": 0.35, "heavy_rain": 0.05},
-            "rain": {"light_rain": 0.25, "rain": 0.5, "heavy_rain": 0.2, "cloudy": 0.05},
-            "heavy_rain": {"rain": 0.6, "heavy_rain": 0.35, "light_rain": 0.05}
-        }
-        
         for i in range(1, len(self.weather_forecast)):
-            current = self.weather_forecast[i-1]
-            if current in weather_transitions:
-                choices = list(weather_transitions[current].keys())
-                weights = list(weather_transitions[current].values())
-                self.weather_forecast[i] = random.choices(choices, weights=weights)[0]
+            self.weather_forecast[i] = self.next_weather(self.weather_forecast[i-1])
         
         self.update_weather_conditions()
     
-    def update_weather_conditions(self):
-        weather_temps = {
-            "clear": (28, 35),
-            "partly_cloudy": (24, 30),
-            "cloudy": (20, 26),
-            "light_rain": (18, 24),
-            "rain": (16, 22),
-            "heavy_rain": (14, 20)
-        }
-        
-        weather_grip = {
-            "clear": 100,
-            "partly_cloudy": 98,
-            "cloudy": 95,
-            "light_rain": 65,
-            "rain": 50,
-            "heavy_rain": 35
-        }
+    def set_distance(self, laps: int):
+        """Shorten a race built for a longer distance before it starts"""
+        self.total_laps = laps
+        if not self.endurance:
+            del self.weather_forecast[laps + 1:]
+    
+    def apply_forecast(self, member: List[str]):
+        """Race one member of a precomputed ensemble, extending it by sampling if it is short"""
+        length = len(self.weather_forecast)
+        self.weather_forecast = list(member[:length])
+        while len(self.weather_forecast) < length:
+            self.weather_forecast.append(self.next_weather(self.weather_forecast[-1]))
         
-        if self.weather in weather_temps:
-            self.track_temp = random.uniform(*weather_temps[self.weather])
-            self.track_grip = weather_grip[self.weather] + self.track_evolution
+        self.update_weather_conditions()
     
-    def add_driver(self, driver: Driver):
-        self.drivers.append(driver)
-        driver.position = len(self.drivers)
-        driver.grid_position = len(self.drivers)
+    def next_weather(self, current: str) -> str:
+        if current not in self.WEATHER_STEPS:
+            return current
+        states, cum_weights = self.WEATHER_STEPS[current]
+        return self.rng.choices(states, cum_weights=cum_weights)[0]
+    
+    def roll_weather_forecast(self):
+        """Drop laps already raced and extend the forecast window one lap at a time"""
+        consumed = self.current_lap - self.forecast_offset
+        if consumed > 0:
+            del self.weather_forecast[:consumed]
+            self.forecast_offset = self.current_lap
+        while len(self.weather_forecast) <= self.FORECAST_WINDOW:
+            self.weather_forecast.append(self.next_weather(self.weather_forecast[-1]))
+    
+    @property
+    def track_data(self):
+        return TRACKS.tracks
     
-    def run_qualifying(self):
-        results = []
-        
+    def update_weather_conditions(self):
+        if self.weather in self.WEATHER_TEMPS:
+            self.track_temp = self.rng.uniform(*self.WEATHER_TEMPS[self.weather])
+            self.track_grip = self.WEATHER_GRIP[self.weather] + self.track_evolution
+        self.lookup_weather_factors()
+    
+    def lookup_weather_factors(self):
+        # Compound coefficients for this track and weather, looked up once per weather change
+        weather_index = TRACKS.weather_index.get(self.weather, 0)
+        self.tyre_wear_factors = TRACKS.tyre_wear[self.track_index][weather_index]
+        self.incident_factors = TRACKS.incidents[self.track_index][weather_index]
+        self.grip_factors = TRACKS.grip[self.track_index][weather_index]
+    
+    def compile_race(self):
+        """Precompute the per-driver constants of calculate_dps and run_qualifying"""
         for driver in self.drivers:
-            if driver.dnf:
-                continue
+            base_skill = driver.skill
+            if self.raining:
+                base_skill = (base_skill * 0.4 + driver.rain_skill * 0.6)
+            
+            driver_factor = (
+                base_skill * 0.35 +
+                driver.race_craft * 0.15 +
+                driver.tire_management * 0.10 +
+                driver.fuel_management * 0.05
+            ) * 0.30
             
-            base_time = self.track_data[self.track]["base_lap_time"]
+            car_perf = (
+                driver.car.engine_power * 0.30 +
+                driver.car.aero * 0.25 +
+                driver.car.handling * 0.20 +
+                driver.car.ers_power * 0.15 +
+                driver.car.brake_power * 0.10
+            )
+            driver.dps_constant = driver_factor + car_perf * 0.35
             
             skill_factor = (driver.skill * 0.4 + driver.quali_skill * 0.6) / 100
             car_factor = (
-                driver.car_stats['engine_power'] * 0.35 +
-                driver.car_stats['aero'] * 0.30 +
-                driver.car_stats['handling'] * 0.25 +
-                driver.car_stats['ers_power'] * 0.10
+                driver.car.engine_power * 0.35 +
+                driver.car.aero * 0.30 +
+                driver.car.handling * 0.25 +
+                driver.car.ers_power * 0.10
             ) / 100
-            
-            quali_time = base_time * (1 - skill_factor * 0.18 - car_factor * 0.12)
-            
-            consistency_var = (100 - driver.consistency) / 150
-            quali_time += random.uniform(-consistency_var, consistency_var)
-            
-            tire_factor = random.uniform(-0.15, 0.05)
-            quali_time += tire_factor
-            
-            track_evolution = len(results) * 0.002
-            quali_time -= track_evolution
-            
-            quali_time += random.uniform(-0.3, 0.3)
-            
-            results.append((driver, quali_time))
+            driver.quali_pace = self.base_lap_time * (1 - skill_factor * 0.18 - car_factor * 0.12)
         
-        results.sort(key=lambda x: x[1])
+        self.compiled_key = (len(self.drivers), self.raining)
+    
+    def ensure_compiled(self):
+        if self.compiled_key != (len(self.drivers), self.raining):
+            self.compile_race()
+    
+    def add_driver(self, driver: Driver):
+        self.drivers.append(driver)
+        self.driver_names[driver.id] = driver.name
+        self.running_order.append(driver)
+        self.grid_version += 1
+        driver.position = len(self.drivers)
+        driver.grid_position = len(self.drivers)
+    
+    def precompute_qualifying(self) -> 'QualifyingSession':
+        """Simulate the whole knockout session now; run_qualifying then only sets the grid"""
+        self.ensure_compiled()
+        if self.qualifying_session is None or self.qualifying_session.key != (self.grid_version, self.compiled_key):
+            self.qualifying_session = QualifyingSession(self)
+            self.qualifying_session.simulate()
+        return self.qualifying_session
+    
+    def run_qualifying(self):
+        results = self.precompute_qualifying().classification
+        self.running_order = [driver for driver, _ in results]
         
         for idx, (driver, time) in enumerate(results):
             driver.grid_position = idx + 1
             driver.position = idx + 1
             
             if idx == 0:
-                self.events.append(f"🏁 **POLE POSITION:** {driver.name} - {time:.3f}s")
+                self.events.append(("pole", 0, driver.id, None, time))
             elif idx == 1:
                 gap = time - results[0][1]
-                self.events.append(f"🥈 **P2:** {driver.name} - +{gap:.3f}s")
+                self.events.append(("p2", 0, driver.id, None, gap))
             elif idx == 2:
                 gap = time - results[0][1]
-                self.events.append(f"🥉 **P3:** {driver.name} - +{gap:.3f}s")
+                self.events.append(("p3", 0, driver.id, None, gap))
         
         return results
     
     def calculate_dps(self, driver: Driver) -> float:
-        base_skill = driver.skill
-        
-        if "rain" in self.weather:
-            weather_skill = driver.rain_skill
-            base_skill = (base_skill * 0.4 + weather_skill * 0.6)
-        
-        tire_skill = driver.tire_management
-        fuel_skill = driver.fuel_management
-        
-        driver_factor = (
-            base_skill * 0.35 +
-            driver.race_craft * 0.15 +
-            tire_skill * 0.10 +
-            fuel_skill * 0.05
-        ) * 0.30
-        
-        car_perf = (
-            driver.car_stats['engine_power'] * 0.30 +
-            driver.car_stats['aero'] * 0.25 +
-            driver.car_stats['handling'] * 0.20 +
-            driver.car_stats['ers_power'] * 0.15 +
-            driver.car_stats['brake_power'] * 0.10
-        )
-        car_factor = car_perf * 0.35
-        
         tire_temp_optimal = abs(driver.tyre_temp - 90) < 10
         tire_factor = (
             driver.tyre_condition * 0.7 +
@@ -1116,15 +2153,8 @@ class RaceEngine:
         
         grip_factor = self.track_grip * 0.08
         
-        weather_factor = 50.0
-        if "rain" in self.weather:
-            if driver.tyre_compound in ["inter", "wet"]:
-                weather_factor = driver.rain_skill * 1.2
-            else:
-                weather_factor = 15.0
-        elif driver.tyre_compound in ["inter", "wet"] and self.weather == "clear":
-            weather_factor = 20.0
-        weather_factor *= 0.07
+        grip, rain_weight = self.grip_factors[driver.tyre_compound]
+        weather_factor = (grip + driver.rain_skill * rain_weight) * 0.07
         
         strategy_bonus = (
             driver.push_mode * 0.5 +
@@ -1140,157 +2170,355 @@ class RaceEngine:
         confidence_bonus = (driver.confidence / 100) * 3
         
         dps = (
-            driver_factor + car_factor + tire_factor + grip_factor +
+            driver.dps_constant + tire_factor + grip_factor +
             weather_factor + strategy_bonus + focus_bonus + confidence_bonus -
             damage_penalty - total_damage - fatigue_penalty
         )
         
         variation_range = driver.consistency / 8
-        variation = random.uniform(-variation_range, variation_range)
+        variation = self.rng.uniform(-variation_range, variation_range)
         
         if driver.ers_mode == "deploy" and driver.ers_charge > 10:
-            dps += random.uniform(4, 7)
+            dps += self.rng.uniform(4, 7)
             driver.battery_temp += 2
         
-        if driver.drs_available and not "rain" in self.weather:
-            dps += random.uniform(2.5, 4.5) * driver.car_stats['drs_efficiency']
+        if driver.drs_available and not self.raining:
+            dps += self.rng.uniform(2.5, 4.5) * driver.car.drs_efficiency
         
         if driver.slipstream_active:
-            dps += random.uniform(1.5, 3.0)
+            dps += self.rng.uniform(1.5, 3.0)
         
         if driver.in_battle:
             battle_skill = (driver.overtaking_skill if driver.attacking else driver.defending_skill) / 100
-            dps += battle_skill * random.uniform(-2, 3)
+            dps += battle_skill * self.rng.uniform(-2, 3)
         
         if driver.engine_temp > 105:
-            dps -= random.uniform(2, 5)
+            dps -= self.rng.uniform(2, 5)
         
         return max(0, dps + variation)
     
-    async def simulate_lap(self, bot):
+    def lap_dps(self, driver: Driver) -> float:
+        """DPS for the current lap, calculated at most once per driver"""
+        dps = self.dps_cache.get(driver.id)
+        if dps is None:
+            dps = self.dps_cache[driver.id] = self.calculate_dps(driver)
+        return dps
+    
+    def build_lap_kernel(self):
+        kernel_class = LAP_KERNELS.get(self.kernel)
+        return kernel_class(self) if kernel_class else None
+    
+    def uses_lap_kernel(self) -> bool:
+        """Grids smaller than the kernel's minimum take the scalar path"""
+        return self.lap_kernel is not None and len(self.drivers) >= self.lap_kernel.min_grid
+    
+    def step(self) -> LapResult:
+        """Simulate the next lap without touching Discord"""
+        self.begin_lap()
+        
+        if self.uses_lap_kernel():
+            self.lap_kernel.run_lap()
+        else:
+            self.simulate_drivers_scalar()
+        
+        return self.finish_lap()
+    
+    @staticmethod
+    def step_batch(races: List['RaceEngine']) -> List[LapResult]:
+        """Advance several races one lap, sharing a single vector kernel pass"""
+        for race in races:
+            race.begin_lap()
+        
+        vector = [race for race in races if race.uses_lap_kernel() and isinstance(race.lap_kernel, VectorLapKernel)]
+        VectorLapKernel.run_batch([race.lap_kernel for race in vector])
+        for race in races:
+            if not race.uses_lap_kernel():
+                race.simulate_drivers_scalar()
+            elif not isinstance(race.lap_kernel, VectorLapKernel):
+                race.lap_kernel.run_lap()
+        
+        return [race.finish_lap() for race in races]
+    
+    @staticmethod
+    def advance_batch(races: List['RaceEngine']) -> List[LapResult]:
+        """Step each race up to its next presentation update; endurance races cover a block of laps"""
+        results = RaceEngine.step_batch(races)
+        for idx, race in enumerate(races):
+            block = [results[idx]]
+            while len(block) < race.laps_per_update and not race.race_finished:
+                block.append(race.step())
+            if len(block) > 1:
+                results[idx] = LapResult.combine(block, race.EVENT_HISTORY)
+        return results
+    
+    def begin_lap(self):
         self.current_lap += 1
+        self.dps_cache = {}
         self.lap_events = []
         self.sector_events = []
         
-        if self.current_lap < len(self.weather_forecast):
-            new_weather = self.weather_forecast[self.current_lap]
+        if self.endurance:
+            self.roll_weather_forecast()
+        
+        forecast_idx = self.current_lap - self.forecast_offset
+        if forecast_idx < len(self.weather_forecast):
+            new_weather = self.weather_forecast[forecast_idx]
             if new_weather != self.weather:
                 old_weather = self.weather
                 self.weather = new_weather
+                self.raining = "rain" in new_weather
                 self.update_weather_conditions()
                 
-                weather_emoji = {
-                    "clear": "☀️", "partly_cloudy": "⛅", "cloudy": "☁️",
-                    "light_rain": "🌦️", "rain": "🌧️", "heavy_rain": "⛈️"
-                }
-                
-                self.lap_events.append(
-                    f"🌦️ **WEATHER CHANGE:** {weather_emoji.get(old_weather, '')} → "
-                    f"{weather_emoji.get(new_weather, '')} {new_weather.replace('_', ' ').title()}"
-                )
+                self.log_event("weather", value=(
+                    self.WEATHER_EMOJI.get(old_weather, ''), self.WEATHER_EMOJI.get(new_weather, ''),
+                    self.WEATHER_LABELS.get(new_weather, new_weather)
+                ))
                 
                 if "rain" in new_weather and "rain" not in old_weather:
-                    self.lap_events.append("⚠️ **TRACK IS GETTING WET** - Drivers may pit for inters/wets")
+                    self.log_event("track_wet")
+        
+        self.ensure_compiled()
         
         if self.current_lap >= 3 and not self.safety_car:
             if not self.drs_enabled:
                 self.drs_enabled = True
-                self.lap_events.append("💨 **DRS ENABLED**")
+                self.log_event("drs_enabled")
         
         self.track_evolution = min(15, self.current_lap * 0.5)
         if self.current_lap > 10 and not self.rubbered_in:
             self.rubbered_in = True
-            self.lap_events.append("🏁 Track is now fully rubbered in - Grip improved")
+            self.log_event("rubbered_in")
+    
+    def finish_lap(self) -> LapResult:
+        self.update_positions()
+        self.update_drs()
+        self.update_slipstream()
+        if not (self.uses_lap_kernel() and self.lap_kernel.resolves_overtakes):
+            self.simulate_overtakes()
+        self.ai_strategy_decisions()
+        self.check_safety_car()
+        self.update_positions()
+        
+        self.events.extend(self.lap_events)
+        
+        if self.current_lap >= self.total_laps:
+            self.race_finished = True
+        
+        return LapResult(self)
+    
+    def run_to_finish(self) -> List[LapResult]:
+        """Simulate every remaining lap and return the per-lap results"""
+        results = []
+        while not self.race_finished:
+            results.append(self.step())
+        return results
+    
+    def snapshot(self) -> bytes:
+        """Picklable copy of the race state without Discord handles"""
+        state = {key: value for key, value in self.__dict__.items() if key not in self.SNAPSHOT_EXCLUDE}
+        # The vector kernel draws from its own generator
+        kernel_rng = getattr(self.lap_kernel, "rng", None)
+        if kernel_rng is not None:
+            state["kernel_rng_state"] = kernel_rng.bit_generator.state
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @classmethod
+    def from_snapshot(cls, snapshot: bytes, seed: Optional[int] = None, kernel: Optional[str] = None) -> 'RaceEngine':
+        """Independent race forked from a snapshot, optionally reseeded"""
+        race = cls.__new__(cls)
+        state = pickle.loads(snapshot)
+        kernel_rng_state = state.pop("kernel_rng_state", None)
+        race.__dict__.update(state)
+        race.__dict__.setdefault("autopilot", set())
+        race.__dict__.setdefault("start_state", None)
+        race.events = deque(maxlen=cls.EVENT_HISTORY)
+        race.race_control_channel = None
+        race.dm_messages = {}
+        race.on_input = None
+        race.qualifying_session = None
+        
+        if seed is not None:
+            race.seed = seed
+            race.rng = random.Random(seed)
+        if kernel is not None:
+            race.kernel = kernel
+        race.lap_kernel = race.build_lap_kernel()
+        if seed is None:
+            race.set_kernel_rng_state(kernel_rng_state)
+        return race
+    
+    def restore(self, snapshot: bytes):
+        """Overwrite the race state in place, keeping the existing Driver objects"""
+        state = pickle.loads(snapshot)
+        kernel_rng_state = state.pop("kernel_rng_state", None)
+        drivers = {d.id: d for d in state.pop("drivers")}
+        for driver in self.drivers:
+            driver.copy_state(drivers[driver.id])
+        
+        local = {d.id: d for d in self.drivers}
+        state["running_order"] = [local[d.id] for d in state["running_order"]]
+        self.__dict__.update(state)
+        # The kernel's packed columns describe the grid before the rewind
+        self.lap_kernel = self.build_lap_kernel()
+        self.set_kernel_rng_state(kernel_rng_state)
+    
+    def lap_delta(self) -> tuple:
+        """The state the last laps changed, without the grid and track data a snapshot carries"""
+        lap_state = attrgetter(*Driver.LAP_STATE)
+        return (
+            tuple(getattr(self, field) for field in self.LAP_STATE),
+            [(d.id, lap_state(d)) for d in self.drivers],
+            [d.id for d in self.running_order],
+        )
+    
+    def apply_delta(self, delta: tuple, events: List[tuple]):
+        """Bring a mirror of a race stepped elsewhere up to date with its lap_delta"""
+        race_state, driver_states, order = delta
+        weather = self.weather
+        for field, value in zip(self.LAP_STATE, race_state):
+            setattr(self, field, value)
+        if self.weather != weather:
+            self.lookup_weather_factors()
+        
+        drivers = {d.id: d for d in self.drivers}
+        for driver_id, state in driver_states:
+            driver = drivers[driver_id]
+            for field, value in zip(Driver.LAP_STATE, state):
+                setattr(driver, field, value)
+        self.running_order = [drivers[driver_id] for driver_id in order]
+        self.events.extend(events)
+    
+    def set_kernel_rng_state(self, state: Optional[dict]):
+        kernel_rng = getattr(self.lap_kernel, "rng", None)
+        if state is not None and kernel_rng is not None:
+            kernel_rng.bit_generator.state = state
+    
+    def apply_input(self, driver: Driver, action: str, value: Optional[str] = None):
+        """Apply a player command between laps and record it for replay"""
+        self.inputs.append([self.current_lap, driver.id, action, value])
+        if self.on_input:
+            self.on_input(driver.id, action, value)
+        
+        if action == "pit":
+            self.pit_stop(driver, f"Player Request - {self.PLAYER_PIT_LABELS[value]}")
+            driver.tyre_compound = value
+        elif action == "push":
+            driver.push_mode = min(100, driver.push_mode + 20)
+            driver.fuel_mix = min(100, driver.fuel_mix + 15)
+        elif action == "conserve":
+            driver.push_mode = max(30, driver.push_mode - 20)
+            driver.fuel_mix = max(30, driver.fuel_mix - 15)
+        elif action == "ers":
+            driver.ers_mode = value
+        elif action == "overtake":
+            driver.engine_mode = "overtake"
+            driver.push_mode = 95
+    
+    def mark_start(self):
+        """Keep the compressed state from before lap 1, so the race can be rebuilt from its history row"""
+        self.start_state = None
+        self.start_state = zlib.compress(self.snapshot())
+    
+    @classmethod
+    def rebuild(cls, start_state: bytes, race_inputs: str) -> 'RaceEngine':
+        """Finished race re-run from a stored start state and its recorded inputs"""
+        race = cls.from_snapshot(zlib.decompress(start_state))
+        race.replay(json.loads(race_inputs))
+        return race
+    
+    def replay(self, inputs: List[list]) -> List[LapResult]:
+        """Re-run a fresh race with the same seed and grid, re-applying recorded inputs"""
+        drivers = {d.id: d for d in self.drivers}
+        pending = sorted(inputs, key=lambda x: x[0])
+        results = []
+        
+        while not self.race_finished:
+            while pending and pending[0][0] <= self.current_lap:
+                lap, driver_id, action, value = pending.pop(0)
+                self.apply_input(drivers[driver_id], action, value)
+            results.append(self.step())
         
+        return results
+    
+    def simulate_drivers_scalar(self):
         for driver in self.drivers:
             if driver.dnf:
                 continue
             
             driver.lap = self.current_lap
             
-            lap_time = self.calculate_lap_time(driver)
-            driver.lap_time = lap_time
-            driver.total_time += lap_time
-            
-            if lap_time < driver.best_lap and not self.safety_car:
-                driver.best_lap = lap_time
-                if self.current_lap > 3:
-                    self.lap_events.append(
-                        f"⏱️ **FASTEST LAP:** {driver.name} - {lap_time:.3f}s "
-                        f"(Avg: {lap_time/3:.3f}s/sector)"
-                    )
-            
-            if driver.position == 1:
-                driver.laps_led += 1
-            
-            self.update_tyre_wear(driver)
-            self.update_tyre_temperature(driver)
-            self.update_fuel(driver)
-            self.update_ers(driver)
-            self.update_engine(driver)
-            self.update_brakes(driver)
-            self.update_driver_condition(driver)
-            
-            driver.tyre_age += 1
-            
-            await self.check_incidents(driver)
-            
-            self.check_pit_window(driver)
+            self.complete_driver_lap(driver, self.calculate_lap_time(driver))
+    
+    def complete_driver_lap(self, driver: Driver, lap_time: float, incidents: bool = True):
+        driver.lap_time = lap_time
+        driver.total_time += lap_time
         
-        self.update_positions()
-        self.update_drs()
-        self.update_slipstream()
-        await self.simulate_overtakes()
-        self.ai_strategy_decisions()
-        self.check_safety_car()
-        self.update_positions()
+        if lap_time < driver.best_lap and not self.safety_car:
+            driver.best_lap = lap_time
+            if self.current_lap > 3:
+                self.log_event("fastest_lap", driver, value=(lap_time, lap_time / 3))
         
-        self.events.extend(self.lap_events)
+        if driver.position == 1:
+            driver.laps_led += 1
         
-        await self.send_dm_updates(bot)
+        self.update_tyre_wear(driver)
+        self.update_tyre_temperature(driver)
+        self.update_fuel(driver)
+        self.update_ers(driver)
+        self.update_engine(driver)
+        self.update_brakes(driver)
+        self.update_driver_condition(driver)
+        
+        driver.tyre_age += 1
+        
+        if incidents:
+            self.check_incidents(driver)
+        
+        self.check_pit_window(driver)
+    
+    def neutralised_lap_time(self) -> Optional[float]:
+        """Lap time behind the safety car or under the VSC, None under green flags"""
+        if self.safety_car:
+            return self.base_lap_time + self.rng.uniform(18, 25)
+        if self.virtual_safety_car:
+            return self.base_lap_time + self.rng.uniform(8, 12)
+        return None
     
-    def calculate_lap_time(self, driver: Driver) -> float:
-        base_time = self.track_data[self.track]["base_lap_time"]
-        dps = self.calculate_dps(driver)
+    def calculate_lap_time(self, driver: Driver, split_sectors: bool = True, flags: bool = True) -> float:
+        """Racing lap time; flags=False leaves the safety car and VSC to a kernel that applies them per sector"""
+        base_time = self.base_lap_time
+        dps = self.lap_dps(driver)
         
         lap_time = base_time - (dps / 10)
         
         fuel_bonus = (100 - driver.fuel_load) * 0.018
         lap_time -= fuel_bonus
         
-        if self.safety_car:
-            lap_time = base_time + random.uniform(18, 25)
-        elif self.virtual_safety_car:
-            lap_time = base_time + random.uniform(8, 12)
+        neutralised = self.neutralised_lap_time() if flags else None
+        if neutralised is not None:
+            lap_time = neutralised
         
         lap_time += driver.damage * 0.06
         
         if driver.penalty_time > 0:
             lap_time += 5
             driver.penalty_time = 0
-            self.lap_events.append(f"⏱️ {driver.name} serves 5s time penalty")
+            self.log_event("penalty_served", driver)
         
-        lap_time += random.uniform(-0.4, 0.4)
+        lap_time += self.rng.uniform(-0.4, 0.4)
         
-        sector_split = self.track_data[self.track]["sector_lengths"]
-        for idx, split in enumerate(sector_split):
-            sector_time = lap_time * split
+        if split_sectors:
+            self.record_sectors(driver, [lap_time * split for split in self.sector_lengths])
+        
+        return max(base_time * 0.75, lap_time)
+    
+    def record_sectors(self, driver: Driver, sector_times: List[float]):
+        for idx, sector_time in enumerate(sector_times):
             driver.sector_times[idx] = sector_time
             if sector_time < driver.sector_bests[idx]:
                 driver.sector_bests[idx] = sector_time
-        
-        return max(base_time * 0.75, lap_time)
     
     def update_tyre_wear(self, driver: Driver):
-        base_wear = self.track_data[self.track]["tyre_wear"]
-        
-        compound_wear = {
-            "soft": 4.5, "medium": 2.8, "hard": 1.6,
-            "inter": 3.2, "wet": 2.8
-        }
-        
-        compound = compound_wear.get(driver.tyre_compound, 2.8)
-        
         temp_factor = 1.0
         if driver.tyre_temp > 110:
             temp_factor = 1.5
@@ -1300,7 +2528,7 @@ class RaceEngine:
         management_factor = (100 - driver.tire_management) / 100
         
         wear = (
-            base_wear * compound * driver.car_stats['tyre_wear_rate'] *
+            self.tyre_wear_factors[driver.tyre_compound] * driver.car.tyre_wear_rate *
             (driver.push_mode / 50) * temp_factor *
             (self.track_temp / 30) * (1 + management_factor * 0.3)
         )
@@ -1311,9 +2539,6 @@ class RaceEngine:
         if driver.lock_ups > 0:
             wear *= 1.1
         
-        if "rain" in self.weather and driver.tyre_compound in ["soft", "medium", "hard"]:
-            wear *= 2.5
-        
         driver.tyre_condition = max(0, driver.tyre_condition - wear)
     
     def update_tyre_temperature(self, driver: Driver):
@@ -1328,14 +2553,14 @@ class RaceEngine:
             target_temp = 70
         
         temp_change = (target_temp - driver.tyre_temp) * 0.3
-        driver.tyre_temp = max(60, min(120, driver.tyre_temp + temp_change + random.uniform(-2, 2)))
+        driver.tyre_temp = max(60, min(120, driver.tyre_temp + temp_change + self.rng.uniform(-2, 2)))
     
     def update_fuel(self, driver: Driver):
-        base_consumption = self.track_data[self.track]["fuel_usage"]
+        base_consumption = self.track_fuel_usage
         
         consumption = (
             base_consumption * (driver.fuel_mix / 50) * 
-            (driver.push_mode / 50) * driver.car_stats['fuel_efficiency']
+            (driver.push_mode / 50) * driver.car.fuel_efficiency
         )
         
         if driver.engine_mode == "overtake":
@@ -1355,18 +2580,17 @@ class RaceEngine:
         driver.fuel_per_lap = consumption
         
         if driver.fuel_load < 5 and not driver.dnf:
-            driver.dnf = True
-            driver.dnf_reason = "Out of Fuel"
-            self.lap_events.append(f"⛽ **{driver.name} - OUT OF FUEL!**")
+            self.retire_driver(driver, "Out of Fuel")
+            self.log_event("out_of_fuel", driver)
     
     def update_ers(self, driver: Driver):
         if driver.ers_mode == "charging":
-            charge_rate = 18 + (driver.car_stats['battery_capacity'] / 10)
+            charge_rate = 18 + (driver.car.battery_capacity / 10)
             driver.ers_charge = min(100, driver.ers_charge + charge_rate)
             driver.battery_temp = max(35, driver.battery_temp - 1.5)
         elif driver.ers_mode == "deploy":
             if driver.ers_charge >= 12:
-                deploy_amount = 12 + random.uniform(-2, 2)
+                deploy_amount = 12 + self.rng.uniform(-2, 2)
                 driver.ers_charge -= deploy_amount
                 driver.ers_deployed_lap += deploy_amount
                 driver.battery_temp += 2.5
@@ -1384,45 +2608,44 @@ class RaceEngine:
     
     def update_engine(self, driver: Driver):
         if driver.engine_mode == "overtake":
-            driver.engine_temp += random.uniform(1.5, 3.0)
-            driver.engine_wear_lap += 0.15
+            driver.engine_temp += self.rng.uniform(1.5, 3.0)
+            driver.engine_wear_lap += 0.15 * self.hazard_scale
         elif driver.engine_mode == "eco":
             driver.engine_temp = max(85, driver.engine_temp - 1.0)
-            driver.engine_wear_lap += 0.03
+            driver.engine_wear_lap += 0.03 * self.hazard_scale
         else:
-            temp_change = random.uniform(-0.5, 1.0)
+            temp_change = self.rng.uniform(-0.5, 1.0)
             driver.engine_temp += temp_change
-            driver.engine_wear_lap += 0.08
+            driver.engine_wear_lap += 0.08 * self.hazard_scale
         
-        cooling = driver.car_stats['cooling_efficiency'] / 100
+        cooling = driver.car.cooling_efficiency / 100
         driver.engine_temp = max(85, driver.engine_temp - (cooling * 2))
         
         if driver.engine_temp > 115:
-            if random.random() < 0.05:
-                driver.dnf = True
-                driver.dnf_reason = "Engine Overheating"
-                self.lap_events.append(f"🔥 **{driver.name} - ENGINE FAILURE!** (Overheating)")
+            if self.rng.random() < 0.05 * self.hazard_scale:
+                self.retire_driver(driver, "Engine Overheating")
+                self.log_event("engine_overheat", driver)
     
     def update_brakes(self, driver: Driver):
         for i in range(4):
             if driver.push_mode > 70:
-                driver.brake_temp[i] += random.uniform(2, 5)
+                driver.brake_temp[i] += self.rng.uniform(2, 5)
             else:
-                driver.brake_temp[i] = max(80, driver.brake_temp[i] - random.uniform(1, 3))
+                driver.brake_temp[i] = max(80, driver.brake_temp[i] - self.rng.uniform(1, 3))
             
             driver.brake_temp[i] = max(60, min(800, driver.brake_temp[i]))
         
         if any(temp > 700 for temp in driver.brake_temp):
-            driver.brake_wear -= random.uniform(3, 6)
-            if driver.brake_wear < 20 and random.random() < 0.08:
-                driver.damage_locations["suspension"] += random.uniform(10, 25)
+            driver.brake_wear -= self.rng.uniform(3, 6)
+            if driver.brake_wear < 20 and self.rng.random() < 0.08:
+                driver.damage_locations["suspension"] += self.rng.uniform(10, 25)
                 if not driver.is_ai:
                     driver.radio_messages.append("🚨 Brake failure! Box box!")
     
     def update_driver_condition(self, driver: Driver):
         base_fatigue = 0.3
         
-        if "rain" in self.weather:
+        if self.raining:
             base_fatigue *= 1.5
         
         if driver.in_battle:
@@ -1475,25 +2698,19 @@ class RaceEngine:
                 driver.drs_available = False
             return
         
-        sorted_drivers = sorted([d for d in self.drivers if not d.dnf], 
-                               key=lambda x: x.position)
+        sorted_drivers = self.running_order
         
         for i in range(1, len(sorted_drivers)):
             driver = sorted_drivers[i]
             
-            gap_threshold = 1.0
-            if self.track in ["Monza", "Spa"]:
-                gap_threshold = 1.2
-            
-            if driver.gap_to_front < gap_threshold:
+            if driver.gap_to_front < self.drs_gap_threshold:
                 driver.drs_available = True
                 driver.drs_uses += 1
             else:
                 driver.drs_available = False
     
     def update_slipstream(self):
-        sorted_drivers = sorted([d for d in self.drivers if not d.dnf], 
-                               key=lambda x: x.position)
+        sorted_drivers = self.running_order
         
         for i in range(1, len(sorted_drivers)):
             driver = sorted_drivers[i]
@@ -1503,9 +2720,8 @@ class RaceEngine:
             else:
                 driver.slipstream_active = False
     
-    async def simulate_overtakes(self):
-        sorted_drivers = sorted([d for d in self.drivers if not d.dnf], 
-                               key=lambda x: x.position)
+    def simulate_overtakes(self):
+        sorted_drivers = self.running_order[:]
         
         for i in range(1, len(sorted_drivers)):
             attacker = sorted_drivers[i]
@@ -1527,14 +2743,19 @@ class RaceEngine:
             if attacker.gap_to_front < 0.3:
                 overtake_chance = self.calculate_overtake_chance(attacker, defender)
                 
-                if random.random() * 100 < overtake_chance:
-                    await self.execute_overtake(attacker, defender)
+                if self.rng.random() * 100 < overtake_chance:
+                    self.execute_overtake(attacker, defender)
+    
+    def swap_positions(self, attacker: Driver, defender: Driver):
+        attacker.position, defender.position = defender.position, attacker.position
+        self.running_order[attacker.position - 1] = attacker
+        self.running_order[defender.position - 1] = defender
     
     def calculate_overtake_chance(self, attacker: Driver, defender: Driver) -> float:
-        base_chance = 100 - self.track_data[self.track]["overtake_difficulty"]
+        base_chance = self.overtake_base_chance
         
-        attacker_dps = self.calculate_dps(attacker)
-        defender_dps = self.calculate_dps(defender)
+        attacker_dps = self.lap_dps(attacker)
+        defender_dps = self.lap_dps(defender)
         skill_diff = (attacker_dps - defender_dps) * 2.5
         
         drs_bonus = 28 if attacker.drs_available else 0
@@ -1555,16 +2776,16 @@ class RaceEngine:
             tire_diff + slipstream_bonus + skill_bonus + aggression_factor
         )
         
-        if "rain" in self.weather:
+        if self.raining:
             rain_skill_diff = (attacker.rain_skill - defender.rain_skill) * 0.3
             chance += rain_skill_diff
         
         return max(3, min(97, chance))
     
-    async def execute_overtake(self, attacker: Driver, defender: Driver):
+    def execute_overtake(self, attacker: Driver, defender: Driver):
         outcomes = ["clean", "side_by_side", "dive_bomb", "contact", "failed"]
         
-        if "rain" in self.weather:
+        if self.raining:
             weights = [35, 25, 15, 18, 7]
         else:
             weights = [55, 25, 10, 8, 2]
@@ -1573,11 +2794,11 @@ class RaceEngine:
             weights[2] += 10
             weights[0] -= 5
         
-        outcome = random.choices(outcomes, weights=weights)[0]
+        outcome = self.rng.choices(outcomes, weights=weights)[0]
         
         if outcome == "clean":
             old_pos = attacker.position
-            attacker.position, defender.position = defender.position, attacker.position
+            self.swap_positions(attacker, defender)
             attacker.overtakes_made += 1
             defender.overtakes_lost += 1
             attacker.battles_won += 1
@@ -1585,82 +2806,61 @@ class RaceEngine:
             attacker.confidence = min(100, attacker.confidence + 2)
             defender.confidence = max(30, defender.confidence - 1)
             
-            self.lap_events.append(
-                f"🎯 **OVERTAKE!** {attacker.name} passes {defender.name} for P{old_pos-1} (Clean move)"
-            )
+            self.log_event("overtake", attacker, defender, old_pos - 1)
             attacker.attacking = False
             defender.defending = False
             attacker.in_battle = False
             defender.in_battle = False
         
         elif outcome == "side_by_side":
-            if random.random() < 0.6:
+            if self.rng.random() < 0.6:
                 old_pos = attacker.position
-                attacker.position, defender.position = defender.position, attacker.position
+                self.swap_positions(attacker, defender)
                 attacker.overtakes_made += 1
                 defender.overtakes_lost += 1
-                self.lap_events.append(
-                    f"⚔️ **BATTLE!** {attacker.name} edges past {defender.name} for P{old_pos-1}"
-                )
+                self.log_event("battle_won", attacker, defender, old_pos - 1)
             else:
-                self.lap_events.append(
-                    f"⚔️ **WHEEL TO WHEEL!** {attacker.name} vs {defender.name} - {defender.name} holds position"
-                )
+                self.log_event("battle_held", attacker, defender)
         
         elif outcome == "dive_bomb":
-            if random.random() < 0.5:
+            if self.rng.random() < 0.5:
                 old_pos = attacker.position
-                attacker.position, defender.position = defender.position, attacker.position
+                self.swap_positions(attacker, defender)
                 attacker.overtakes_made += 1
                 defender.overtakes_lost += 1
-                self.lap_events.append(
-                    f"💥 **AGGRESSIVE!** {attacker.name} dive-bombs {defender.name} for P{old_pos-1}"
-                )
+                self.log_event("dive_bomb", attacker, defender, old_pos - 1)
                 
-                if random.random() < 0.3:
+                if self.rng.random() < 0.3:
                     attacker.warnings += 1
-                    self.lap_events.append(f"⚠️ {attacker.name} - Warning for aggressive driving")
+                    self.log_event("warning", attacker)
             else:
-                minor_damage = random.uniform(3, 8)
+                minor_damage = self.rng.uniform(3, 8)
                 attacker.damage += minor_damage
-                self.lap_events.append(
-                    f"💥 **DIVE FAILED!** {attacker.name} locks up - Minor damage"
-                )
+                self.log_event("dive_failed", attacker)
         
         elif outcome == "contact":
-            damage = random.uniform(8, 25)
+            damage = self.rng.uniform(8, 25)
             attacker.damage += damage
             defender.damage += damage * 0.6
             
-            damage_location = random.choice(["front_wing", "rear_wing", "floor", "suspension"])
+            damage_location = self.rng.choice(["front_wing", "rear_wing", "floor", "suspension"])
             attacker.damage_locations[damage_location] += damage
             
-            self.lap_events.append(
-                f"💥 **CONTACT!** {attacker.name} and {defender.name} collide! "
-                f"Damage: {attacker.name} ({damage:.0f}%) {defender.name} ({damage*0.6:.0f}%)"
-            )
-            
-            self.incidents.append({
-                "lap": self.current_lap,
-                "type": "collision",
-                "drivers": [attacker.name, defender.name],
-                "severity": "medium" if damage < 15 else "high"
-            })
+            self.log_event("contact", attacker, defender, (damage, damage * 0.6))
+            self.incidents.append(("collision", self.current_lap, attacker.id, defender.id, damage))
             
-            if random.random() < 0.6:
-                penalty_type = random.choice(["5s", "10s"])
+            if self.rng.random() < 0.6:
+                penalty_type = self.rng.choice(["5s", "10s"])
                 if penalty_type == "5s":
                     attacker.penalty_time += 5
                 else:
                     attacker.penalty_time += 10
-                self.lap_events.append(f"⚠️ {attacker.name} - {penalty_type} time penalty for causing collision")
+                self.log_event("collision_penalty", attacker, value=penalty_type)
         
         elif outcome == "failed":
-            self.lap_events.append(
-                f"🔄 {attacker.name} attempts a move on {defender.name} but can't make it stick"
-            )
+            self.log_event("move_failed", attacker, defender)
     
-    async def check_incidents(self, driver: Driver):
+    def check_incidents(self, driver: Driver):
         crash_chance = 0.25
         
         crash_chance += (100 - driver.tyre_condition) * 0.025
@@ -1669,86 +2869,141 @@ class RaceEngine:
         crash_chance += (driver.fatigue / 100) * 0.5
         crash_chance += (1 - driver.focus / 100) * 0.6
         
-        if "rain" in self.weather:
-            rain_multiplier = {"light_rain": 2.0, "rain": 3.0, "heavy_rain": 4.5}
-            crash_chance *= rain_multiplier.get(self.weather, 1.0)
-            
-            if driver.tyre_compound in ["soft", "medium", "hard"]:
-                crash_chance *= 2.5
-        
-        if self.track in ["Monaco", "Singapore"]:
-            crash_chance *= 1.4
-        
-        if random.random() * 100 < crash_chance:
-            crash_severity = random.uniform(5, 100)
-            
-            if crash_severity < 20:
-                driver.damage += crash_severity
-                driver.lock_ups += 1
-                driver.mistakes_count += 1
-                self.lap_events.append(f"⚠️ {driver.name} - Lock-up! Minor damage ({crash_severity:.0f}%)")
-            elif crash_severity < 40:
-                driver.damage += crash_severity
-                driver.spins += 1
-                driver.mistakes_count += 1
-                positions_lost = random.randint(1, 3)
-                self.lap_events.append(
-                    f"🌪️ {driver.name} - SPIN! Lost ~{positions_lost} positions ({crash_severity:.0f}% damage)"
-                )
-            elif crash_severity < 70:
-                driver.damage += crash_severity
-                self.lap_events.append(f"🚨 {driver.name} - BIG MOMENT! Heavy damage ({crash_severity:.0f}%)")
-                self.virtual_safety_car = True
-                self.lap_events.append("🟡 **VIRTUAL SAFETY CAR**")
-            else:
-                driver.damage += crash_severity
-                self.lap_events.append(f"💥 {driver.name} - **HUGE CRASH!**")
-                self.safety_car = True
-                self.lap_events.append("🚨 **SAFETY CAR DEPLOYED**")
-            
-            if crash_severity > 75 or driver.damage > 80:
-                driver.dnf = True
-                driver.dnf_reason = "Accident"
-                self.lap_events.append(f"❌ {driver.name} - **DNF** (Accident)")
+        crash_chance *= self.incident_factors[driver.tyre_compound]
+        
+        crash_chance *= self.hazard_scale
         
-        failure_chance = (100 - driver.car_stats['reliability']) * 0.04
+        if self.rng.random() * 100 < crash_chance:
+            self.resolve_crash(driver)
+        
+        failure_chance = (100 - driver.car.reliability) * 0.04
         failure_chance += driver.engine_wear_lap * 0.5
         
         if driver.engine_temp > 110:
             failure_chance *= 2.0
         
-        if random.random() * 100 < failure_chance:
-            failure_type = random.choice([
-                "Engine", "Gearbox", "Hydraulics", "Electrical", 
-                "Suspension", "Brake", "Power Unit"
-            ])
-            
-            driver.dnf = True
-            driver.dnf_reason = f"{failure_type} Failure"
-            self.lap_events.append(f"💥 {driver.name} - **{failure_type.upper()} FAILURE!**")
-            
-            if random.random() < 0.4:
-                self.virtual_safety_car = True
-                self.lap_events.append("🟡 **VIRTUAL SAFETY CAR**")
+        failure_chance *= self.hazard_scale
+        
+        if self.rng.random() * 100 < failure_chance:
+            self.resolve_mechanical_failure(driver)
+    
+    def resolve_crash(self, driver: Driver):
+        crash_severity = self.rng.uniform(5, 100)
+        
+        if crash_severity < 20:
+            driver.damage += crash_severity
+            driver.lock_ups += 1
+            driver.mistakes_count += 1
+            self.log_event("lock_up", driver, value=crash_severity)
+        elif crash_severity < 40:
+            driver.damage += crash_severity
+            driver.spins += 1
+            driver.mistakes_count += 1
+            positions_lost = self.rng.randint(1, 3)
+            self.log_event("spin", driver, value=(positions_lost, crash_severity))
+        elif crash_severity < 70:
+            driver.damage += crash_severity
+            self.log_event("big_moment", driver, value=crash_severity)
+            self.virtual_safety_car = True
+            self.log_event("vsc")
+        else:
+            driver.damage += crash_severity
+            self.log_event("huge_crash", driver)
+            self.safety_car = True
+            self.log_event("safety_car")
+        
+        if crash_severity > 75 or driver.damage > 80:
+            self.retire_driver(driver, "Accident")
+            self.log_event("dnf_accident", driver)
+    
+    def resolve_mechanical_failure(self, driver: Driver):
+        failure_type = self.rng.choice([
+            "Engine", "Gearbox", "Hydraulics", "Electrical", 
+            "Suspension", "Brake", "Power Unit"
+        ])
+        
+        self.retire_driver(driver, f"{failure_type} Failure")
+        self.log_event("failure", driver, value=failure_type.upper())
+        
+        if self.rng.random() < 0.4:
+            self.virtual_safety_car = True
+            self.log_event("vsc")
     
     def check_safety_car(self):
         if self.safety_car:
             self.safety_car_laps += 1
-            if self.safety_car_laps >= random.randint(2, 4):
+            if self.safety_car_laps >= self.rng.randint(2, 4):
                 self.safety_car = False
                 self.safety_car_laps = 0
-                self.lap_events.append("🏁 **SAFETY CAR IN THIS LAP**")
-                self.lap_events.append("🟢 **RACING RESUMES!**")
+                self.log_event("safety_car_in")
+                self.log_event("green_flag")
         
         if self.virtual_safety_car:
             self.vsc_laps += 1
-            if self.vsc_laps >= random.randint(1, 3):
+            if self.vsc_laps >= self.rng.randint(1, 3):
                 self.virtual_safety_car = False
                 self.vsc_laps = 0
-                self.lap_events.append("🟢 **VSC ENDING - Green flag!**")
+                self.log_event("vsc_ending")
+    
+    def change_driver(self, driver: Driver):
+        driver.stint += 1
+        driver.stint_start = self.current_lap
+        driver.fatigue = 0.0
+        driver.focus = 100.0
+        driver.engine_mode = "balanced"
+        driver.engine_temp = min(driver.engine_temp, 95.0)
+        self.log_event("driver_change", driver, value=driver.stint)
+    
+    def retire_driver(self, driver: Driver, reason: str):
+        driver.dnf = True
+        driver.dnf_reason = reason
+        self.grid_version += 1
+    
+    def log_event(self, code: str, driver: Optional[Driver] = None, other: Optional[Driver] = None, value=None):
+        self.lap_events.append((
+            code, self.current_lap,
+            driver.id if driver else None, other.id if other else None, value
+        ))
+    
+    def render_event(self, event) -> str:
+        code, lap, driver_id, other_id, value = event
+        names = self.driver_names
+        return self.EVENT_FORMATS[code].format(a=names.get(driver_id), b=names.get(other_id), v=value, lap=lap)
+    
+    def render_events(self, events) -> List[str]:
+        return [self.render_event(event) for event in events]
+    
+    def car_ahead(self, driver: Driver) -> Optional[Driver]:
+        idx = driver.position - 2
+        return self.running_order[idx] if 0 <= idx < len(self.running_order) else None
+    
+    def car_behind(self, driver: Driver) -> Optional[Driver]:
+        idx = driver.position
+        return self.running_order[idx] if idx < len(self.running_order) else None
+    
+    def cars_within(self, driver: Driver, seconds: float) -> List[Driver]:
+        """Active cars within the given gap of the driver, nearest first on each side"""
+        nearby = []
+        idx = driver.position - 1
+        
+        for step in (-1, 1):
+            other_idx = idx + step
+            while 0 <= other_idx < len(self.running_order):
+                other = self.running_order[other_idx]
+                if abs(other.total_time - driver.total_time) > seconds:
+                    break
+                nearby.append(other)
+                other_idx += step
+        
+        return nearby
     
     def update_positions(self):
-        active_drivers = [d for d in self.drivers if not d.dnf]
+        # The running order persists between laps: retirements are dropped only when one
+        # happened, and the in-place sort just repairs an almost sorted list
+        active_drivers = self.running_order
+        if self.order_version != self.grid_version:
+            active_drivers[:] = [d for d in active_drivers if not d.dnf]
+            self.order_version = self.grid_version
         active_drivers.sort(key=lambda d: (d.total_time, -d.grid_position))
         
         for idx, driver in enumerate(active_drivers):
@@ -1766,7 +3021,7 @@ class RaceEngine:
     
     def ai_strategy_decisions(self):
         for driver in self.drivers:
-            if not driver.is_ai or driver.dnf:
+            if driver.dnf or not (driver.is_ai or driver.id in self.autopilot):
                 continue
             
             should_pit = False
@@ -1780,7 +3035,7 @@ class RaceEngine:
                 should_pit = True
                 pit_reason = "Safety car opportunity"
             
-            if "rain" in self.weather and driver.tyre_compound not in ["inter", "wet"]:
+            if self.raining and driver.tyre_compound not in ["inter", "wet"]:
                 if self.weather == "heavy_rain" or driver.tyre_condition < 70:
                     should_pit = True
                     pit_reason = "Weather change"
@@ -1790,7 +3045,7 @@ class RaceEngine:
                 pit_reason = "Track drying"
             
             if self.virtual_safety_car and driver.tyre_condition < 50:
-                if random.random() < 0.65:
+                if self.rng.random() < 0.65:
                     should_pit = True
                     pit_reason = "VSC window"
             
@@ -1799,7 +3054,15 @@ class RaceEngine:
                 should_pit = True
                 pit_reason = "High tyre age"
             
-            if should_pit and driver.pit_stops < 4 and laps_remaining > 2:
+            if self.endurance:
+                if driver.fuel_load < max(12, driver.fuel_per_lap * 4):
+                    should_pit = True
+                    pit_reason = "Fuel"
+                if self.current_lap - driver.stint_start >= self.stint_length:
+                    should_pit = True
+                    pit_reason = "Driver change"
+            
+            if should_pit and (driver.pit_stops < 4 or self.endurance) and laps_remaining > 2:
                 self.pit_stop(driver, pit_reason)
             
             if driver.position <= 3:
@@ -1831,7 +3094,7 @@ class RaceEngine:
     def pit_stop(self, driver: Driver, reason: str = "Strategy"):
         driver.pit_stops += 1
         
-        if "rain" in self.weather:
+        if self.raining:
             if self.weather == "heavy_rain":
                 new_compound = "wet"
             elif self.weather in ["rain", "light_rain"]:
@@ -1851,15 +3114,19 @@ class RaceEngine:
         
         base_pit_time = 22.0
         
-        crew_skill = random.uniform(-1.8, 1.2)
+        crew_skill = self.rng.uniform(-1.8, 1.2)
         
         if self.safety_car or self.virtual_safety_car:
-            traffic_penalty = random.uniform(0, 2)
+            traffic_penalty = self.rng.uniform(0, 2)
         else:
-            traffic_penalty = random.uniform(0, 5)
+            traffic_penalty = self.rng.uniform(0, 5)
         
         pit_time = base_pit_time + crew_skill + traffic_penalty
         
+        if self.endurance and self.current_lap - driver.stint_start >= self.stint_length // 2:
+            self.change_driver(driver)
+            pit_time += self.DRIVER_CHANGE_TIME
+        
         driver.tyre_compound = new_compound
         driver.tyre_condition = 100.0
         driver.tyre_age = 0
@@ -1871,81 +3138,795 @@ class RaceEngine:
         
         driver.total_time += pit_time
         
-        compound_emoji = {
-            "soft": "🔴", "medium": "🟡", "hard": "⚪",
-            "inter": "🟢", "wet": "🔵"
-        }
-        
         pit_quality = "Perfect" if pit_time < 21 else "Good" if pit_time < 23 else "Slow"
         
-        self.lap_events.append(
-            f"🔧 **PIT:** {driver.name} - {pit_time:.2f}s ({pit_quality}) | "
-            f"{compound_emoji.get(new_compound, '⚪')} {new_compound.upper()} | {reason}"
-        )
+        self.log_event("pit", driver, value=(
+            pit_time, pit_quality, self.COMPOUND_LABELS.get(new_compound, new_compound), reason
+        ))
         
         if minor_repairs > 0:
-            self.lap_events.append(f"   🔨 Repairs: {minor_repairs:.0f}% damage fixed")
-    
-    async def send_dm_updates(self, bot):
-        """Send race updates to drivers' DMs"""
-        for driver in self.drivers:
-            if driver.is_ai or not driver.dm_channel_id:
+            self.log_event("repairs", value=minor_repairs)
+
+# ============================================================================
+# VECTORIZED LAP KERNEL - STRUCT OF ARRAYS
+# ============================================================================
+
+class VectorLapKernel:
+    """Advances every active car of a large grid one lap with batched NumPy column operations"""
+    resolves_overtakes = False
+    # Below this many cars the fixed cost of the NumPy calls outweighs the scalar path
+    min_grid = int(os.getenv('VECTOR_MIN_GRID', '200'))
+    
+    COMPOUND_CODES = {compound: i for i, compound in enumerate(TrackRegistry.COMPOUNDS)}
+    ENGINE_MODE_CODES = {"balanced": 0, "overtake": 1, "eco": 2}
+    ERS_MODE_CODES = {"balanced": 0, "deploy": 1, "charging": 2}
+    
+    # Rows of the per-lap uniform draw block
+    DRAWS = 26
+    
+    # Per-car state the lap reads, gathered from the drivers at the start of every lap
+    GATHER_FIELDS = (
+        "tyre_condition", "tyre_temp", "tyre_age", "fuel_load", "fuel_mix",
+        "ers_charge", "battery_temp", "engine_temp", "push_mode", "damage",
+        "confidence", "total_time", "penalty_time", "position", "lock_ups",
+        "mistakes_count", "drs_available", "slipstream_active", "in_battle",
+        "attacking", "defending", "best_lap", "laps_led", "ers_deployed_lap",
+        "engine_wear_lap", "brake_wear", "fatigue", "focus", "pit_window_open",
+    )
+    
+    DRIVER_COLUMNS = (
+        "skill", "rain_skill", "race_craft", "tire_management", "fuel_management",
+        "consistency", "overtaking_skill", "defending_skill", "grid_position",
+    )
+    
+    CAR_COLUMNS = CarPerformance.__slots__
+    
+    gather = attrgetter(*GATHER_FIELDS)
+    
+    def __init__(self, race: 'RaceEngine'):
+        self.race = race
+        self.rng = np.random.default_rng(race.seed)
+        self.drivers: List[Driver] = []
+        self.driver_ids = []
+        self.rows: Dict[int, int] = {}
+        self.static = {}
+        self.grid_key = None
+    
+    def bind(self, drivers: List[Driver]):
+        """Pack the per-race invariant driver and car columns"""
+        self.static = {
+            field: np.array([getattr(d, field) for d in drivers], dtype=float)
+            for field in self.DRIVER_COLUMNS
+        }
+        for field in self.CAR_COLUMNS:
+            self.static[field] = np.array([getattr(d.car, field) for d in drivers], dtype=float)
+        self.static["is_ai"] = np.array([d.is_ai for d in drivers], dtype=bool)
+        self.set_drivers(drivers)
+    
+    def compact(self, drivers: List[Driver]):
+        """Drop the rows of cars that retired since the last lap"""
+        take = np.array([self.rows[d.id] for d in drivers], dtype=int)
+        self.static = {key: column[take] for key, column in self.static.items()}
+        self.set_drivers(drivers)
+    
+    def set_drivers(self, drivers: List[Driver]):
+        self.drivers = drivers
+        self.driver_ids = [d.id for d in drivers]
+        self.rows = {driver_id: row for row, driver_id in enumerate(self.driver_ids)}
+    
+    def prepare(self) -> int:
+        grid_version, compiled_key = self.race.grid_version, self.race.compiled_key
+        if self.grid_key is None or self.grid_key[0] != grid_version:
+            drivers = [d for d in self.race.drivers if not d.dnf]
+            # Retirements only remove rows; anything else packs the grid again
+            if self.grid_key is not None and all(d.id in self.rows for d in drivers):
+                self.compact(drivers)
+            else:
+                self.bind(drivers)
+            self.static["dps_constant"] = np.array([d.dps_constant for d in self.drivers], dtype=float)
+        elif self.grid_key[1] != compiled_key:
+            self.static["dps_constant"] = np.array([d.dps_constant for d in self.drivers], dtype=float)
+        self.grid_key = (grid_version, compiled_key)
+        return len(self.drivers)
+    
+    def run_lap(self):
+        VectorLapKernel.run_batch([self])
+    
+    @staticmethod
+    def run_batch(kernels: List['VectorLapKernel']):
+        """Advance the active cars of every kernel's race by one lap"""
+        kernels = [k for k in kernels if k.prepare()]
+        if not kernels:
+            return
+        
+        races = [k.race for k in kernels]
+        tracks = [r.track_data[r.track] for r in races]
+        drivers = [d for k in kernels for d in k.drivers]
+        counts = [len(k.drivers) for k in kernels]
+        
+        def per_car(values, dtype=float):
+            return np.repeat(np.asarray(values, dtype=dtype), counts)
+        
+        if len(kernels) == 1:
+            s = kernels[0].static
+        else:
+            s = {key: np.concatenate([k.static[key] for k in kernels]) for key in kernels[0].static}
+        
+        u = np.concatenate([k.rng.random((VectorLapKernel.DRAWS, len(k.drivers))) for k in kernels], axis=1)
+        
+        def uniform(row, low, high):
+            return low + (high - low) * u[row]
+        
+        lap = per_car([r.current_lap for r in races], int)
+        raining = per_car([r.raining for r in races], bool)
+        street = per_car([r.street_circuit for r in races], bool)
+        track_index = per_car([r.track_index for r in races], int)
+        weather_index = per_car([TRACKS.weather_index.get(r.weather, 0) for r in races], int)
+        hazard = per_car([r.hazard_scale for r in races])
+        base_time = per_car([t["base_lap_time"] for t in tracks])
+        fuel_usage = per_car([t["fuel_usage"] for t in tracks])
+        track_temp = per_car([r.track_temp for r in races])
+        track_grip = per_car([r.track_grip for r in races])
+        sector_split = np.repeat(np.array([t["sector_lengths"] for t in tracks], dtype=float), counts, axis=0)
+        closing_laps = per_car([r.total_laps - r.current_lap < 5 for r in races], bool)
+        segment_end = np.repeat(np.cumsum(counts), counts)
+        
+        (tyre_condition, tyre_temp, tyre_age, fuel_load, fuel_mix,
+         ers_charge, battery_temp, engine_temp, push, damage,
+         confidence, total_time, penalty_time, position, lock_ups,
+         mistakes, drs_available, slipstream, in_battle,
+         attacking, defending, best_lap, laps_led, ers_deployed,
+         engine_wear, brake_wear, fatigue, focus,
+         pit_window) = np.array(list(map(VectorLapKernel.gather, drivers)), dtype=float).T
+        drs_available = drs_available > 0
+        slipstream = slipstream > 0
+        in_battle = in_battle > 0
+        attacking = attacking > 0
+        defending = defending > 0
+        pit_window = pit_window > 0
+        brake_temp = np.array([d.brake_temp for d in drivers], dtype=float)
+        sector_bests = np.array([d.sector_bests for d in drivers], dtype=float)
+        
+        compound_codes = VectorLapKernel.COMPOUND_CODES
+        engine_codes = VectorLapKernel.ENGINE_MODE_CODES
+        ers_codes = VectorLapKernel.ERS_MODE_CODES
+        compound = np.array([compound_codes.get(d.tyre_compound, 1) for d in drivers])
+        engine_mode = np.array([engine_codes.get(d.engine_mode, 0) for d in drivers])
+        ers_mode = np.array([ers_codes.get(d.ers_mode, 0) for d in drivers])
+        damage_locations = np.array([sum(d.damage_locations.values()) for d in drivers], dtype=float)
+        
+        overtake_mode = engine_mode == 1
+        eco_mode = engine_mode == 2
+        deploying = ers_mode == 1
+        charging = ers_mode == 2
+        
+        # calculate_dps
+        tire_factor = (
+            tyre_condition * 0.7 +
+            np.where(np.abs(tyre_temp - 90) < 10, 100.0, 70.0) * 0.3
+        ) * 0.15
+        grip_factor = track_grip * 0.08
+        
+        weather_factor = (
+            TRACKS.grip_table[track_index, weather_index, compound] +
+            s["rain_skill"] * TRACKS.rain_skill_table[track_index, weather_index, compound]
+        ) * 0.07
+        
+        strategy_bonus = (push * 0.5 + fuel_mix * 0.3 + overtake_mode * 20 * 0.2) * 0.03
+        
+        dps = (
+            s["dps_constant"] + tire_factor + grip_factor +
+            weather_factor + strategy_bonus +
+            (focus / 100) * 5 + (confidence / 100) * 3 -
+            damage_locations * 0.02 - damage * 0.10 - fatigue * 0.05
+        )
+        
+        variation_range = s["consistency"] / 8
+        variation = uniform(0, -variation_range, variation_range)
+        
+        ers_boost = deploying & (ers_charge > 10)
+        dps += ers_boost * uniform(1, 4, 7)
+        battery_temp += ers_boost * 2
+        
+        dps += (drs_available & ~raining) * uniform(2, 2.5, 4.5) * s["drs_efficiency"]
+        dps += slipstream * uniform(3, 1.5, 3.0)
+        battle_skill = np.where(attacking, s["overtaking_skill"], s["defending_skill"]) / 100
+        dps += in_battle * battle_skill * uniform(4, -2, 3)
+        dps -= (engine_temp > 105) * uniform(5, 2, 5)
+        dps = np.maximum(0, dps + variation)
+        
+        # update_tyre_wear
+        temp_factor = np.where(tyre_temp > 110, 1.5, np.where(tyre_temp < 70, 1.3, 1.0))
+        wear = (
+            TRACKS.tyre_wear_table[track_index, weather_index, compound] * s["tyre_wear_rate"] *
+            (push / 50) * temp_factor * (track_temp / 30) *
+            (1 + (100 - s["tire_management"]) / 100 * 0.3)
+        )
+        wear *= np.where(attacking | defending, 1.25, 1.0)
+        wear *= np.where(lock_ups > 0, 1.1, 1.0)
+        tyre_condition = np.maximum(0, tyre_condition - wear)
+        
+        # update_ers
+        can_deploy = deploying & (ers_charge >= 12)
+        deploy_amount = can_deploy * (12 + uniform(10, -2, 2))
+        ers_charge = np.where(
+            charging, np.minimum(100, ers_charge + 18 + s["battery_capacity"] / 10),
+            np.where(deploying, ers_charge - deploy_amount, np.minimum(100, ers_charge + 10))
+        )
+        ers_deployed = ers_deployed + deploy_amount
+        battery_temp = np.where(
+            charging, np.maximum(35, battery_temp - 1.5),
+            np.where(deploying, battery_temp + can_deploy * 2.5, np.maximum(40, battery_temp - 0.5))
+        )
+        ers_exhausted = deploying & ~can_deploy
+        battery_hot = battery_temp > 80
+        ers_charge -= battery_hot * 5
+        
+        # update_engine
+        engine_temp = np.where(
+            overtake_mode, engine_temp + uniform(11, 1.5, 3.0),
+            np.where(eco_mode, np.maximum(85, engine_temp - 1.0), engine_temp + uniform(12, -0.5, 1.0))
+        )
+        engine_wear = engine_wear + np.where(overtake_mode, 0.15, np.where(eco_mode, 0.03, 0.08)) * hazard
+        engine_temp = np.maximum(85, engine_temp - s["cooling_efficiency"] / 100 * 2)
+        engine_failure = (engine_temp > 115) & (u[13] < 0.05 * hazard)
+        
+        # update_brakes
+        heating = 2 + 3 * u[18:22].T
+        cooling = 1 + 2 * u[22:26].T
+        brake_temp = np.where(
+            (push > 70)[:, None], brake_temp + heating, np.maximum(80, brake_temp - cooling)
+        )
+        brake_temp = np.clip(brake_temp, 60, 800)
+        brakes_hot = (brake_temp > 700).any(axis=1)
+        brake_wear = brake_wear - brakes_hot * uniform(14, 3, 6)
+        brake_failure = brakes_hot & (brake_wear < 20) & (u[15] < 0.08)
+        
+        # update_driver_condition
+        base_fatigue = 0.3 * np.where(raining, 1.5, 1.0) * np.where(street, 1.2, 1.0)
+        fatigue = np.minimum(100, fatigue + np.where(in_battle, base_fatigue * 1.3, base_fatigue))
+        focus = np.maximum(60, 100 - fatigue * 0.4) - (mistakes > 3) * 5
+        confidence = np.where(
+            position <= 3, np.minimum(100, confidence + 0.5),
+            np.where(position > s["grid_position"] + 3, np.maximum(20, confidence - 0.3), confidence)
+        )
+        tyre_age += 1
+        
+        # check_incidents
+        crash_chance = (
+            0.25 + (100 - tyre_condition) * 0.025 + (push / 100) * 0.4 +
+            (damage / 100) * 0.8 + (fatigue / 100) * 0.5 + (1 - focus / 100) * 0.6
+        )
+        crash_chance *= TRACKS.incident_table[track_index, weather_index, compound]
+        crash_chance *= hazard
+        crashed = u[16] * 100 < crash_chance
+        
+        failure_chance = (100 - s["reliability"]) * 0.04 + engine_wear * 0.5
+        failure_chance *= np.where(engine_temp > 110, 2.0, 1.0)
+        failure_chance *= hazard
+        failed = u[17] * 100 < failure_chance
+        
+        # Incidents are resolved in grid order because a safety car or VSC
+        # called by one car slows every car processed after it in the same lap
+        owner = np.repeat(np.arange(len(kernels)), counts)
+        safety_car = per_car([r.safety_car for r in races], bool)
+        vsc = per_car([r.virtual_safety_car for r in races], bool)
+        incident_events = {}
+        for i in np.flatnonzero(crashed | failed).tolist():
+            race = races[owner[i]]
+            driver = drivers[i]
+            lap_events, race.lap_events = race.lap_events, []
+            if crashed[i]:
+                race.resolve_crash(driver)
+            if failed[i]:
+                race.resolve_mechanical_failure(driver)
+            incident_events[i] = race.lap_events
+            race.lap_events = lap_events
+            safety_car[i + 1:segment_end[i]] = race.safety_car
+            vsc[i + 1:segment_end[i]] = race.virtual_safety_car
+        
+        # calculate_lap_time
+        lap_time = base_time - dps / 10 - (100 - fuel_load) * 0.018
+        lap_time = np.where(
+            safety_car, base_time + uniform(6, 18, 25),
+            np.where(vsc, base_time + uniform(7, 8, 12), lap_time)
+        )
+        lap_time += damage * 0.06
+        
+        serving_penalty = penalty_time > 0
+        lap_time += serving_penalty * 5
+        lap_time += uniform(8, -0.4, 0.4)
+        
+        sector_times = lap_time[:, None] * sector_split
+        sector_bests = np.minimum(sector_bests, sector_times)
+        
+        lap_time = np.maximum(base_time * 0.75, lap_time)
+        total_time += lap_time
+        
+        fastest = (lap_time < best_lap) & ~safety_car
+        best_lap = np.where(fastest, lap_time, best_lap)
+        laps_led = laps_led + (position == 1)
+        
+        # update_tyre_temperature
+        target_temp = np.where(push > 70, 100.0, np.where(push < 30, 80.0, 90.0))
+        target_temp = np.where(safety_car | vsc, 70.0, target_temp)
+        tyre_temp = np.clip(tyre_temp + (target_temp - tyre_temp) * 0.3 + uniform(9, -2, 2), 60, 120)
+        
+        # update_fuel
+        consumption = fuel_usage * (fuel_mix / 50) * (push / 50) * s["fuel_efficiency"]
+        consumption *= np.where(overtake_mode, 1.3, np.where(eco_mode, 0.7, 1.0))
+        consumption *= np.where(safety_car, 0.25, np.where(vsc, 0.5, 1.0))
+        consumption *= 1 - s["fuel_management"] / 200
+        fuel_load = np.maximum(0, fuel_load - consumption)
+        out_of_fuel = fuel_load < 5
+        
+        # check_pit_window
+        pit_window = ~closing_laps & (pit_window | (tyre_age > 8) | (tyre_condition < 25))
+        
+        lap_state = {
+            "lap": lap, "lap_time": lap_time, "total_time": total_time, "best_lap": best_lap,
+            "laps_led": laps_led.astype(int), "tyre_condition": tyre_condition, "tyre_temp": tyre_temp,
+            "tyre_age": tyre_age.astype(int), "fuel_load": fuel_load, "fuel_per_lap": consumption,
+            "ers_charge": ers_charge, "ers_deployed_lap": ers_deployed, "battery_temp": battery_temp,
+            "engine_temp": engine_temp, "engine_wear_lap": engine_wear, "brake_temp": brake_temp,
+            "brake_wear": brake_wear, "fatigue": fatigue, "focus": focus, "confidence": confidence,
+            "sector_times": sector_times, "sector_bests": sector_bests, "pit_window_open": pit_window,
+        }
+        # Written back field by field; map keeps the per-car loop out of the interpreter
+        for field, column in lap_state.items():
+            deque(map(setattr, drivers, repeat(field), column.tolist()), maxlen=0)
+        
+        offsets = np.cumsum(counts)[:-1]
+        for kernel, part in zip(kernels, np.split(dps, offsets)):
+            kernel.race.dps_cache = dict(zip(kernel.driver_ids, part.tolist()))
+        
+        flagged = (
+            serving_penalty | (fastest & (lap > 3)) | out_of_fuel | ers_exhausted |
+            (battery_hot & ~s["is_ai"]) | engine_failure | brake_failure | crashed | failed
+        )
+        for i in np.flatnonzero(flagged).tolist():
+            kernel = kernels[owner[i]]
+            race = kernel.race
+            driver = drivers[i]
+            if serving_penalty[i]:
+                driver.penalty_time = 0
+                race.log_event("penalty_served", driver)
+            if fastest[i] and lap[i] > 3:
+                race.log_event("fastest_lap", driver, value=(driver.lap_time, driver.lap_time / 3))
+            if out_of_fuel[i]:
+                race.retire_driver(driver, "Out of Fuel")
+                race.log_event("out_of_fuel", driver)
+            if ers_exhausted[i]:
+                driver.ers_mode = "balanced"
+            if battery_hot[i] and not driver.is_ai:
+                driver.radio_messages.append("⚠️ Battery overheating! ERS limited")
+            if engine_failure[i]:
+                race.retire_driver(driver, "Engine Overheating")
+                race.log_event("engine_overheat", driver)
+            if brake_failure[i]:
+                driver.damage_locations["suspension"] += float(kernel.rng.uniform(10, 25))
+                if not driver.is_ai:
+                    driver.radio_messages.append("🚨 Brake failure! Box box!")
+            race.lap_events.extend(incident_events.get(i, ()))
+
+# ============================================================================
+# SECTOR EVENT ENGINE - PRIORITY QUEUE
+# ============================================================================
+
+class SectorEventEngine:
+    """Advances a race sector by sector, in the order cars reach each timing line, from a heap of crossings"""
+    resolves_overtakes = True
+    min_grid = 0
+    SECTOR_NOISE = 0.12
+    # Gaps at a line, as in simulate_overtakes: running together, close enough to try a move, clear
+    BATTLE_GAP = 0.8
+    ATTACK_GAP = 0.3
+    CLEAR_GAP = 2.0
+    PASS_MARGIN = 0.05
+    
+    def __init__(self, race: 'RaceEngine'):
+        self.race = race
+        # Bumped whenever the flags change mid-lap, so sectors timed before it are re-timed
+        self.flag_epoch = 0
+        self.flags_changed_at = 0.0
+        self.attacked = set()
+    
+    def run_lap(self):
+        race = self.race
+        splits = race.sector_lengths
+        last_sector = len(splits) - 1
+        detection_line = max(0, last_sector - 1)
+        
+        queue = []
+        laps = {}
+        self.attacked = set()
+        for order, driver in enumerate(race.running_order):
+            if driver.dnf:
+                continue
+            driver.lap = race.current_lap
+            pace = race.calculate_lap_time(driver, split_sectors=False, flags=False)
+            # Line -1 is the start of the lap, so the roll lands anywhere from the start to the finish
+            laps[driver.id] = (driver.total_time, pace, race.rng.randrange(len(splits) + 1) - 1, [])
+            heapq.heappush(queue, (driver.total_time, order, -1, driver, driver.total_time, self.flag_epoch))
+        
+        last_crossing = [None] * len(splits)
+        while queue:
+            crossing, order, sector, driver, started, epoch = heapq.heappop(queue)
+            if driver.dnf:
                 continue
+            start, pace, incident_line, crossings = laps[driver.id]
             
-            if self.current_lap - driver.last_dm_update < 2:
+            if sector < 0:
+                if incident_line < 0:
+                    self.check_incidents(driver, crossing)
+                if not driver.dnf:
+                    self.schedule(queue, driver, order, 0, crossing, pace)
                 continue
             
-            try:
-                channel = await bot.fetch_channel(driver.dm_channel_id)
-                
-                embed = discord.Embed(
-                    title=f"🏎️ Lap {self.current_lap}/{self.total_laps}",
-                    color=discord.Color.blue()
-                )
-                
-                embed.add_field(name="Position", value=f"**P{driver.position}**", inline=True)
-                embed.add_field(
-                    name="Gap",
-                    value=f"+{driver.gap_to_leader:.2f}s" if driver.position > 1 else "Leader",
-                    inline=True
-                )
-                embed.add_field(name="Last Lap", value=f"{driver.lap_time:.3f}s", inline=True)
-                
-                tyre_emoji = {"soft": "🔴", "medium": "🟡", "hard": "⚪", "inter": "🟢", "wet": "🔵"}
-                embed.add_field(
-                    name="Tyres",
-                    value=f"{tyre_emoji.get(driver.tyre_compound, '⚪')} {driver.tyre_compound.upper()} ({driver.tyre_condition:.0f}%)",
-                    inline=True
+            if epoch != self.flag_epoch and started < self.flags_changed_at < crossing:
+                # Run what is left of the sector under the new flags
+                left = (crossing - self.flags_changed_at) / (crossing - started)
+                self.schedule(queue, driver, order, sector, self.flags_changed_at, pace, left)
+                continue
+            
+            racing = not (race.safety_car or race.virtual_safety_car)
+            previous = last_crossing[sector]
+            if previous is None:
+                driver.gap_to_front = 0.0
+            else:
+                ahead_crossing, ahead = previous
+                gap = crossing - ahead_crossing
+                if not racing or gap > self.CLEAR_GAP:
+                    driver.in_battle = ahead.in_battle = False
+                elif gap < self.BATTLE_GAP and ahead.position < driver.position and not ahead.dnf:
+                    crossing = self.battle(driver, ahead, crossing, ahead_crossing, gap)
+                driver.gap_to_front = max(0.0, crossing - ahead_crossing)
+                if racing and race.drs_enabled and sector == detection_line:
+                    driver.drs_available = driver.gap_to_front < race.drs_gap_threshold
+            
+            if previous is None or crossing > previous[0]:
+                last_crossing[sector] = (crossing, driver)
+            
+            crossings.append(crossing)
+            if sector < last_sector:
+                if sector == incident_line:
+                    self.check_incidents(driver, crossing)
+                    if driver.dnf:
+                        continue
+                self.schedule(queue, driver, order, sector + 1, crossing, pace)
+                continue
+            
+            race.record_sectors(driver, [
+                crossings[idx] - (crossings[idx - 1] if idx else start) for idx in range(len(crossings))
+            ])
+            race.complete_driver_lap(driver, crossing - start, incidents=False)
+            if sector == incident_line:
+                self.check_incidents(driver, crossing)
+    
+    def schedule(self, queue: list, driver: Driver, order: int, sector: int, started: float, pace: float,
+                 share: float = 1.0):
+        """Queue the car's next crossing, timing the sector under the flags out now"""
+        race = self.race
+        neutralised = race.neutralised_lap_time()
+        lap_time = pace if neutralised is None else max(pace, neutralised)
+        sector_time = lap_time * race.sector_lengths[sector] + race.rng.uniform(-self.SECTOR_NOISE, self.SECTOR_NOISE)
+        heapq.heappush(queue, (started + sector_time * share, order, sector, driver, started, self.flag_epoch))
+    
+    def check_incidents(self, driver: Driver, crossing: float):
+        race = self.race
+        flags = (race.safety_car, race.virtual_safety_car)
+        race.check_incidents(driver)
+        if (race.safety_car, race.virtual_safety_car) != flags:
+            self.flag_epoch += 1
+            self.flags_changed_at = crossing
+    
+    def battle(self, attacker: Driver, defender: Driver, crossing: float, defender_crossing: float,
+               gap: float) -> float:
+        """Resolve a move at a timing line and return the attacker's crossing time"""
+        race = self.race
+        attacker.in_battle = defender.in_battle = True
+        attacker.battle_partner = defender.name
+        defender.battle_partner = attacker.name
+        attacker.attacking = True
+        defender.defending = True
+        
+        # A car is in at most one move a lap, at the odds simulate_overtakes gives it
+        if gap >= self.ATTACK_GAP or attacker.id in self.attacked or defender.id in self.attacked:
+            return crossing
+        self.attacked.update((attacker.id, defender.id))
+        if race.rng.random() * 100 >= race.calculate_overtake_chance(attacker, defender):
+            return crossing
+        
+        position = attacker.position
+        race.execute_overtake(attacker, defender)
+        if attacker.position < position:
+            return defender_crossing - self.PASS_MARGIN
+        return crossing
+
+LAP_KERNELS = {"vector": VectorLapKernel, "sector": SectorEventEngine}
+
+# ============================================================================
+# QUALIFYING - KNOCKOUT SESSIONS
+# ============================================================================
+
+class QualifyingSession:
+    """Q1/Q2/Q3 knockout qualifying with every run of every driver drawn as one numpy batch"""
+    SESSIONS = ("Q1", "Q2", "Q3")
+    RUNS = (3, 3, 2)
+    # Cars through to Q2 and Q3 on a full grid, scaled down for small grids
+    CUTS = (15, 10)
+    
+    COMPOUNDS = ("soft", "medium", "inter", "wet")
+    COMPOUND_DELTAS = np.array([0.0, 0.35, 0.0, 0.0])
+    # Q2 pace margin a car needs over the Q3 cut to bank its lap on mediums
+    MEDIUM_MARGIN = 0.6
+    
+    SESSION_EVOLUTION = 0.15
+    RUN_EVOLUTION = 0.05
+    MISTAKE_CHANCE = 0.04
+    RAIN_NOISE = 1.5
+    
+    def __init__(self, race: 'RaceEngine'):
+        self.race = race
+        self.key = (race.grid_version, race.compiled_key)
+        self.drivers = [d for d in race.drivers if not d.dnf]
+        self.best = None
+        self.compounds = None
+        self.knocked_out: List[List[int]] = []
+        self.classification: List[tuple] = []
+    
+    def cut_sizes(self, count: int) -> tuple:
+        return min(self.CUTS[0], (count * 3 + 3) // 4), min(self.CUTS[1], (count + 1) // 2)
+    
+    def choose_compounds(self, pace: np.ndarray, q3_size: int) -> np.ndarray:
+        """Compound per session and driver: inters or wets in the rain, softs otherwise"""
+        race = self.race
+        compounds = np.zeros((len(self.SESSIONS), len(pace)), dtype=int)
+        if race.raining:
+            compounds[:] = self.COMPOUNDS.index("wet" if race.weather == "heavy_rain" else "inter")
+        elif len(pace) > q3_size:
+            cut_pace = np.sort(pace)[q3_size]
+            mediums = pace + self.COMPOUND_DELTAS[1] + self.MEDIUM_MARGIN < cut_pace
+            compounds[1, mediums] = self.COMPOUNDS.index("medium")
+        return compounds
+    
+    def simulate(self):
+        """Draw every flying lap of the session, then run the knockouts on the best times"""
+        race = self.race
+        count = len(self.drivers)
+        q2_size, q3_size = self.cut_sizes(count)
+        rng = np.random.default_rng(race.rng.getrandbits(64))
+        shape = (len(self.SESSIONS), max(self.RUNS), count)
+        
+        pace = np.array([d.quali_pace for d in self.drivers], dtype=float)
+        consistency_var = (100 - np.array([d.consistency for d in self.drivers], dtype=float)) / 150
+        self.compounds = self.choose_compounds(pace, q3_size)
+        
+        # Grip builds up over the sessions, the runs and the queue within a run
+        evolution = (
+            np.arange(shape[0])[:, None, None] * self.SESSION_EVOLUTION +
+            np.arange(shape[1])[None, :, None] * self.RUN_EVOLUTION +
+            rng.random(shape) * self.RUN_EVOLUTION
+        )
+        times = (
+            pace +
+            rng.uniform(-1, 1, shape) * consistency_var +
+            rng.uniform(-0.15, 0.05, shape) +
+            rng.uniform(-0.3, 0.3, shape) * (self.RAIN_NOISE if race.raining else 1.0) +
+            self.COMPOUND_DELTAS[self.compounds][:, None, :] -
+            evolution
+        )
+        times[rng.random(shape) < self.MISTAKE_CHANCE * (1 + consistency_var)] = np.inf
+        for session, runs in enumerate(self.RUNS):
+            times[session, runs:] = np.inf
+        
+        best = times.min(axis=1)
+        running = np.arange(count)
+        self.knocked_out = []
+        for session, size in enumerate((q2_size, q3_size, 0)):
+            order = running[np.argsort(best[session, running], kind="stable")]
+            if session + 1 < len(self.SESSIONS):
+                best[session + 1:, order[size:]] = np.nan
+            self.knocked_out.append(order[size:].tolist() if size else [])
+            running = order[:size] if size else order
+        self.best = best
+        
+        # Q3 order first, then the Q2 and Q1 knockouts on the time that eliminated them
+        self.classification = [(self.drivers[i], float(best[2, i])) for i in running.tolist()]
+        for session in (1, 0):
+            self.classification += [(self.drivers[i], float(best[session, i])) for i in self.knocked_out[session]]
+
+# ============================================================================
+# WEATHER FORECAST SERVICE
+# ============================================================================
+
+class WeatherForecastService:
+    """Weather ensembles per track and hourly session window, shared by every race in that window"""
+    STATES = tuple(RaceEngine.WEATHER_TRANSITIONS)
+    ENSEMBLE_SIZE = 32
+    ENSEMBLE_LAPS = 60
+    ENSEMBLE_HISTORY = 200
+    
+    def __init__(self, db: 'Database'):
+        self.db = db
+        self.rng = np.random.default_rng()
+        self.ensembles: Dict[tuple, List[List[str]]] = {}
+        # Ensembles are fetched from the repository threads, one window at a time
+        self.lock = threading.Lock()
+        
+        self.matrix = np.array([
+            [RaceEngine.WEATHER_TRANSITIONS[current].get(state, 0.0) for state in self.STATES]
+            for current in self.STATES
+        ])
+        self.cumulative = np.cumsum(self.matrix, axis=1)
+        self.cumulative[:, -1] = 1.0
+        
+        # Distribution over the weather n laps ahead is row n of the matrix powers
+        horizon = RaceEngine.ENDURANCE_MAX_LAPS
+        self.powers = np.empty((horizon + 1, len(self.STATES), len(self.STATES)))
+        self.powers[0] = np.eye(len(self.STATES))
+        for lap in range(1, horizon + 1):
+            self.powers[lap] = self.powers[lap - 1] @ self.matrix
+        
+        self.rain_states = np.array(["rain" in state for state in self.STATES])
+        self.state_temps = np.array([sum(RaceEngine.WEATHER_TEMPS[state]) / 2 for state in self.STATES])
+        self.state_grip = np.array([RaceEngine.WEATHER_GRIP[state] for state in self.STATES], dtype=float)
+    
+    @staticmethod
+    def session_window() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:00")
+    
+    def outlook(self, weather: str, laps: int) -> np.ndarray:
+        """Probability of each weather state on laps 0..laps, starting from the given weather"""
+        laps = min(laps, len(self.powers) - 1)
+        return self.powers[:laps + 1, self.STATES.index(weather)]
+    
+    def rain_probability(self, weather: str, laps: int) -> np.ndarray:
+        return self.outlook(weather, laps)[:, self.rain_states].sum(axis=1)
+    
+    def sample_ensemble(self, weather: str) -> List[List[str]]:
+        """Walk ENSEMBLE_SIZE Markov chains at once, one lap per step"""
+        states = np.empty((self.ENSEMBLE_SIZE, self.ENSEMBLE_LAPS + 1), dtype=int)
+        states[:, 0] = self.STATES.index(weather)
+        draws = self.rng.random((self.ENSEMBLE_SIZE, self.ENSEMBLE_LAPS))
+        for lap in range(self.ENSEMBLE_LAPS):
+            states[:, lap + 1] = (draws[:, lap, None] > self.cumulative[states[:, lap]]).sum(axis=1)
+        return [[self.STATES[i] for i in member] for member in states.tolist()]
+    
+    def get_ensemble(self, track: str, weather: str) -> Optional[List[List[str]]]:
+        """Ensemble for the current session window, loaded from or stored in weather_forecasts"""
+        if weather not in self.STATES:
+            return None
+        
+        key = (track, self.session_window(), weather)
+        with self.lock:
+            return self.ensembles.get(key) or self.load_ensemble(key)
+    
+    def load_ensemble(self, key: tuple) -> List[List[str]]:
+        track, window, weather = key
+        conn = self.db.get_conn()
+        c = conn.cursor()
+        c.execute(Database.HOT_QUERIES['forecast_window'], key)
+        row = c.fetchone()
+        conn.close()
+        
+        if row:
+            ensemble = json.loads(row[0])
+        else:
+            ensemble = self.sample_ensemble(weather)
+            outlook = self.outlook(weather, self.ENSEMBLE_LAPS)
+            with self.db.writer() as writer:
+                writer.execute(
+                    """INSERT INTO weather_forecasts
+                       (track, forecast_date, start_weather, hourly_forecast, temperature, precipitation_chance,
+                       track_temp_forecast, grip_forecast)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (track, window, weather, json.dumps(ensemble), float(self.state_temps[self.STATES.index(weather)]),
+                     float(self.rain_probability(weather, self.ENSEMBLE_LAPS).mean() * 100),
+                     json.dumps([round(t, 1) for t in (outlook @ self.state_temps).tolist()]),
+                     json.dumps([round(g, 1) for g in (outlook @ self.state_grip).tolist()]))
                 )
-                embed.add_field(name="Fuel", value=f"{driver.fuel_load:.0f}%", inline=True)
-                embed.add_field(name="ERS", value=f"{driver.ers_charge:.0f}%", inline=True)
-                
-                if driver.drs_available:
-                    embed.add_field(name="DRS", value="✅ Available", inline=True)
-                
-                if driver.radio_messages:
-                    recent_messages = driver.radio_messages[-3:]
-                    embed.add_field(
-                        name="📻 Team Radio",
-                        value="\n".join(recent_messages),
-                        inline=False
-                    )
-                    driver.radio_messages = driver.radio_messages[-5:]
-                
-                view = RaceControlView(embed.add_field(
-                        name="📻 Team Radio",
-                        value="\n".join(recent_messages),
-                        inline=False
-                    )
-                    driver.radio_messages = driver.radio_messages[-5:]
-                
-                view = RaceControlView(driver, self)
-                await channel.send(embed=embed, view=view)
-                
-                driver.last_dm_update = self.current_lap
-                
-            except Exception as e:
-                print(f"Error sending DM to {driver.name}: {e}")
+        
+        self.ensembles[key] = ensemble
+        if len(self.ensembles) > self.ENSEMBLE_HISTORY:
+            self.ensembles.pop(next(iter(self.ensembles)))
+        return ensemble
+
+# ============================================================================
+# STRATEGY ADVISOR - MONTE CARLO ROLLOUTS
+# ============================================================================
+
+STRATEGY_PLANS = ["stay_out", "soft", "medium", "hard", "inter", "wet"]
+STRATEGY_BUDGET = float(os.getenv('STRATEGY_BUDGET', '1.5'))
+STRATEGY_ROLLOUTS = int(os.getenv('STRATEGY_ROLLOUTS', '2000'))
+# Simulated laps per plan in one batch; long races run fewer rollouts per batch
+STRATEGY_BATCH_LAPS = 400
+
+strategy_pool = None
+
+def get_strategy_pool():
+    """Rollout worker pool, created on first use"""
+    global strategy_pool
+    if strategy_pool is None:
+        try:
+            # Like the race workers, rollouts start from a fresh interpreter rather than forking the bot's threads
+            strategy_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        except (OSError, NotImplementedError):
+            strategy_pool = ThreadPoolExecutor(max_workers=2)
+    return strategy_pool
+
+async def warm_strategy_pool():
+    """Start every rollout worker up front, so the spawn start-up never eats into STRATEGY_BUDGET"""
+    loop = asyncio.get_running_loop()
+    pool = get_strategy_pool()
+    await asyncio.gather(*[loop.run_in_executor(pool, os.getpid) for _ in range(os.cpu_count() or 2)])
+
+def run_strategy_rollouts(snapshot: bytes, driver_id: int, seeds: List[int], deadline: float) -> Dict[str, List[int]]:
+    """Finishing positions of one driver for every plan, sharing seeds across plans"""
+    positions = {plan: [] for plan in STRATEGY_PLANS}
+    state = pickle.loads(snapshot)
+    batch = max(1, STRATEGY_BATCH_LAPS // max(1, state["total_laps"] - state["current_lap"]))
+    
+    for start in range(0, len(seeds), batch):
+        rollouts = []
+        for plan in STRATEGY_PLANS:
+            for seed in seeds[start:start + batch]:
+                race = RaceEngine.from_snapshot(snapshot, seed=seed, kernel="vector")
+                # Rollouts step together, so even a small grid fills the kernel's columns
+                race.lap_kernel.min_grid = 0
+                driver = next(d for d in race.drivers if d.id == driver_id)
+                if plan != "stay_out":
+                    race.apply_input(driver, "pit", plan)
+                # After the call being scored, the player's car follows the AI strategy
+                race.autopilot.add(driver_id)
+                rollouts.append((plan, race, driver))
+        
+        running = [race for _, race, _ in rollouts]
+        while running:
+            # An unfinished batch is dropped so every plan keeps the same seeds
+            if time.time() >= deadline:
+                return positions
+            RaceEngine.step_batch(running)
+            running = [race for race in running if not race.race_finished]
+        
+        for plan, race, driver in rollouts:
+            positions[plan].append(len(race.drivers) if driver.dnf else driver.position)
+    
+    return positions
+
+async def analyse_strategy(race: RaceEngine, driver: Driver) -> Dict[str, Dict[str, float]]:
+    """Expected finishing position per pit plan, from rollouts run off the event loop"""
+    snapshot = race.snapshot()
+    workers = os.cpu_count() or 2
+    deadline = time.time() + STRATEGY_BUDGET
+    base_seed = race.seed + race.current_lap * STRATEGY_ROLLOUTS
+    seeds = list(range(base_seed, base_seed + STRATEGY_ROLLOUTS))
+    
+    loop = asyncio.get_running_loop()
+    pool = get_strategy_pool()
+    chunks = await asyncio.gather(*[
+        loop.run_in_executor(pool, run_strategy_rollouts, snapshot, driver.id, seeds[i::workers], deadline)
+        for i in range(workers)
+    ])
+    
+    summary = {}
+    for plan in STRATEGY_PLANS:
+        positions = np.array([p for chunk in chunks for p in chunk[plan]], dtype=float)
+        if len(positions) == 0:
+            continue
+        
+        mean = positions.mean()
+        margin = 1.96 * positions.std(ddof=1) / np.sqrt(len(positions)) if len(positions) > 1 else 0.0
+        summary[plan] = {
+            'mean': float(mean),
+            'low': float(mean - margin),
+            'high': float(mean + margin),
+            'points': float((positions <= 10).mean() * 100),
+            'rollouts': len(positions)
+        }
+    
+    return summary
 
 # ============================================================================
 # DM RACE CONTROL VIEWS
@@ -1963,8 +3944,7 @@ class RaceControlView(discord.ui.View):
             await interaction.response.send_message("Race is finished!", ephemeral=True)
             return
         
-        self.race.pit_stop(self.driver, "Player Request - Soft")
-        self.driver.tyre_compound = "soft"
+        self.race.apply_input(self.driver, "pit", "soft")
         await interaction.response.send_message("✅ Pitting for SOFT tyres!", ephemeral=True)
     
     @discord.ui.button(label="🟡 Medium Tyres", style=discord.ButtonStyle.secondary, row=0)
@@ -1973,8 +3953,7 @@ class RaceControlView(discord.ui.View):
             await interaction.response.send_message("Race is finished!", ephemeral=True)
             return
         
-        self.race.pit_stop(self.driver, "Player Request - Medium")
-        self.driver.tyre_compound = "medium"
+        self.race.apply_input(self.driver, "pit", "medium")
         await interaction.response.send_message("✅ Pitting for MEDIUM tyres!", ephemeral=True)
     
     @discord.ui.button(label="⚪ Hard Tyres", style=discord.ButtonStyle.secondary, row=0)
@@ -1983,8 +3962,7 @@ class RaceControlView(discord.ui.View):
             await interaction.response.send_message("Race is finished!", ephemeral=True)
             return
         
-        self.race.pit_stop(self.driver, "Player Request - Hard")
-        self.driver.tyre_compound = "hard"
+        self.race.apply_input(self.driver, "pit", "hard")
         await interaction.response.send_message("✅ Pitting for HARD tyres!", ephemeral=True)
     
     @discord.ui.button(label="🟢 Inters", style=discord.ButtonStyle.success, row=0)
@@ -1993,8 +3971,7 @@ class RaceControlView(discord.ui.View):
             await interaction.response.send_message("Race is finished!", ephemeral=True)
             return
         
-        self.race.pit_stop(self.driver, "Player Request - Inters")
-        self.driver.tyre_compound = "inter"
+        self.race.apply_input(self.driver, "pit", "inter")
         await interaction.response.send_message("✅ Pitting for INTERMEDIATE tyres!", ephemeral=True)
     
     @discord.ui.button(label="🔵 Wets", style=discord.ButtonStyle.primary, row=0)
@@ -2003,14 +3980,12 @@ class RaceControlView(discord.ui.View):
             await interaction.response.send_message("Race is finished!", ephemeral=True)
             return
         
-        self.race.pit_stop(self.driver, "Player Request - Wets")
-        self.driver.tyre_compound = "wet"
+        self.race.apply_input(self.driver, "pit", "wet")
         await interaction.response.send_message("✅ Pitting for WET tyres!", ephemeral=True)
     
     @discord.ui.button(label="⚡ Push Mode", style=discord.ButtonStyle.danger, row=1)
     async def push_mode(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.driver.push_mode = min(100, self.driver.push_mode + 20)
-        self.driver.fuel_mix = min(100, self.driver.fuel_mix + 15)
+        self.race.apply_input(self.driver, "push")
         await interaction.response.send_message(
             f"✅ PUSH MODE! Push: {self.driver.push_mode}% | Fuel: {self.driver.fuel_mix}%",
             ephemeral=True
@@ -2018,8 +3993,7 @@ class RaceControlView(discord.ui.View):
     
     @discord.ui.button(label="🔋 Conserve", style=discord.ButtonStyle.success, row=1)
     async def conserve_mode(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.driver.push_mode = max(30, self.driver.push_mode - 20)
-        self.driver.fuel_mix = max(30, self.driver.fuel_mix - 15)
+        self.race.apply_input(self.driver, "conserve")
         await interaction.response.send_message(
             f"✅ CONSERVE MODE! Push: {self.driver.push_mode}% | Fuel: {self.driver.fuel_mix}%",
             ephemeral=True
@@ -2031,7 +4005,7 @@ class RaceControlView(discord.ui.View):
             await interaction.response.send_message("❌ Not enough ERS charge!", ephemeral=True)
             return
         
-        self.driver.ers_mode = "deploy"
+        self.race.apply_input(self.driver, "ers", "deploy")
         await interaction.response.send_message(
             f"✅ ERS DEPLOY MODE! Charge: {self.driver.ers_charge:.0f}%",
             ephemeral=True
@@ -2039,13 +4013,12 @@ class RaceControlView(discord.ui.View):
     
     @discord.ui.button(label="🔌 ERS Charge", style=discord.ButtonStyle.secondary, row=1)
     async def ers_charge(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.driver.ers_mode = "charging"
+        self.race.apply_input(self.driver, "ers", "charging")
         await interaction.response.send_message("✅ ERS CHARGING MODE!", ephemeral=True)
     
     @discord.ui.button(label="🏎️ Overtake Mode", style=discord.ButtonStyle.danger, row=2)
     async def overtake_mode(self, interaction: discord.Interaction, button: discord.ui.Button):
-        self.driver.engine_mode = "overtake"
-        self.driver.push_mode = 95
+        self.race.apply_input(self.driver, "overtake")
         await interaction.response.send_message(
             "✅ OVERTAKE MODE ACTIVATED! Maximum attack!",
             ephemeral=True
@@ -2062,6 +4035,13 @@ class RaceControlView(discord.ui.View):
         embed.add_field(name="Gap to Leader", value=f"+{self.driver.gap_to_leader:.2f}s", inline=True)
         embed.add_field(name="Gap to Front", value=f"+{self.driver.gap_to_front:.2f}s", inline=True)
         
+        if not self.driver.dnf:
+            ahead = self.race.car_ahead(self.driver)
+            behind = self.race.car_behind(self.driver)
+            embed.add_field(name="Car Ahead", value=ahead.name if ahead else "-", inline=True)
+            embed.add_field(name="Car Behind", value=behind.name if behind else "-", inline=True)
+            embed.add_field(name="Within 1s", value=f"{len(self.race.cars_within(self.driver, 1.0))} cars", inline=True)
+        
         embed.add_field(name="Tyre Condition", value=f"{self.driver.tyre_condition:.1f}%", inline=True)
         embed.add_field(name="Tyre Age", value=f"{self.driver.tyre_age} laps", inline=True)
         embed.add_field(name="Tyre Temp", value=f"{self.driver.tyre_temp:.0f}°C", inline=True)
@@ -2083,12 +4063,97 @@ class RaceControlView(discord.ui.View):
         embed.add_field(name="DRS", value="✅" if self.driver.drs_available else "❌", inline=True)
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    @discord.ui.button(label="🧠 Strategy", style=discord.ButtonStyle.secondary, row=2)
+    async def strategy(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.race.race_finished or self.driver.dnf:
+            await interaction.response.send_message("No strategy calls left to make!", ephemeral=True)
+            return
+        
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
+        try:
+            summary = await analyse_strategy(self.race, self.driver)
+        except Exception as e:
+            print(f"Error running strategy rollouts for {self.driver.name}: {e}")
+            await interaction.followup.send("❌ Strategy model unavailable right now", ephemeral=True)
+            return
+        
+        if not summary:
+            await interaction.followup.send("❌ Not enough time to simulate the rest of this race", ephemeral=True)
+            return
+        
+        plan_names = {
+            "stay_out": "🛣️ Stay Out", "soft": "🔴 Pit - Soft", "medium": "🟡 Pit - Medium",
+            "hard": "⚪ Pit - Hard", "inter": "🟢 Pit - Inters", "wet": "🔵 Pit - Wets"
+        }
+        best_plan = min(summary, key=lambda plan: summary[plan]['mean'])
+        
+        embed = discord.Embed(
+            title=f"🧠 Strategy - Lap {self.race.current_lap}/{self.race.total_laps}",
+            description=f"Recommended: **{plan_names[best_plan]}**",
+            color=discord.Color.purple()
+        )
+        
+        for plan, result in summary.items():
+            embed.add_field(
+                name=plan_names[plan],
+                value=f"P{result['mean']:.1f} (P{result['low']:.1f}-P{result['high']:.1f})\n"
+                      f"Points: {result['points']:.0f}% | {result['rollouts']} runs",
+                inline=True
+            )
+        
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+class EmbedPaginator(discord.ui.View):
+    def __init__(self, pages: List[discord.Embed]):
+        super().__init__(timeout=600)
+        self.pages = pages
+        self.index = 0
+    
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.index = (self.index - 1) % len(self.pages)
+        await interaction.response.edit_message(embed=self.pages[self.index], view=self)
+    
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.index = (self.index + 1) % len(self.pages)
+        await interaction.response.edit_message(embed=self.pages[self.index], view=self)
+
+class MassRaceLobbyView(discord.ui.View):
+    def __init__(self, max_players: int, timeout: float):
+        super().__init__(timeout=timeout)
+        self.max_players = max_players
+        self.players: Dict[int, discord.User] = {}
+    
+    @discord.ui.button(label="🏎️ Join Grid", style=discord.ButtonStyle.success)
+    async def join(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id in self.players:
+            await interaction.response.send_message("You're already on the grid!", ephemeral=True)
+            return
+        
+        if len(self.players) >= self.max_players:
+            await interaction.response.send_message("❌ The grid is full!", ephemeral=True)
+            return
+        
+        if not await repository.is_registered(interaction.user.id):
+            await interaction.response.send_message("❌ You need to register first! Use `/register`", ephemeral=True)
+            return
+        
+        self.players[interaction.user.id] = interaction.user
+        await interaction.response.send_message(
+            f"✅ You're on the grid! ({len(self.players)}/{self.max_players})",
+            ephemeral=True
+        )
 
 # ============================================================================
 # RACE MANAGER - HANDLES LIVE RACE DISPLAY
 # ============================================================================
 
 class RaceManager:
+    RESULTS_PAGE_SIZE = 20
+    
     def __init__(self, race: RaceEngine, channel: discord.TextChannel):
         self.race = race
         self.channel = channel
@@ -2131,65 +4196,57 @@ class RaceManager:
         
         await self.channel.send(embed=embed)
         
-    async def update_leaderboard(self):
+    async def update_leaderboard(self, result: LapResult):
         """Update race leaderboard"""
-        active_drivers = sorted([d for d in self.race.drivers if not d.dnf], key=lambda x: x.position)
-        
         embed = discord.Embed(
-            title=f"🏁 LAP {self.race.current_lap}/{self.race.total_laps} - {self.race.track}",
-            color=discord.Color.gold() if not self.race.safety_car else discord.Color.orange()
+            title=f"🏁 LAP {result.lap}/{result.total_laps} - {self.race.track}",
+            color=discord.Color.gold() if not result.safety_car else discord.Color.orange()
         )
         
-        weather_emoji = {
-            "clear": "☀️", "partly_cloudy": "⛅", "cloudy": "☁️",
-            "light_rain": "🌦️", "rain": "🌧️", "heavy_rain": "⛈️"
-        }
-        
         status = ""
-        if self.race.safety_car:
+        if result.safety_car:
             status = "🚨 SAFETY CAR"
-        elif self.race.virtual_safety_car:
+        elif result.virtual_safety_car:
             status = "🟡 VIRTUAL SAFETY CAR"
-        elif self.race.drs_enabled:
+        elif result.drs_enabled:
             status = "💨 DRS ENABLED"
         else:
             status = "🟢 GREEN FLAG"
         
-        embed.description = f"{weather_emoji.get(self.race.weather, '☀️')} {self.race.weather.replace('_', ' ').title()} | {status}"
+        embed.description = f"{RaceEngine.WEATHER_EMOJI.get(result.weather, '☀️')} {result.weather.replace('_', ' ').title()} | {status}"
         
         # Leaderboard
         leaderboard = ""
-        for i, driver in enumerate(active_drivers[:20]):
-            pos_emoji = {1: "🥇", 2: "🥈", 3: "🥉"}.get(driver.position, f"`P{driver.position:2d}`")
+        for position, name, is_ai, tyre_compound, gap_to_leader, drs_available, in_battle in result.leaderboard:
+            pos_emoji = {1: "🥇", 2: "🥈", 3: "🥉"}.get(position, f"`P{position:2d}`")
             
-            tire_emoji = {"soft": "🔴", "medium": "🟡", "hard": "⚪", "inter": "🟢", "wet": "🔵"}
-            tire_icon = tire_emoji.get(driver.tyre_compound, "⚪")
+            tire_icon = RaceEngine.COMPOUND_EMOJI.get(tyre_compound, "⚪")
             
-            gap = f"+{driver.gap_to_leader:.2f}s" if driver.position > 1 else "Leader"
+            gap = f"+{gap_to_leader:.2f}s" if position > 1 else "Leader"
             
-            drs = "💨" if driver.drs_available else ""
-            battle = "⚔️" if driver.in_battle else ""
+            drs = "💨" if drs_available else ""
+            battle = "⚔️" if in_battle else ""
             
-            name_display = f"**{driver.name}**" if not driver.is_ai else driver.name
+            name_display = f"**{name}**" if not is_ai else name
             
             leaderboard += f"{pos_emoji} {name_display} {tire_icon} {gap} {drs}{battle}\n"
         
         embed.add_field(name="Positions", value=leaderboard or "No active drivers", inline=False)
         
         # DNFs
-        dnf_drivers = [d for d in self.race.drivers if d.dnf]
-        if dnf_drivers:
+        if result.retired:
             dnf_text = ""
-            for driver in dnf_drivers:
-                dnf_text += f"❌ {driver.name} - {driver.dnf_reason}\n"
+            for name, dnf_reason in result.retired[:10]:
+                dnf_text += f"❌ {name} - {dnf_reason}\n"
+            if len(result.retired) > 10:
+                dnf_text += f"... and {len(result.retired) - 10} more\n"
             embed.add_field(name="DNF", value=dnf_text, inline=False)
         
         # Race Stats
-        if active_drivers:
-            fastest = min(active_drivers, key=lambda x: x.best_lap)
+        if result.fastest:
             embed.add_field(
                 name="⏱️ Fastest Lap",
-                value=f"{fastest.name} - {fastest.best_lap:.3f}s",
+                value=f"{result.fastest[0]} - {result.fastest[1]:.3f}s",
                 inline=True
             )
         
@@ -2201,56 +4258,128 @@ class RaceManager:
         else:
             self.leaderboard_message = await self.channel.send(embed=embed)
     
-    async def send_lap_events(self):
+    async def send_lap_events(self, result: LapResult):
         """Send lap events"""
-        if not self.race.lap_events:
+        if not result.events:
             return
         
-        events_text = "\n".join(self.race.lap_events[:15])
+        # A block of endurance laps shows its most recent events
+        if result.first_lap != result.lap:
+            events = result.events[-15:]
+            laps = f"Laps {result.first_lap}-{result.lap}"
+        else:
+            events = result.events[:15]
+            laps = f"Lap {result.lap}"
+        events_text = "\n".join(self.race.render_events(events))
         
         embed = discord.Embed(
-            title=f"📻 Lap {self.race.current_lap} Events",
+            title=f"📻 {laps} Events",
             description=events_text,
             color=discord.Color.blue()
         )
         
         await self.channel.send(embed=embed)
     
-    async def send_race_results(self, db: Database):
+    async def send_dm_updates(self, bot):
+        """Send race updates to drivers' DMs"""
+        for driver in self.race.drivers:
+            if driver.is_ai or not driver.dm_channel_id:
+                continue
+            
+            if self.race.current_lap - driver.last_dm_update < 2:
+                continue
+            
+            try:
+                channel = await bot.fetch_channel(driver.dm_channel_id)
+                
+                embed = discord.Embed(
+                    title=f"🏎️ Lap {self.race.current_lap}/{self.race.total_laps}",
+                    color=discord.Color.blue()
+                )
+                
+                embed.add_field(name="Position", value=f"**P{driver.position}**", inline=True)
+                embed.add_field(
+                    name="Gap",
+                    value=f"+{driver.gap_to_leader:.2f}s" if driver.position > 1 else "Leader",
+                    inline=True
+                )
+                embed.add_field(name="Last Lap", value=f"{driver.lap_time:.3f}s", inline=True)
+                
+                embed.add_field(
+                    name="Tyres",
+                    value=f"{RaceEngine.COMPOUND_EMOJI.get(driver.tyre_compound, '⚪')} {driver.tyre_compound.upper()} ({driver.tyre_condition:.0f}%)",
+                    inline=True
+                )
+                embed.add_field(name="Fuel", value=f"{driver.fuel_load:.0f}%", inline=True)
+                embed.add_field(name="ERS", value=f"{driver.ers_charge:.0f}%", inline=True)
+                
+                if driver.drs_available:
+                    embed.add_field(name="DRS", value="✅ Available", inline=True)
+                
+                if driver.radio_messages:
+                    recent_messages = list(driver.radio_messages)[-3:]
+                    embed.add_field(
+                        name="📻 Team Radio",
+                        value="\n".join(recent_messages),
+                        inline=False
+                    )
+                
+                view = RaceControlView(driver, self.race)
+                await channel.send(embed=embed, view=view)
+                
+                driver.last_dm_update = self.race.current_lap
+                
+            except Exception as e:
+                print(f"Error sending DM to {driver.name}: {e}")
+    
+    async def render_lap(self, result: LapResult, bot):
+        """Render a lap result to the race channel and driver DMs"""
+        await self.update_leaderboard(result)
+        await self.send_lap_events(result)
+        await self.send_dm_updates(bot)
+    
+    async def play_back(self, results: List[LapResult], lap_interval: float, writer: ResultWriter, save: bool = True):
+        """Stream a precomputed race to the channel, or only its results when lap_interval is 0"""
+        try:
+            if lap_interval > 0:
+                for result in results:
+                    await self.update_leaderboard(result)
+                    await self.send_lap_events(result)
+                    await asyncio.sleep(lap_interval)
+            await self.send_race_results(writer, save=save)
+        except Exception as e:
+            print(f"Error playing back race in channel {self.channel.id}: {e}")
+    
+    async def send_race_results(self, writer: ResultWriter, save: bool = True):
         """Send final race results"""
         all_drivers = sorted(self.race.drivers, key=lambda x: (x.dnf, x.position))
-        
-        embed = discord.Embed(
-            title=f"🏁 RACE RESULTS - {self.race.track}",
-            color=discord.Color.gold()
-        )
+        finishers = [d for d in all_drivers if not d.dnf]
+        fastest = min(finishers, key=lambda x: x.best_lap) if finishers else None
         
         # Points system
         points_system = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
         
-        results = ""
+        lines = []
         for driver in all_drivers:
             if driver.dnf:
-                results += f"❌ `DNF ` {driver.name} - {driver.dnf_reason}\n"
+                lines.append(f"❌ `DNF ` {driver.name} - {driver.dnf_reason}")
             else:
                 pos_emoji = {1: "🥇", 2: "🥈", 3: "🥉"}.get(driver.position, f"`P{driver.position:2d}`")
                 points = points_system[driver.position - 1] if driver.position <= 10 else 0
                 
                 # Fastest lap bonus
-                fastest = min([d for d in all_drivers if not d.dnf], key=lambda x: x.best_lap)
                 if driver.id == fastest.id and driver.position <= 10:
                     points += 1
-                    results += f"{pos_emoji} {driver.name} - {points}pts ⚡\n"
+                    lines.append(f"{pos_emoji} {driver.name} - {points}pts ⚡")
                 else:
-                    results += f"{pos_emoji} {driver.name} - {points}pts\n"
-        
-        embed.add_field(name="Final Classification", value=results, inline=False)
+                    lines.append(f"{pos_emoji} {driver.name} - {points}pts")
         
         # Race Stats
-        fastest = min([d for d in all_drivers if not d.dnf], key=lambda x: x.best_lap)
         most_overtakes = max(all_drivers, key=lambda x: x.overtakes_made)
         
-        stats = f"⏱️ **Fastest Lap:** {fastest.name} - {fastest.best_lap:.3f}s\n"
+        stats = ""
+        if fastest:
+            stats += f"⏱️ **Fastest Lap:** {fastest.name} - {fastest.best_lap:.3f}s\n"
         stats += f"🎯 **Most Overtakes:** {most_overtakes.name} - {most_overtakes.overtakes_made}\n"
         stats += f"🏁 **Laps Completed:** {self.race.current_lap}/{self.race.total_laps}\n"
         
@@ -2259,87 +4388,508 @@ class RaceManager:
         if self.race.vsc_laps > 0:
             stats += f"🟡 **VSC Laps:** {self.race.vsc_laps}\n"
         
-        embed.add_field(name="Race Statistics", value=stats, inline=False)
+        pages = []
+        for start in range(0, len(lines), self.RESULTS_PAGE_SIZE):
+            embed = discord.Embed(
+                title=f"🏁 RACE RESULTS - {self.race.track}",
+                color=discord.Color.gold()
+            )
+            embed.add_field(name="Final Classification", value="\n".join(lines[start:start + self.RESULTS_PAGE_SIZE]), inline=False)
+            embed.add_field(name="Race Statistics", value=stats, inline=False)
+            pages.append(embed)
+        
+        if len(pages) > 1:
+            for idx, page in enumerate(pages):
+                page.set_footer(text=f"Page {idx + 1}/{len(pages)}")
+            await self.channel.send(embed=pages[0], view=EmbedPaginator(pages))
+        else:
+            await self.channel.send(embed=pages[0])
         
-        await self.channel.send(embed=embed)
+        if not save:
+            return
         
-        # Save to database
+        # Career updates and race_history rows for every human driver, batched with other finished races
+        user_updates = []
+        history_rows = []
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         for driver in all_drivers:
-            if not driver.is_ai:
-                points = points_system[driver.position - 1] if not driver.dnf and driver.position <= 10 else 0
-                if driver.id == fastest.id and driver.position <= 10:
-                    points += 1
-                
-                money_earned = self.calculate_race_earnings(driver, points)
-                
-                conn = db.get_conn()
-                c = conn.cursor()
-                
-                # Update user stats
-                c.execute('''UPDATE users SET 
-                    career_points = career_points + ?,
-                    money = money + ?,
-                    race_starts = race_starts + 1,
-                    career_wins = career_wins + ?,
-                    career_podiums = career_podiums + ?,
-                    fastest_laps = fastest_laps + ?,
-                    dnf_count = dnf_count + ?,
-                    total_distance = total_distance + ?,
-                    total_race_time = total_race_time + ?,
-                    last_race_date = ?
-                    WHERE user_id = ?''',
-                    (points, money_earned, 1 if driver.position == 1 else 0,
-                     1 if driver.position <= 3 and not driver.dnf else 0,
-                     1 if driver.id == fastest.id else 0,
-                     1 if driver.dnf else 0,
-                     self.race.track_data[self.race.track]['length'] * self.race.current_lap,
-                     driver.total_time,
-                     datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                     driver.id))
-                
-                # Save race history
-                c.execute('''INSERT INTO race_history (
-                    user_id, position, points, fastest_lap, timestamp, track, weather,
-                    grid_position, positions_gained, pit_stops, dnf, dnf_reason,
-                    overtakes_made, overtakes_lost, battles_won, battles_lost,
-                    top_speed, avg_lap_time, race_time, gap_to_winner,
-                    tire_strategy, money_earned, race_mode
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (driver.id, driver.position, points, driver.best_lap,
-                     datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                     self.race.track, self.race.weather, driver.grid_position,
-                     driver.positions_gained, driver.pit_stops, 1 if driver.dnf else 0,
-                     driver.dnf_reason, driver.overtakes_made, driver.overtakes_lost,
-                     driver.battles_won, driver.battles_lost, 0,
-                     driver.total_time / max(1, driver.lap), driver.total_time,
-                     driver.gap_to_leader, f"{driver.tyre_compound}",
-                     money_earned, self.race.race_mode))
-                
-                conn.commit()
-                conn.close()
-    
-    def calculate_race_earnings(self, driver: Driver, points: int) -> int:
+            if driver.is_ai:
+                continue
+            
+            points = points_system[driver.position - 1] if not driver.dnf and driver.position <= 10 else 0
+            if fastest and driver.id == fastest.id and driver.position <= 10:
+                points += 1
+            
+            money_earned = self.calculate_race_earnings(driver, points, fastest)
+            
+            user_updates.append(
+                (points, money_earned, 1 if driver.position == 1 else 0,
+                 1 if driver.position <= 3 and not driver.dnf else 0,
+                 1 if fastest and driver.id == fastest.id else 0,
+                 1 if driver.dnf else 0,
+                 self.race.track_data[self.race.track]['length'] * self.race.current_lap,
+                 driver.total_time,
+                 timestamp,
+                 driver.id))
+            
+            history_rows.append(
+                (driver.id, driver.position, points, driver.best_lap,
+                 timestamp,
+                 self.race.track, self.race.weather, driver.grid_position,
+                 driver.positions_gained, driver.pit_stops, 1 if driver.dnf else 0,
+                 driver.dnf_reason, driver.overtakes_made, driver.overtakes_lost,
+                 driver.battles_won, driver.battles_lost, 0,
+                 driver.total_time / max(1, driver.lap), driver.total_time,
+                 driver.gap_to_leader, f"{driver.tyre_compound}",
+                 money_earned, self.race.race_mode, self.race.seed,
+                 json.dumps(self.race.inputs), self.race.start_state))
+        
+        writer.submit(user_updates, history_rows)
+    
+    def calculate_race_earnings(self, driver: Driver, points: int, fastest: Optional[Driver]) -> int:
         """Calculate race earnings"""
         base_pay = 5000
         position_bonus = max(0, (20 - driver.position) * 1000) if not driver.dnf else 0
         points_bonus = points * 500
         overtake_bonus = driver.overtakes_made * 200
-        fastest_lap_bonus = 2500 if driver.best_lap == min(d.best_lap for d in self.race.drivers if not d.dnf) else 0
+        fastest_lap_bonus = 2500 if fastest and driver.best_lap == fastest.best_lap else 0
         
         return base_pay + position_bonus + points_bonus + overtake_bonus + fastest_lap_bonus
 
+# ============================================================================
+# RACE SCHEDULER - SHARED TICK FOR ALL ACTIVE RACES
+# ============================================================================
+
+def race_worker_main(conn):
+    """Worker process loop: owns its races and steps them when the bot process asks"""
+    races = {}
+    checkpoint_laps = {}
+    
+    while True:
+        message = conn.recv()
+        command = message[0]
+        
+        if command == "add":
+            races[message[1]] = RaceEngine.from_snapshot(message[2])
+            checkpoint_laps[message[1]] = races[message[1]].current_lap
+        elif command == "input":
+            race_id, driver_id, action, value = message[1:]
+            race = races.get(race_id)
+            if race:
+                driver = next(d for d in race.drivers if d.id == driver_id)
+                race.apply_input(driver, action, value)
+        elif command == "step":
+            batch = [race_id for race_id in message[1] if race_id in races]
+            results = RaceEngine.advance_batch([races[race_id] for race_id in batch])
+            
+            replies = []
+            for race_id, result in zip(batch, results):
+                race = races[race_id]
+                # Full snapshots only cross the pipe when the race is due a checkpoint
+                snapshot = None
+                if not race.race_finished and race.current_lap - checkpoint_laps[race_id] >= race.checkpoint_interval:
+                    snapshot = race.snapshot()
+                    checkpoint_laps[race_id] = race.current_lap
+                replies.append((race_id, race.lap_delta(), result, snapshot))
+            conn.send(replies)
+        elif command == "remove":
+            races.pop(message[1], None)
+            checkpoint_laps.pop(message[1], None)
+        elif command == "stop":
+            break
+
+class RaceWorker:
+    """Bot-side handle of one race worker process"""
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=race_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        # Only the worker holds its end, so recv raises EOFError once the worker dies
+        child_conn.close()
+        self.lock = asyncio.Lock()
+        self.race_count = 0
+    
+    def send(self, message: tuple):
+        """Send a message; a dead worker is left for the next step to notice and replace"""
+        try:
+            self.conn.send(message)
+        except OSError as e:
+            print(f"Error sending to race worker {self.process.pid}: {e}")
+    
+    def add(self, race_id: int, race: RaceEngine):
+        self.send(("add", race_id, race.snapshot()))
+        race.on_input = partial(self.send_input, race_id)
+        self.race_count += 1
+    
+    def send_input(self, race_id: int, driver_id: int, action: str, value: Optional[str]):
+        self.send(("input", race_id, driver_id, action, value))
+    
+    def remove(self, race_id: int):
+        self.send(("remove", race_id))
+        self.race_count -= 1
+    
+    def close(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join(timeout=1)
+    
+    async def step(self, race_ids: List[int]) -> List[tuple]:
+        async with self.lock:
+            self.conn.send(("step", race_ids))
+            return await asyncio.get_running_loop().run_in_executor(None, self.conn.recv)
+
+class ScheduledRace:
+    def __init__(self, channel_id: int, race: RaceEngine, manager: RaceManager):
+        self.channel_id = channel_id
+        self.race = race
+        self.manager = manager
+        self.due = None
+        self.render_task = None
+        self.worker = None
+        self.checkpoint = None
+        self.checkpoint_lap = 0
+    
+    @property
+    def rendering(self) -> bool:
+        return self.render_task is not None and not self.render_task.done()
+
+class RaceScheduler:
+    """Owns every active race and steps the laps that are due on one paced tick"""
+    def __init__(self, tick: float = 0.5, lap_interval: float = 3.0, cpu_budget: float = 0.25, batch_size: int = 32,
+                 worker_count: int = 0):
+        self.tick = tick
+        self.lap_interval = lap_interval
+        self.cpu_budget = cpu_budget
+        self.batch_size = batch_size
+        self.worker_count = worker_count
+        self.workers: List[RaceWorker] = []
+        # Workers start from a fresh interpreter rather than forking the database and writer threads
+        self.context = multiprocessing.get_context("spawn")
+        self.races: Dict[int, ScheduledRace] = {}
+        self.task = None
+        # One writer thread keeps checkpoint writes ordered and off the event loop
+        self.checkpoint_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="race-checkpoints")
+        
+        self.ticks = 0
+        self.laps_stepped = 0
+        self.laps_deferred = 0
+        self.last_tick_cpu = 0.0
+    
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.races
+    
+    def get(self, channel_id: int) -> Optional[RaceEngine]:
+        entry = self.races.get(channel_id)
+        return entry.race if entry else None
+    
+    def add(self, channel_id: int, race: RaceEngine, manager: RaceManager):
+        """Claim the channel for a race; laps start once the race is released"""
+        self.races[channel_id] = ScheduledRace(channel_id, race, manager)
+    
+    def release(self, channel_id: int, delay: float = 0.0):
+        """Schedule the first lap of a claimed race"""
+        self.start()
+        entry = self.races[channel_id]
+        self.write_checkpoint(entry)
+        if self.workers:
+            entry.worker = min(self.workers, key=lambda w: w.race_count)
+            entry.worker.add(channel_id, entry.race)
+        entry.due = asyncio.get_running_loop().time() + delay
+    
+    def remove(self, channel_id: int):
+        entry = self.races.pop(channel_id, None)
+        if entry and entry.worker:
+            entry.worker.remove(channel_id)
+        if entry and entry.due is not None:
+            self.checkpoint_writer.submit(self.run_write, db.delete_race_checkpoint, channel_id)
+    
+    def start(self):
+        if self.worker_count and not self.workers:
+            self.workers = [RaceWorker(self.context) for _ in range(self.worker_count)]
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        
+        while True:
+            try:
+                self.run_tick(loop.time())
+            except Exception as e:
+                print(f"Error in race scheduler tick: {e}")
+            
+            # Pace against the ideal schedule instead of sleeping a fixed amount
+            next_tick += self.tick
+            now = loop.time()
+            if next_tick < now:
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
+    
+    def run_tick(self, now: float):
+        """Step every due race in batches until the tick's CPU budget is spent"""
+        self.ticks += 1
+        due = sorted(
+            [e for e in self.races.values() if e.due is not None and e.due <= now and not e.rendering],
+            key=lambda e: e.due
+        )
+        
+        loop = asyncio.get_running_loop()
+        
+        # Races owned by worker processes only cost a message here
+        remote = {}
+        for entry in due:
+            if entry.worker:
+                remote.setdefault(entry.worker, []).append(entry)
+        for worker, entries in remote.items():
+            task = loop.create_task(self.step_remote(worker, entries))
+            for entry in entries:
+                self.reschedule(entry, now)
+                entry.render_task = task
+            self.laps_stepped += len(entries)
+        
+        local = [entry for entry in due if not entry.worker]
+        started = time.perf_counter()
+        for i in range(0, len(local), self.batch_size):
+            if time.perf_counter() - started >= self.cpu_budget:
+                self.laps_deferred += len(local) - i
+                break
+            
+            batch = local[i:i + self.batch_size]
+            results = RaceEngine.advance_batch([entry.race for entry in batch])
+            self.laps_stepped += len(batch)
+            
+            for entry, result in zip(batch, results):
+                self.reschedule(entry, now)
+                self.check_players(entry.race)
+                self.save_checkpoint(entry)
+                entry.render_task = loop.create_task(self.render(entry, result))
+        
+        self.last_tick_cpu = time.perf_counter() - started
+    
+    def reschedule(self, entry: ScheduledRace, now: float):
+        entry.due += self.lap_interval
+        if entry.due < now:
+            entry.due = now + self.lap_interval
+    
+    def save_checkpoint(self, entry: ScheduledRace, snapshot: Optional[bytes] = None):
+        """Checkpoint the race every checkpoint_interval laps until the flag"""
+        race = entry.race
+        if race.race_finished or race.current_lap - entry.checkpoint_lap < race.checkpoint_interval:
+            return
+        self.write_checkpoint(entry, snapshot)
+    
+    def write_checkpoint(self, entry: ScheduledRace, snapshot: Optional[bytes] = None):
+        """Keep the snapshot in memory and persist it on the writer thread"""
+        entry.checkpoint = snapshot or entry.race.snapshot()
+        entry.checkpoint_lap = entry.race.current_lap
+        self.checkpoint_writer.submit(
+            self.run_write, db.save_race_checkpoint, entry.channel_id, entry.checkpoint_lap, entry.checkpoint
+        )
+    
+    @staticmethod
+    def run_write(write, *args):
+        try:
+            write(*args)
+        except Exception as e:
+            print(f"Error writing race checkpoint: {e}")
+    
+    def check_players(self, race: RaceEngine):
+        players = [d for d in race.drivers if not d.is_ai]
+        if players and all(d.dnf for d in players):
+            race.race_finished = True
+    
+    async def step_remote(self, worker: RaceWorker, entries: List[ScheduledRace]):
+        """Step races in a worker process and sync their mirrors before rendering"""
+        try:
+            replies = await worker.step([entry.channel_id for entry in entries])
+        except (EOFError, OSError) as e:
+            print(f"Race worker {worker.process.pid} died: {e}")
+            self.replace_worker(worker)
+            return
+        except Exception as e:
+            print(f"Error stepping races in worker {worker.process.pid}: {e}")
+            return
+        
+        stepped = {race_id: (delta, result, snapshot) for race_id, delta, result, snapshot in replies}
+        renders = []
+        for entry in entries:
+            if entry.channel_id not in stepped:
+                continue
+            delta, result, snapshot = stepped[entry.channel_id]
+            entry.race.apply_delta(delta, result.events)
+            self.check_players(entry.race)
+            if snapshot:
+                self.write_checkpoint(entry, snapshot)
+            renders.append(self.render(entry, result))
+        
+        await asyncio.gather(*renders)
+    
+    def replace_worker(self, worker: RaceWorker):
+        """Start a fresh worker in place of a dead one and run its races here from their last checkpoint"""
+        if worker not in self.workers:
+            return
+        self.workers[self.workers.index(worker)] = RaceWorker(self.context)
+        worker.close()
+        
+        for entry in self.races.values():
+            if entry.worker is not worker:
+                continue
+            entry.worker = None
+            entry.race.on_input = None
+            if entry.checkpoint:
+                entry.race.restore(entry.checkpoint)
+    
+    async def render(self, entry: ScheduledRace, result: LapResult):
+        try:
+            await entry.manager.render_lap(result, bot)
+            if entry.race.race_finished:
+                await entry.manager.send_race_results(result_writer)
+        except Exception as e:
+            print(f"Error rendering race in channel {entry.channel_id}: {e}")
+        finally:
+            if entry.race.race_finished:
+                self.remove(entry.channel_id)
+
+# ============================================================================
+# GRID POOL - PRE-WARMED RACE SHELLS
+# ============================================================================
+
+class RaceShell:
+    """Race engine built ahead of time with its AI grid drawn but not yet added"""
+    def __init__(self, race: RaceEngine, ai_drivers: List[Driver]):
+        self.race = race
+        self.ai_drivers = ai_drivers
+        self.built = time.monotonic()
+
+class GridPool:
+    """Keeps ready-made race shells per track, weather and mode, refilled in the background"""
+    SHELLS_PER_KEY = 2
+    MAX_KEYS = 16
+    SHELL_TTL = 3600.0
+    MAX_AI = 19
+    # Shells are built for the longest race of their mode and trimmed when taken
+    SHELL_LAPS = {"normal": 50, "endurance": RaceEngine.ENDURANCE_MAX_LAPS}
+    
+    def __init__(self, repository: 'Repository', weather_service: 'WeatherForecastService', kernel: str):
+        self.repository = repository
+        self.weather_service = weather_service
+        self.kernel = kernel
+        self.shells: Dict[tuple, deque] = {}
+        self.refilling = set()
+        self.ai_profiles: Optional[List[Dict]] = None
+        
+        self.hits = 0
+        self.misses = 0
+    
+    async def load_ai_profiles(self) -> List[Dict]:
+        """The seeded ai_profiles rows, read from the database once"""
+        if self.ai_profiles is None:
+            self.ai_profiles = await self.repository.get_ai_profiles()
+        return self.ai_profiles
+    
+    async def build(self, key: tuple) -> RaceShell:
+        track, weather, race_mode = key
+        ensemble = await self.repository.run(self.weather_service.get_ensemble, track, weather)
+        race = RaceEngine(track=track, laps=self.SHELL_LAPS[race_mode], weather=weather, race_mode=race_mode,
+                          kernel=self.kernel, forecast_ensemble=ensemble)
+        
+        profiles = await self.load_ai_profiles()
+        rows = race.rng.sample(profiles, min(self.MAX_AI, len(profiles)))
+        return RaceShell(race, [build_ai_driver(race, row, row['ai_id'] + 100000, row['ai_name']) for row in rows])
+    
+    async def take(self, track: str, weather: str, race_mode: str, laps: int, qualifying: bool,
+                   ai_count: int) -> tuple:
+        """(race, ai_drivers) for a new race, from the pool or built on the spot"""
+        key = (track, weather, race_mode)
+        shells = self.shells.pop(key, None) or deque()
+        self.shells[key] = shells
+        if len(self.shells) > self.MAX_KEYS:
+            self.shells.pop(next(iter(self.shells)))
+        
+        now = time.monotonic()
+        while shells and now - shells[0].built > self.SHELL_TTL:
+            shells.popleft()
+        
+        if shells:
+            shell = shells.popleft()
+            self.hits += 1
+        else:
+            shell = await self.build(key)
+            self.misses += 1
+        self.refill(key)
+        
+        shell.race.set_distance(laps)
+        shell.race.qualifying_mode = qualifying
+        return shell.race, shell.ai_drivers[:ai_count]
+    
+    def warm(self, keys: List[tuple]):
+        for key in keys:
+            self.shells.setdefault(key, deque())
+            self.refill(key)
+    
+    def refill(self, key: tuple):
+        if key not in self.refilling:
+            self.refilling.add(key)
+            asyncio.get_running_loop().create_task(self.fill(key))
+    
+    async def fill(self, key: tuple):
+        """Top the key back up one shell at a time, yielding to the event loop in between"""
+        try:
+            while key in self.shells and len(self.shells[key]) < self.SHELLS_PER_KEY:
+                await asyncio.sleep(0)
+                shell = await self.build(key)
+                if key in self.shells:
+                    self.shells[key].append(shell)
+        except Exception as e:
+            print(f"Error filling grid pool for {key}: {e}")
+        finally:
+            self.refilling.discard(key)
+
 # ============================================================================
 # BOT SETUP
 # ============================================================================
 
+class RacingBot(commands.Bot):
+    """Bot that writes the queued race results before it disconnects"""
+    def __init__(self, result_writer: ResultWriter, **options):
+        super().__init__(**options)
+        self.result_writer = result_writer
+    
+    async def setup_hook(self):
+        # Client.run only handles Ctrl+C; the Procfile worker is stopped with SIGTERM
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.close()))
+        except NotImplementedError:
+            pass
+    
+    async def close(self):
+        await self.result_writer.drain()
+        await super().close()
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-db = Database()
+db = Database(os.getenv('DB_PATH', 'f1_racing.db'), pool_size=int(os.getenv('DB_POOL_SIZE', '4')))
+repository = Repository(db)
+result_writer = ResultWriter(
+    repository,
+    window=float(os.getenv('RESULTS_FLUSH_SECONDS', '2')),
+    lag_warning=float(os.getenv('RESULTS_LAG_WARNING', '10')),
+    log_interval=float(os.getenv('RESULTS_LOG_INTERVAL', '300'))
+)
+bot = RacingBot(result_writer, command_prefix="!", intents=intents)
+weather_service = WeatherForecastService(db)
 
-active_races = {}
+race_kernel = os.getenv('RACE_KERNEL', 'scalar')
+grid_pool = GridPool(repository, weather_service, race_kernel)
+race_scheduler = RaceScheduler(
+    tick=float(os.getenv('RACE_TICK', '0.5')),
+    lap_interval=float(os.getenv('RACE_LAP_INTERVAL', '3.0')),
+    cpu_budget=float(os.getenv('RACE_TICK_BUDGET', '0.25')),
+    worker_count=int(os.getenv('RACE_WORKERS', '0'))
+)
 
 # ============================================================================
 # BOT COMMANDS
@@ -2353,33 +4903,49 @@ async def on_ready():
         print(f'✅ Synced {len(synced)} commands')
     except Exception as e:
         print(f'❌ Error syncing commands: {e}')
+    
+    grid_pool.warm([("Monza", "clear", "normal"), ("Spa", "clear", "endurance")])
+    await resume_races()
+    await repository.run(repository.load_ranks)
+    await warm_strategy_pool()
+
+async def resume_races():
+    """Rehydrate races checkpointed before a restart into their original channels"""
+    for channel_id, lap, state in await repository.load_race_checkpoints():
+        if channel_id in race_scheduler:
+            continue
+        
+        try:
+            channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+            race = RaceEngine.from_snapshot(state)
+        except Exception as e:
+            print(f'❌ Could not resume race in channel {channel_id}: {e}')
+            await repository.delete_race_checkpoint(channel_id)
+            continue
+        
+        race_manager = RaceManager(race, channel)
+        race_scheduler.add(channel_id, race, race_manager)
+        
+        resume_embed = discord.Embed(
+            title=f"🔄 RACE RESUMED - {race.track_data[race.track]['name']}",
+            description=f"The race restarts from lap {lap}/{race.total_laps} after a bot restart.",
+            color=discord.Color.orange()
+        )
+        try:
+            await channel.send(embed=resume_embed)
+        except discord.DiscordException:
+            pass
+        
+        race_scheduler.release(channel_id, delay=2)
+        print(f'✅ Resumed race in channel {channel_id} at lap {lap}')
 
 @bot.tree.command(name="register", description="Register as an F1 driver")
 @app_commands.describe(driver_name="Your driver name", nationality="Your nationality (2-letter code)")
 async def register(interaction: discord.Interaction, driver_name: str, nationality: str = "UN"):
-    conn = db.get_conn()
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM users WHERE user_id = ?", (interaction.user.id,))
-    if c.fetchone():
+    if not await repository.create_user(interaction.user.id, driver_name, nationality.upper()):
         await interaction.response.send_message("❌ You're already registered!", ephemeral=True)
-        conn.close()
         return
     
-    c.execute('''INSERT INTO users (user_id, driver_name, nationality, created_date, racing_number)
-                 VALUES (?, ?, ?, ?, ?)''',
-              (interaction.user.id, driver_name, nationality.upper(),
-               datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-               random.randint(1, 99)))
-    
-    # Create default car
-    c.execute('''INSERT INTO cars (owner_id, car_name, is_active)
-                 VALUES (?, ?, 1)''',
-              (interaction.user.id, f"{driver_name}'s Car"))
-    
-    conn.commit()
-    conn.close()
-    
     embed = discord.Embed(
         title="🏁 Registration Complete!",
         description=f"Welcome to F1 Racing, {driver_name}!",
@@ -2405,21 +4971,12 @@ async def register(interaction: discord.Interaction, driver_name: str, nationali
 async def profile(interaction: discord.Interaction, user: discord.User = None):
     target = user or interaction.user
     
-    conn = db.get_conn()
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM users WHERE user_id = ?", (target.id,))
-    user_data = c.fetchone()
+    user_dict = await repository.get_user(target.id)
     
-    if not user_data:
+    if not user_dict:
         await interaction.response.send_message("❌ Driver not registered! Use `/register` first.", ephemeral=True)
-        conn.close()
         return
     
-    # Get column names
-    columns = [description[0] for description in c.description]
-    user_dict = dict(zip(columns, user_data))
-    
     embed = discord.Embed(
         title=f"🏎️ {user_dict['driver_name']}",
         description=f"🏴 {user_dict['nationality']} | #{user_dict['racing_number']}",
@@ -2484,10 +5041,7 @@ async def profile(interaction: discord.Interaction, user: discord.User = None):
     )
     
     # Best Results
-    c.execute('''SELECT position, track, timestamp FROM race_history 
-                 WHERE user_id = ? AND dnf = 0 
-                 ORDER BY position ASC LIMIT 3''', (target.id,))
-    best_results = c.fetchall()
+    best_results = await repository.get_best_results(target.id)
     
     if best_results:
         results_text = ""
@@ -2495,256 +5049,462 @@ async def profile(interaction: discord.Interaction, user: discord.User = None):
             results_text += f"P{pos} - {track}\n"
         embed.add_field(name="🌟 Best Results", value=results_text, inline=True)
     
-    conn.close()
-    
     await interaction.response.send_message(embed=embed)
 
+# Discord allows at most 25 choices, built-in tracks come first
+TRACK_CHOICES = [
+    app_commands.Choice(name=f"{track['country'].split()[0]} {key}", value=key)
+    for key, track in TRACKS.tracks.items()
+][:25]
+
+WEATHER_CHOICES = [
+    app_commands.Choice(name="☀️ Clear", value="clear"),
+    app_commands.Choice(name="⛅ Partly Cloudy", value="partly_cloudy"),
+    app_commands.Choice(name="☁️ Cloudy", value="cloudy"),
+    app_commands.Choice(name="🌦️ Light Rain", value="light_rain"),
+    app_commands.Choice(name="🌧️ Rain", value="rain"),
+    app_commands.Choice(name="⛈️ Heavy Rain", value="heavy_rain"),
+]
+
+PLAYBACK_CHOICES = [
+    app_commands.Choice(name="🔴 Live (DM controls)", value="live"),
+    app_commands.Choice(name="▶️ Replay 1x", value="1x"),
+    app_commands.Choice(name="⏩ Replay 4x", value="4x"),
+    app_commands.Choice(name="🏁 Results only", value="results"),
+]
+
+PLAYBACK_SPEEDS = {"1x": 1, "4x": 4, "results": 0}
+REPLAY_HISTORY = 50
+
+MASS_GRID_LIMIT = 1000
+
+# Precomputed races by channel, kept so /replay can stream them again
+race_logs: Dict[int, tuple] = {}
+playback_tasks: Dict[int, asyncio.Task] = {}
+
+def channel_busy(channel_id: int) -> bool:
+    """A live race or a playback stream already owns the channel"""
+    return channel_id in race_scheduler or channel_id in playback_tasks
+
+def start_playback(manager: RaceManager, results: List[LapResult], speed: str, save: bool = True):
+    """Stream a finished race from its lap log without holding a scheduler slot"""
+    speed_factor = PLAYBACK_SPEEDS.get(speed, 1)
+    lap_interval = race_scheduler.lap_interval / speed_factor if speed_factor else 0
+    
+    task = asyncio.get_running_loop().create_task(manager.play_back(results, lap_interval, result_writer, save=save))
+    playback_tasks[manager.channel.id] = task
+    
+    def finished(task: asyncio.Task):
+        if playback_tasks.get(manager.channel.id) is task:
+            del playback_tasks[manager.channel.id]
+    task.add_done_callback(finished)
+
+def build_player_driver(user_dict: Dict, car_dict: Optional[Dict]) -> Driver:
+    """Player Driver from a users row and their active car"""
+    if not car_dict:
+        car_dict = {
+            'engine_power': 50, 'aero': 50, 'handling': 50,
+            'reliability': 100, 'tyre_wear_rate': 1.0,
+            'fuel_efficiency': 1.0, 'ers_power': 50, 'drs_efficiency': 1.0,
+            'brake_power': 50, 'cooling_efficiency': 50
+        }
+    
+    return Driver(
+        driver_id=user_dict['user_id'],
+        name=user_dict['driver_name'],
+        skill=user_dict['skill_rating'],
+        aggression=user_dict['aggression'],
+        consistency=user_dict['consistency'],
+        is_ai=False,
+        car_stats=car_dict,
+        advanced_stats={
+            'rain_skill': user_dict['rain_skill'],
+            'overtaking_skill': user_dict['overtaking_skill'],
+            'defending_skill': user_dict['defending_skill'],
+            'quali_skill': user_dict['quali_skill'],
+            'tire_management': user_dict['tire_management'],
+            'fuel_management': user_dict['fuel_management'],
+            'race_craft': user_dict['race_craft']
+        }
+    )
+
+def build_ai_driver(race: RaceEngine, ai_dict: Dict, driver_id: int, name: str) -> Driver:
+    """AI Driver from an ai_profiles row, with a car drawn from the race generator"""
+    ai_car = {
+        'engine_power': race.rng.uniform(45, 95),
+        'aero': race.rng.uniform(45, 95),
+        'handling': race.rng.uniform(45, 95),
+        'reliability': race.rng.uniform(85, 100),
+        'tyre_wear_rate': race.rng.uniform(0.8, 1.2),
+        'fuel_efficiency': race.rng.uniform(0.9, 1.1),
+        'ers_power': race.rng.uniform(45, 95),
+        'drs_efficiency': race.rng.uniform(0.9, 1.1),
+        'brake_power': race.rng.uniform(45, 95),
+        'cooling_efficiency': race.rng.uniform(45, 95)
+    }
+    
+    return Driver(
+        driver_id=driver_id,
+        name=name,
+        skill=ai_dict['skill_rating'],
+        aggression=ai_dict['aggression'],
+        consistency=ai_dict['consistency'],
+        is_ai=True,
+        car_stats=ai_car,
+        advanced_stats={
+            'rain_skill': ai_dict['rain_skill'],
+            'overtaking_skill': ai_dict['overtake_skill'],
+            'defending_skill': ai_dict['defend_skill'],
+            'quali_skill': ai_dict['quali_skill'],
+            'tire_management': ai_dict['tire_management'],
+            'fuel_management': ai_dict['fuel_management'],
+            'race_craft': ai_dict['race_craft']
+        }
+    )
+
 @bot.tree.command(name="race", description="Start a race")
 @app_commands.describe(
     track="Choose a track",
     laps="Number of laps (5-50)",
     weather="Weather conditions",
     qualifying="Run qualifying session",
-    ai_count="Number of AI drivers (1-19)"
+    ai_count="Number of AI drivers (1-19)",
+    playback="Race live with DM controls, or simulate instantly and replay"
 )
-@app_commands.choices(track=[
-    app_commands.Choice(name="🇮🇹 Monza", value="Monza"),
-    app_commands.Choice(name="🇲🇨 Monaco", value="Monaco"),
-    app_commands.Choice(name="🇧🇪 Spa", value="Spa"),
-    app_commands.Choice(name="🇬🇧 Silverstone", value="Silverstone"),
-    app_commands.Choice(name="🇯🇵 Suzuka", value="Suzuka"),
-    app_commands.Choice(name="🇸🇬 Singapore", value="Singapore"),
-    app_commands.Choice(name="🇧🇷 Interlagos", value="Interlagos"),
-    app_commands.Choice(name="🇺🇸 Austin", value="Austin"),
-])
-@app_commands.choices(weather=[
-    app_commands.Choice(name="☀️ Clear", value="clear"),
-    app_commands.Choice(name="⛅ Partly Cloudy", value="partly_cloudy"),
-    app_commands.Choice(name="☁️ Cloudy", value="cloudy"),
-    app_commands.Choice(name="🌦️ Light Rain", value="light_rain"),
-    app_commands.Choice(name="🌧️ Rain", value="rain"),
-    app_commands.Choice(name="⛈️ Heavy Rain", value="heavy_rain"),
-])
+@app_commands.choices(track=TRACK_CHOICES)
+@app_commands.choices(weather=WEATHER_CHOICES)
+@app_commands.choices(playback=PLAYBACK_CHOICES)
 async def race(
     interaction: discord.Interaction,
     track: str = "Monza",
     laps: int = 15,
     weather: str = "clear",
     qualifying: bool = True,
-    ai_count: int = 19
+    ai_count: int = 19,
+    playback: str = "live"
+):
+    await start_race(interaction, track, laps, weather, qualifying, ai_count, playback)
+
+async def start_race(
+    interaction: discord.Interaction,
+    track: str,
+    laps: int,
+    weather: str,
+    qualifying: bool,
+    ai_count: int,
+    playback: str = "live",
+    race_mode: str = "normal"
 ):
+    """Shared setup of /race, /quickrace and /endurance"""
     # Check registration
-    conn = db.get_conn()
-    c = conn.cursor()
+    user_dict = await repository.get_user(interaction.user.id)
     
-    c.execute("SELECT * FROM users WHERE user_id = ?", (interaction.user.id,))
-    user_data = c.fetchone()
-    
-    if not user_data:
+    if not user_dict:
         await interaction.response.send_message("❌ You need to register first! Use `/register`", ephemeral=True)
-        conn.close()
         return
     
+    live = playback == "live"
+    
     # Check if already in a race
-    if interaction.channel.id in active_races:
+    if channel_busy(interaction.channel.id):
         await interaction.response.send_message("❌ A race is already active in this channel!", ephemeral=True)
-        conn.close()
         return
     
     # Validate inputs
-    laps = max(5, min(50, laps))
+    if race_mode == "endurance":
+        laps = max(60, min(RaceEngine.ENDURANCE_MAX_LAPS, laps))
+    else:
+        laps = max(5, min(50, laps))
     ai_count = max(1, min(19, ai_count))
     
     await interaction.response.defer()
     
-    # Get user data
-    columns = [description[0] for description in c.description]
-    user_dict = dict(zip(columns, user_data))
+    # Engine and AI grid come pre-built from the pool
+    race, ai_drivers = await grid_pool.take(track, weather, race_mode, laps, qualifying, ai_count)
     
-    # Get user's car
-    c.execute("SELECT * FROM cars WHERE owner_id = ? AND is_active = 1 LIMIT 1", (interaction.user.id,))
-    car_data = c.fetchone()
+    # Create player driver
+    player_driver = build_player_driver(user_dict, await repository.get_active_car(interaction.user.id))
     
-    if car_data:
-        car_columns = [description[0] for description in c.description]
-        car_dict = dict(zip(car_columns, car_data))
-    else:
-        car_dict = {
-            'engine_power': 50, 'aero': 50, 'handling': 50,
-            'reliability': 100, 'tyre_wear_rate': 1.0,
-            'fuel_efficiency': 1.0, 'ers_power': 50, 'drs_efficiency': 1.0,
-            'brake_power': 50, 'cooling_efficiency': 50
-        }
+    # Setup DM channel
+    if live:
+        try:
+            dm_channel = await interaction.user.create_dm()
+            player_driver.dm_channel_id = dm_channel.id
+            
+            welcome_embed = discord.Embed(
+                title="🏎️ Race Control Connected!",
+                description=f"You can control your race strategy from here!\n\n**Track:** {track}\n**Laps:** {laps}",
+                color=discord.Color.green()
+            )
+            await dm_channel.send(embed=welcome_embed)
+        except:
+            pass
     
-    # Create race engine
-    race = RaceEngine(track=track, laps=laps, weather=weather, qualifying=qualifying)
+    race.add_driver(player_driver)
+    for ai_driver in ai_drivers:
+        race.add_driver(ai_driver)
     
-    # Create player driver
-    player_driver = Driver(
-        driver_id=interaction.user.id,
-        name=user_dict['driver_name'],
-        skill=user_dict['skill_rating'],
-        aggression=user_dict['aggression'],
-        consistency=user_dict['consistency'],
-        is_ai=False,
-        car_stats=car_dict,
-        advanced_stats={
-            'rain_skill': user_dict['rain_skill'],
-            'overtaking_skill': user_dict['overtaking_skill'],
-            'defending_skill': user_dict['defending_skill'],
-            'quali_skill': user_dict['quali_skill'],
-            'tire_management': user_dict['tire_management'],
-            'fuel_management': user_dict['fuel_management'],
-            'race_craft': user_dict['race_craft']
-        }
-    )
+    # Create race manager
+    race_manager = RaceManager(race, interaction.channel)
+    # The channel may have been claimed while the grid was being built
+    if channel_busy(interaction.channel.id):
+        await interaction.followup.send("❌ A race is already active in this channel!", ephemeral=True)
+        return
+    if live:
+        race_scheduler.add(interaction.channel.id, race, race_manager)
     
-    # Setup DM channel
+    # Until the race is released, any failure hands the channel back
+    released = False
     try:
-        dm_channel = await interaction.user.create_dm()
-        player_driver.dm_channel_id = dm_channel.id
+        # Qualifying is simulated as soon as the grid is complete
+        if qualifying:
+            quali_results = race.run_qualifying()
+            session = race.qualifying_session
+            
+            def quali_time(time: float) -> str:
+                return f"{time:.3f}s" if time != float("inf") else "NO TIME"
+            
+            q3_count = len(quali_results) - sum(len(group) for group in session.knocked_out)
+            results_text = ""
+            for idx, (driver, time) in enumerate(quali_results[:q3_count]):
+                pos_emoji = {0: "🥇", 1: "🥈", 2: "🥉"}.get(idx, f"`P{idx+1:2d}`")
+                if idx == 0:
+                    gap = "POLE"
+                elif time == float("inf"):
+                    gap = "-"
+                else:
+                    gap = f"+{time - quali_results[0][1]:.3f}s"
+                results_text += f"{pos_emoji} {driver.name} - {quali_time(time)} ({gap})\n"
+            
+            quali_result_embed = discord.Embed(
+                title=f"🏁 QUALIFYING RESULTS - {track}",
+                description=results_text or "No cars reached Q3",
+                color=discord.Color.gold()
+            )
+            
+            for name, knocked_out in (("Q2", session.knocked_out[1]), ("Q1", session.knocked_out[0])):
+                if knocked_out:
+                    quali_result_embed.add_field(
+                        name=f"❌ Knocked out in {name}",
+                        value="\n".join(
+                            f"{session.drivers[i].name} - {quali_time(session.best[session.SESSIONS.index(name), i])}"
+                            for i in knocked_out
+                        )[:1024],
+                        inline=True
+                    )
+            
+            await interaction.followup.send(embed=quali_result_embed)
+        
+        race.mark_start()
+        # Playback races are simulated to the flag now and streamed from the lap log
+        if not live:
+            results = race.run_to_finish()
+            race_logs.pop(interaction.channel.id, None)
+            race_logs[interaction.channel.id] = (race, results)
+            if len(race_logs) > REPLAY_HISTORY:
+                race_logs.pop(next(iter(race_logs)))
+            
+            await race_manager.send_race_start()
+            start_playback(race_manager, results, playback)
+            return
         
-        welcome_embed = discord.Embed(
-            title="🏎️ Race Control Connected!",
-            description=f"You can control your race strategy from here!\n\n**Track:** {track}\n**Laps:** {laps}",
-            color=discord.Color.green()
-        )
-        await dm_channel.send(embed=welcome_embed)
-    except:
-        pass
+        # Start race - laps, results and clean up are handled by the scheduler
+        await race_manager.send_race_start()
+        race_scheduler.release(interaction.channel.id, delay=2)
+        released = True
+    finally:
+        if live and not released:
+            race_scheduler.remove(interaction.channel.id)
+
+@bot.tree.command(name="replay", description="Replay the last instant race in this channel")
+@app_commands.describe(speed="Playback speed")
+@app_commands.choices(speed=PLAYBACK_CHOICES[1:])
+async def replay(interaction: discord.Interaction, speed: str = "4x"):
+    logged = race_logs.get(interaction.channel.id)
+    if not logged:
+        await interaction.response.send_message("❌ No instant race to replay in this channel!", ephemeral=True)
+        return
     
-    race.add_driver(player_driver)
+    if channel_busy(interaction.channel.id):
+        await interaction.response.send_message("❌ A race is already active in this channel!", ephemeral=True)
+        return
     
-    # Add AI drivers
-    c.execute(f"SELECT * FROM ai_profiles ORDER BY RANDOM() LIMIT {ai_count}")
-    ai_drivers_data = c.fetchall()
-    
-    ai_columns = [description[0] for description in c.description]
-    
-    for ai_data in ai_drivers_data:
-        ai_dict = dict(zip(ai_columns, ai_data))
-        
-        ai_car = {
-            'engine_power': random.uniform(45, 95),
-            'aero': random.uniform(45, 95),
-            'handling': random.uniform(45, 95),
-            'reliability': random.uniform(85, 100),
-            'tyre_wear_rate': random.uniform(0.8, 1.2),
-            'fuel_efficiency': random.uniform(0.9, 1.1),
-            'ers_power': random.uniform(45, 95),
-            'drs_efficiency': random.uniform(0.9, 1.1),
-            'brake_power': random.uniform(45, 95),
-            'cooling_efficiency': random.uniform(45, 95)
-        }
-        
-        ai_driver = Driver(
-            driver_id=ai_dict['ai_id'] + 100000,
-            name=ai_dict['ai_name'],
-            skill=ai_dict['skill_rating'],
-            aggression=ai_dict['aggression'],
-            consistency=ai_dict['consistency'],
-            is_ai=True,
-            car_stats=ai_car,
-            advanced_stats={
-                'rain_skill': ai_dict['rain_skill'],
-                'overtaking_skill': ai_dict['overtake_skill'],
-                'defending_skill': ai_dict['defend_skill'],
-                'quali_skill': ai_dict['quali_skill'],
-                'tire_management': ai_dict['tire_management'],
-                'fuel_management': ai_dict['fuel_management'],
-                'race_craft': ai_dict['race_craft']
-            }
-        )
-        
-        race.add_driver(ai_driver)
+    race, results = logged
+    await interaction.response.send_message(f"📼 Replaying {race.track} ({race.total_laps} laps)")
+    
+    race_manager = RaceManager(race, interaction.channel)
+    await race_manager.send_race_start()
+    start_playback(race_manager, results, speed, save=False)
+
+@bot.tree.command(name="quickrace", description="Quick 5-lap sprint race")
+async def quickrace(interaction: discord.Interaction):
+    await start_race(interaction, "Monza", 5, "clear", False, 10)
+
+@bot.tree.command(name="endurance", description="Endurance race with driver stints")
+@app_commands.describe(
+    track="Choose a track",
+    laps=f"Number of laps (60-{RaceEngine.ENDURANCE_MAX_LAPS})",
+    weather="Starting weather conditions",
+    ai_count="Number of AI drivers (1-19)"
+)
+@app_commands.choices(track=TRACK_CHOICES)
+@app_commands.choices(weather=WEATHER_CHOICES)
+async def endurance(
+    interaction: discord.Interaction,
+    track: str = "Spa",
+    laps: int = 300,
+    weather: str = "clear",
+    ai_count: int = 19
+):
+    await start_race(interaction, track, laps, weather, True, ai_count, race_mode="endurance")
+
+@bot.tree.command(name="massrace", description="Server-wide mass grid event")
+@app_commands.describe(
+    track="Choose a track",
+    laps="Number of laps (5-50)",
+    weather="Weather conditions",
+    grid_size=f"Total cars on the grid (20-{MASS_GRID_LIMIT})",
+    lobby_seconds="How long drivers can join (10-300)"
+)
+@app_commands.choices(track=TRACK_CHOICES)
+@app_commands.choices(weather=WEATHER_CHOICES)
+async def massrace(
+    interaction: discord.Interaction,
+    track: str = "Monza",
+    laps: int = 10,
+    weather: str = "clear",
+    grid_size: int = 100,
+    lobby_seconds: int = 60
+):
+    if channel_busy(interaction.channel.id):
+        await interaction.response.send_message("❌ A race is already active in this channel!", ephemeral=True)
+        return
     
-    conn.close()
+    laps = max(5, min(50, laps))
+    grid_size = max(20, min(MASS_GRID_LIMIT, grid_size))
+    lobby_seconds = max(10, min(300, lobby_seconds))
     
-    # Create race manager
+    ensemble = await repository.run(weather_service.get_ensemble, track, weather)
+    race = RaceEngine(track=track, laps=laps, weather=weather, race_mode="large_grid", kernel="vector",
+                      forecast_ensemble=ensemble)
     race_manager = RaceManager(race, interaction.channel)
-    active_races[interaction.channel.id] = race
+    if channel_busy(interaction.channel.id):
+        await interaction.response.send_message("❌ A race is already active in this channel!", ephemeral=True)
+        return
+    race_scheduler.add(interaction.channel.id, race, race_manager)
     
-    # Run qualifying
-    if qualifying:
-        quali_embed = discord.Embed(
-            title=f"🏁 QUALIFYING - {track}",
-            description="Running qualifying session...",
-            color=discord.Color.orange()
+    # Until the race is released, any failure hands the channel back
+    released = False
+    try:
+        lobby = MassRaceLobbyView(grid_size, lobby_seconds)
+        lobby_embed = discord.Embed(
+            title=f"🏁 MASS GRID EVENT - {track}",
+            description=f"**{grid_size} cars** | **{laps} laps**\n\nPress **Join Grid** to race! Lights out in {lobby_seconds}s.",
+            color=discord.Color.red()
         )
-        await interaction.followup.send(embed=quali_embed)
+        await interaction.response.send_message(embed=lobby_embed, view=lobby)
         
-        await asyncio.sleep(2)
+        await asyncio.sleep(lobby_seconds)
+        lobby.stop()
         
-        quali_results = race.run_qualifying()
-        
-        results_text = ""
-        for idx, (driver, time) in enumerate(quali_results[:10]):
-            pos_emoji = {0: "🥇", 1: "🥈", 2: "🥉"}.get(idx, f"`P{idx+1:2d}`")
-            gap = f"+{time - quali_results[0][1]:.3f}s" if idx > 0 else "POLE"
-            results_text += f"{pos_emoji} {driver.name} - {time:.3f}s ({gap})\n"
-        
-        quali_result_embed = discord.Embed(
-            title="🏁 QUALIFYING RESULTS",
-            description=results_text,
-            color=discord.Color.gold()
-        )
-        
-        await interaction.channel.send(embed=quali_result_embed)
-        await asyncio.sleep(3)
+        for user in lobby.players.values():
+            player_driver = build_player_driver(await repository.get_user(user.id), await repository.get_active_car(user.id))
+            
+            try:
+                dm_channel = await user.create_dm()
+                player_driver.dm_channel_id = dm_channel.id
+            except:
+                pass
+            
+            race.add_driver(player_driver)
+        
+        # Fill the rest of the grid by cycling through the AI profiles
+        ai_profiles = await grid_pool.load_ai_profiles()
+        
+        for slot in range(grid_size - len(race.drivers)):
+            ai_dict = ai_profiles[slot % len(ai_profiles)]
+            name = ai_dict['ai_name']
+            if slot >= len(ai_profiles):
+                name += f" #{slot // len(ai_profiles) + 1}"
+            race.add_driver(build_ai_driver(race, ai_dict, 100000 + slot, name))
+        
+        race.run_qualifying()
+        race.mark_start()
+        
+        await race_manager.send_race_start()
+        race_scheduler.release(interaction.channel.id, delay=2)
+        released = True
+    finally:
+        if not released:
+            race_scheduler.remove(interaction.channel.id)
+
+@bot.tree.command(name="forecast", description="Weather outlook for a track or the race in this channel")
+@app_commands.describe(
+    track="Choose a track (defaults to the race in this channel)",
+    weather="Current weather",
+    laps="How many laps ahead to look"
+)
+@app_commands.choices(track=TRACK_CHOICES)
+@app_commands.choices(weather=WEATHER_CHOICES)
+async def forecast(interaction: discord.Interaction, track: Optional[str] = None, weather: str = "clear", laps: int = 30):
+    race = race_scheduler.get(interaction.channel.id)
+    if track is None and race:
+        track = race.track
+        weather = race.weather
+        laps = race.total_laps - race.current_lap
+    track = track or "Monza"
+    laps = max(1, min(RaceEngine.ENDURANCE_MAX_LAPS, laps))
+    
+    rain = weather_service.rain_probability(weather, laps)
+    outlook = weather_service.outlook(weather, laps)
+    ensemble = await repository.run(weather_service.get_ensemble, track, weather)
     
-    # Start race
-    await race_manager.send_race_start()
-    await asyncio.sleep(2)
+    embed = discord.Embed(
+        title=f"🌦️ WEATHER FORECAST - {track}",
+        description=f"Now: {RaceEngine.WEATHER_EMOJI.get(weather, '')} {RaceEngine.WEATHER_LABELS.get(weather, weather)}"
+                    f" | Session {weather_service.session_window()}",
+        color=discord.Color.blue()
+    )
     
-    # Race simulation loop
-    while race.current_lap < race.total_laps:
-        await race.simulate_lap(bot)
-        
-        await race_manager.update_leaderboard()
-        await race_manager.send_lap_events()
-        
-        # Check if all non-AI drivers DNFed
-        active_players = [d for d in race.drivers if not d.is_ai and not d.dnf]
-        if not active_players:
-            break
-        
-        await asyncio.sleep(3)
+    checkpoints = sorted({lap for lap in (1, 5, 10, 20, 30, 50, 100, 200, laps) if lap <= laps})
+    embed.add_field(
+        name="🌧️ Rain Chance",
+        value="\n".join(f"Lap {lap}: **{rain[lap] * 100:.0f}%**" for lap in checkpoints),
+        inline=True
+    )
     
-    race.race_finished = True
+    likely = WeatherForecastService.STATES[int(outlook[-1].argmax())]
+    embed.add_field(
+        name=f"📈 Lap {laps} Outlook",
+        value=f"Most likely: {RaceEngine.WEATHER_LABELS.get(likely, likely)}\n"
+              f"Track temp: {outlook[-1] @ weather_service.state_temps:.0f}°C\n"
+              f"Grip: {outlook[-1] @ weather_service.state_grip:.0f}%",
+        inline=True
+    )
     
-    # Send final results
-    await race_manager.send_race_results(db)
+    if ensemble:
+        horizon = min(laps, WeatherForecastService.ENSEMBLE_LAPS) + 1
+        wet_runs = sum(any("rain" in state for state in member[:horizon]) for member in ensemble)
+        embed.add_field(
+            name="🎲 Ensemble",
+            value=f"{wet_runs}/{len(ensemble)} forecast runs see rain within {horizon - 1} laps",
+            inline=False
+        )
     
-    # Clean up
-    if interaction.channel.id in active_races:
-        del active_races[interaction.channel.id]
-
-@bot.tree.command(name="quickrace", description="Quick 5-lap sprint race")
-async def quickrace(interaction: discord.Interaction):
-    await race(interaction, laps=5, qualifying=False, ai_count=10)
+    await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="garage", description="Manage your car")
 async def garage(interaction: discord.Interaction):
-    conn = db.get_conn()
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM users WHERE user_id = ?", (interaction.user.id,))
-    if not c.fetchone():
+    if not await repository.is_registered(interaction.user.id):
         await interaction.response.send_message("❌ You need to register first!", ephemeral=True)
-        conn.close()
         return
     
-    c.execute("SELECT * FROM cars WHERE owner_id = ? AND is_active = 1", (interaction.user.id,))
-    car_data = c.fetchone()
+    car = await repository.get_active_car(interaction.user.id)
     
-    if not car_data:
+    if not car:
         await interaction.response.send_message("❌ No active car found!", ephemeral=True)
-        conn.close()
         return
     
-    columns = [description[0] for description in c.description]
-    car = dict(zip(columns, car_data))
-    
     embed = discord.Embed(
         title=f"🏎️ {car['car_name']}",
         description=f"**Performance Rating:** {car['performance_rating']:.1f}/100",
@@ -2804,8 +5564,6 @@ async def garage(interaction: discord.Interaction):
         inline=True
     )
     
-    conn.close()
-    
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="upgrade", description="Upgrade your car")
@@ -2820,28 +5578,21 @@ async def garage(interaction: discord.Interaction):
     app_commands.Choice(name="⚙️ Reliability", value="reliability"),
 ])
 async def upgrade(interaction: discord.Interaction, component: str):
-    conn = db.get_conn()
-    c = conn.cursor()
-    
-    c.execute("SELECT money FROM users WHERE user_id = ?", (interaction.user.id,))
-    user_data = c.fetchone()
+    user = await repository.get_user(interaction.user.id)
     
-    if not user_data:
+    if not user:
         await interaction.response.send_message("❌ You need to register first!", ephemeral=True)
-        conn.close()
         return
     
-    money = user_data[0]
+    money = user['money']
     
-    c.execute(f"SELECT {component} FROM cars WHERE owner_id = ? AND is_active = 1", (interaction.user.id,))
-    car_data = c.fetchone()
+    car = await repository.get_active_car(interaction.user.id)
     
-    if not car_data:
+    if not car:
         await interaction.response.send_message("❌ No active car found!", ephemeral=True)
-        conn.close()
         return
     
-    current_value = car_data[0]
+    current_value = car[component]
     
     # Calculate upgrade cost
     base_cost = 5000
@@ -2853,26 +5604,22 @@ async def upgrade(interaction: discord.Interaction, component: str):
             f"❌ Not enough money! Need ${upgrade_cost:,} but you have ${money:,}",
             ephemeral=True
         )
-        conn.close()
         return
     
     if current_value >= 100:
         await interaction.response.send_message("❌ Component already at maximum level!", ephemeral=True)
-        conn.close()
         return
     
     # Perform upgrade
     upgrade_amount = random.uniform(1.5, 3.5)
     new_value = min(100, current_value + upgrade_amount)
     
-    c.execute(f"UPDATE cars SET {component} = ? WHERE owner_id = ? AND is_active = 1",
-              (new_value, interaction.user.id))
-    
-    c.execute("UPDATE users SET money = money - ? WHERE user_id = ?",
-              (upgrade_cost, interaction.user.id))
-    
-    conn.commit()
-    conn.close()
+    if not await repository.apply_upgrade(interaction.user.id, component, new_value, upgrade_cost):
+        await interaction.response.send_message(
+            f"❌ Not enough money! Need ${upgrade_cost:,}",
+            ephemeral=True
+        )
+        return
     
     component_names = {
         "engine_power": "⚡ Engine Power",
@@ -2901,29 +5648,16 @@ async def upgrade(interaction: discord.Interaction, component: str):
 
 @bot.tree.command(name="stats", description="View your racing statistics")
 async def stats(interaction: discord.Interaction):
-    conn = db.get_conn()
-    c = conn.cursor()
+    user = await repository.get_user(interaction.user.id)
     
-    c.execute("SELECT * FROM users WHERE user_id = ?", (interaction.user.id,))
-    user_data = c.fetchone()
-    
-    if not user_data:
+    if not user:
         await interaction.response.send_message("❌ You need to register first!", ephemeral=True)
-        conn.close()
         return
     
-    columns = [description[0] for description in c.description]
-    user = dict(zip(columns, user_data))
-    
     # Get race history
-    c.execute('''SELECT COUNT(*), AVG(position), MIN(position), MAX(fastest_lap)
-                 FROM race_history WHERE user_id = ? AND dnf = 0''', (interaction.user.id,))
-    races, avg_pos, best_pos, best_lap = c.fetchone()
-    
-    c.execute('''SELECT track, COUNT(*) as wins FROM race_history 
-                 WHERE user_id = ? AND position = 1 
-                 GROUP BY track ORDER BY wins DESC LIMIT 3''', (interaction.user.id,))
-    best_tracks = c.fetchall()
+    summary = await repository.get_race_summary(interaction.user.id)
+    avg_pos, best_pos, best_lap = summary['avg_position'], summary['best_position'], summary['best_lap']
+    best_tracks = summary['best_tracks']
     
     embed = discord.Embed(
         title=f"📊 Statistics - {user['driver_name']}",
@@ -2957,9 +5691,7 @@ async def stats(interaction: discord.Interaction):
     )
     
     # Race craft
-    c.execute('''SELECT SUM(overtakes_made), SUM(battles_won), SUM(pit_stops)
-                 FROM race_history WHERE user_id = ?''', (interaction.user.id,))
-    overtakes, battles, pit_stops = c.fetchone()
+    overtakes, battles, pit_stops = summary['overtakes'], summary['battles'], summary['pit_stops']
     
     embed.add_field(
         name="🎯 Race Craft",
@@ -2978,9 +5710,7 @@ async def stats(interaction: discord.Interaction):
         embed.add_field(name="🌟 Best Tracks", value=tracks_text, inline=True)
     
     # Recent form
-    c.execute('''SELECT position, track FROM race_history 
-                 WHERE user_id = ? ORDER BY timestamp DESC LIMIT 5''', (interaction.user.id,))
-    recent = c.fetchall()
+    recent = summary['recent']
     
     if recent:
         recent_text = ""
@@ -2988,22 +5718,17 @@ async def stats(interaction: discord.Interaction):
             recent_text += f"P{pos} - {track}\n"
         embed.add_field(name="📈 Recent Form", value=recent_text, inline=True)
     
-    conn.close()
-    
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="leaderboard", description="View global leaderboard")
-@app_commands.describe(category="Leaderboard category")
+@app_commands.describe(category="Leaderboard category", around_me="Show the drivers ranked either side of you")
 @app_commands.choices(category=[
     app_commands.Choice(name="🏆 Championship Points", value="points"),
     app_commands.Choice(name="💰 Money", value="money"),
     app_commands.Choice(name="🥇 Wins", value="wins"),
     app_commands.Choice(name="⚡ Skill Rating", value="skill"),
 ])
-async def leaderboard(interaction: discord.Interaction, category: str = "points"):
-    conn = db.get_conn()
-    c = conn.cursor()
-    
+async def leaderboard(interaction: discord.Interaction, category: str = "points", around_me: bool = False):
     category_map = {
         "points": ("career_points", "Points"),
         "money": ("money", "Money"),
@@ -3013,9 +5738,15 @@ async def leaderboard(interaction: discord.Interaction, category: str = "points"
     
     column, name = category_map.get(category, ("career_points", "Points"))
     
-    c.execute(f'''SELECT driver_name, {column}, nationality, racing_number 
-                  FROM users ORDER BY {column} DESC LIMIT 10''')
-    top_drivers = c.fetchall()
+    if around_me:
+        page = await repository.get_page_around(interaction.user.id, column)
+        if not page:
+            await interaction.response.send_message("❌ You need to register first!", ephemeral=True)
+            return
+        ranked_drivers = [row[:5] for row in page]
+    else:
+        top_drivers = await repository.get_leaderboard(column)
+        ranked_drivers = [(idx,) + row for idx, row in enumerate(top_drivers, 1)]
     
     embed = discord.Embed(
         title=f"🏆 Global Leaderboard - {name}",
@@ -3023,7 +5754,7 @@ async def leaderboard(interaction: discord.Interaction, category: str = "points"
     )
     
     leaderboard_text = ""
-    for idx, (name_driver, value, nationality, number) in enumerate(top_drivers, 1):
+    for idx, name_driver, value, nationality, number in ranked_drivers:
         emoji = {1: "🥇", 2: "🥈", 3: "🥉"}.get(idx, f"`#{idx:2d}`")
         
         if category == "money":
@@ -3038,42 +5769,27 @@ async def leaderboard(interaction: discord.Interaction, category: str = "points"
     embed.description = leaderboard_text
     
     # User's position
-    c.execute(f'''SELECT COUNT(*) + 1 FROM users u1, users u2 
-                  WHERE u1.user_id = ? AND u2.{column} > u1.{column}''',
-              (interaction.user.id,))
-    user_rank = c.fetchone()[0]
+    user_rank = await repository.get_rank(interaction.user.id, column)
     
-    c.execute(f"SELECT {column} FROM users WHERE user_id = ?", (interaction.user.id,))
-    user_value = c.fetchone()
-    
-    if user_value:
+    if user_rank:
+        rank, user_value = user_rank
         if category == "money":
-            val_str = f"${user_value[0]:,}"
+            val_str = f"${user_value:,}"
         elif category == "skill":
-            val_str = f"{user_value[0]:.1f}"
+            val_str = f"{user_value:.1f}"
         else:
-            val_str = f"{user_value[0]}"
+            val_str = f"{user_value}"
         
-        embed.set_footer(text=f"Your rank: #{user_rank} - {val_str}")
-    
-    conn.close()
+        embed.set_footer(text=f"Your rank: #{rank} - {val_str}")
     
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="history", description="View your race history")
 async def history(interaction: discord.Interaction):
-    conn = db.get_conn()
-    c = conn.cursor()
-    
-    c.execute('''SELECT position, track, weather, points, fastest_lap, timestamp, dnf, dnf_reason
-                 FROM race_history WHERE user_id = ? 
-                 ORDER BY timestamp DESC LIMIT 10''', (interaction.user.id,))
-    
-    races = c.fetchall()
+    races = await repository.get_history(interaction.user.id)
     
     if not races:
         await interaction.response.send_message("❌ No race history found!", ephemeral=True)
-        conn.close()
         return
     
     embed = discord.Embed(
@@ -3096,8 +5812,6 @@ async def history(interaction: discord.Interaction):
             inline=False
         )
     
-    conn.close()
-    
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="help", description="View bot commands and features")
@@ -3121,6 +5835,10 @@ async def help_command(interaction: discord.Interaction):
         name="🏎️ Racing",
         value="`/race` - Start a full race\n"
               "`/quickrace` - Quick 5-lap race\n"
+              "`/massrace` - Mass grid event (up to 1000 cars)\n"
+              "`/endurance` - Endurance race with driver stints (up to 400 laps)\n"
+              "`/replay` - Replay the last instant race\n"
+              "`/forecast` - Weather outlook for a track\n"
               "`/history` - View race history\n"
               "`/stats` - View statistics",
         inline=False
@@ -3166,6 +5884,9 @@ async def help_command(interaction: discord.Interaction):
 
 if __name__ == "__main__":
     token = os.getenv('DISCORD_TOKEN')
-if token is None:
-    raise ValueError("Discord token not found!")
-bot.run(token)
+    if token is None:
+        raise ValueError("Discord token not found!")
+    try:
+        bot.run(token)
+    finally:
+        result_writer.close()
@@ -0,0 +1,60 @@
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+# Importing bot must not create f1_racing.db next to the sources
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix="f1-tests-"), "f1_racing.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import Driver, RaceEngine
+
+
+def make_race(kernel: str, seed: int = 7, laps: int = 12, weather: str = "clear", grid_size: int = 20,
+              forecast=None, race_mode: str = "normal", ai_only: bool = False) -> RaceEngine:
+    """Qualified race on Monza with a seeded grid; the car in slot 0 is the player unless ai_only"""
+    race = RaceEngine(track="Monza", laps=laps, weather=weather, kernel=kernel, seed=seed,
+                      forecast_ensemble=[forecast] if forecast else None, race_mode=race_mode)
+    rng = random.Random(seed)
+    
+    for slot in range(grid_size):
+        car_stats = {
+            'engine_power': rng.uniform(45, 95), 'aero': rng.uniform(45, 95),
+            'handling': rng.uniform(45, 95), 'reliability': rng.uniform(85, 100),
+            'tyre_wear_rate': rng.uniform(0.8, 1.2), 'fuel_efficiency': rng.uniform(0.9, 1.1),
+            'ers_power': rng.uniform(45, 95), 'drs_efficiency': rng.uniform(0.9, 1.1),
+            'brake_power': rng.uniform(45, 95), 'cooling_efficiency': rng.uniform(45, 95)
+        }
+        race.add_driver(Driver(
+            driver_id=slot,
+            name=f"Driver {slot}",
+            skill=rng.uniform(65, 95),
+            aggression=rng.uniform(50, 80),
+            consistency=rng.uniform(60, 95),
+            is_ai=ai_only or slot > 0,
+            car_stats=car_stats
+        ))
+    
+    race.run_qualifying()
+    return race
+
+
+def standings(race: RaceEngine) -> list:
+    """Everything a finished race reports, in running order"""
+    return [
+        (d.id, d.position, d.total_time, d.best_lap, d.tyre_compound, d.tyre_condition,
+         d.fuel_load, d.pit_stops, d.dnf, d.dnf_reason, d.overtakes_made)
+        for d in race.running_order
+    ]
+
+
+@pytest.fixture
+def build_race():
+    return make_race
+
+
+@pytest.fixture
+def race_state():
+    return standings
@@ -0,0 +1,111 @@
+import asyncio
+import sqlite3
+
+import discord
+import pytest
+
+from bot import Database, RacingBot, Repository, ResultWriter
+
+MIGRATED_COLUMNS = [("race_history", "seed"), ("race_history", "race_inputs"), ("race_history", "start_id"),
+                    ("weather_forecasts", "start_weather")]
+
+
+def columns(path: str, table: str) -> list:
+    conn = sqlite3.connect(path)
+    names = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    conn.close()
+    return names
+
+
+def versions(path: str) -> list:
+    conn = sqlite3.connect(path)
+    applied = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    conn.close()
+    return applied
+
+
+def make_baseline(path: str):
+    """A database as the bot created it before schema versioning: no schema_version, indexes or later columns"""
+    Database(path).setup()
+    conn = sqlite3.connect(path)
+    indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")]
+    for index in indexes:
+        conn.execute(f"DROP INDEX {index}")
+    for table, column in MIGRATED_COLUMNS:
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+    conn.execute("DROP TABLE schema_version")
+    conn.execute("DROP TABLE race_start_states")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "f1_racing.db")
+
+
+def test_migrations_on_fresh_database(db_path):
+    Database(db_path).setup()
+    assert versions(db_path) == [number for number, _, _ in Database.MIGRATIONS]
+
+
+def test_migrations_on_baseline_database(db_path):
+    make_baseline(db_path)
+    assert "seed" not in columns(db_path, "race_history")
+    
+    db = Database(db_path)
+    db.setup()
+    assert versions(db_path) == [number for number, _, _ in Database.MIGRATIONS]
+    for table, column in MIGRATED_COLUMNS:
+        assert column in columns(db_path, table)
+    assert db.check_query_plans() == {}
+
+
+def test_migrations_stamp_a_database_patched_before_versioning(db_path):
+    Database(db_path).setup()
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE schema_version")
+    conn.commit()
+    conn.close()
+    
+    Database(db_path).setup()
+    assert versions(db_path) == [number for number, _, _ in Database.MIGRATIONS]
+
+
+def test_migrations_are_not_reapplied(db_path):
+    Database(db_path).setup()
+    Database(db_path).setup()
+    assert versions(db_path) == [number for number, _, _ in Database.MIGRATIONS]
+
+
+@pytest.mark.parametrize("name", sorted(Database.HOT_QUERIES))
+def test_hot_query_uses_an_index(db_path, name):
+    Database(db_path).setup()
+    conn = sqlite3.connect(db_path)
+    query = Database.HOT_QUERIES[name]
+    plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", (0,) * query.count("?"))]
+    conn.close()
+    scans = [detail for detail in plan if detail.startswith("SCAN") and "INDEX" not in detail]
+    assert not scans, f"{name} scans: {plan}"
+
+
+def test_bot_close_writes_queued_results(db_path):
+    repository = Repository(Database(db_path))
+    writer = ResultWriter(repository, window=60)
+    racing_bot = RacingBot(writer, command_prefix="!", intents=discord.Intents.default())
+    user_update = (25, 30000, 1, 1, 1, 0, 5.8, 4500.0, "2026-01-01 12:00:00", 1)
+    history_row = (1, 1, 25, 80.5, "2026-01-01 12:00:00", "Monza", "clear", 3, 2, 1, 0, "",
+                   2, 0, 2, 0, 0, 90.0, 4500.0, 0.0, "medium", 30000, "normal", 7, "[]", None)
+    
+    async def run():
+        await repository.create_user(1, "Driver", "GB")
+        writer.submit([user_update], [history_row])
+        await racing_bot.close()
+    
+    asyncio.run(run())
+    
+    assert writer.metrics()['pending'] == 0
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM race_history WHERE user_id = 1").fetchone() == (1,)
+    assert conn.execute("SELECT race_starts, career_points FROM users WHERE user_id = 1").fetchone() == (1, 25)
+    conn.close()
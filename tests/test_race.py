@@ -0,0 +1,219 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from bot import Database, Driver, LeaderboardRanks, RaceEngine, Repository, SortedScores, VectorLapKernel, run_strategy_rollouts
+
+KERNELS = ["scalar", "vector", "sector"]
+# Smaller grids than the vector kernel's minimum run on the scalar path
+KERNEL_GRIDS = {"scalar": 20, "vector": VectorLapKernel.min_grid, "sector": 20}
+
+def lap_results(results) -> list:
+    return [(r.lap, r.order, r.events, r.leaderboard, r.weather, r.safety_car) for r in results]
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_replay_reproduces_race(build_race, race_state, kernel):
+    race = build_race(kernel, grid_size=KERNEL_GRIDS[kernel])
+    player = race.drivers[0]
+    results = []
+    while not race.race_finished:
+        if race.current_lap == 3:
+            race.apply_input(player, "push")
+        elif race.current_lap == 6:
+            race.apply_input(player, "pit", "hard")
+        elif race.current_lap == 8:
+            race.apply_input(player, "ers", "deploy")
+        results.append(race.step())
+    
+    replayed = build_race(kernel, grid_size=KERNEL_GRIDS[kernel])
+    replay_results = replayed.replay(race.inputs)
+    
+    assert lap_results(replay_results) == lap_results(results)
+    assert race_state(replayed) == race_state(race)
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_snapshot_resumes_identically(build_race, race_state, kernel):
+    race = build_race(kernel, grid_size=KERNEL_GRIDS[kernel])
+    for _ in range(5):
+        race.step()
+    
+    resumed = RaceEngine.from_snapshot(race.snapshot())
+    results = race.run_to_finish()
+    resumed_results = resumed.run_to_finish()
+    
+    assert lap_results(resumed_results) == lap_results(results)
+    assert race_state(resumed) == race_state(race)
+
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_restore_rewinds_in_place(build_race, race_state, kernel):
+    race = build_race(kernel, grid_size=KERNEL_GRIDS[kernel])
+    for _ in range(5):
+        race.step()
+    
+    snapshot = race.snapshot()
+    first = lap_results(race.run_to_finish())
+    finished = race_state(race)
+    
+    race.race_finished = False
+    race.restore(snapshot)
+    
+    assert lap_results(race.run_to_finish()) == first
+    assert race_state(race) == finished
+
+def test_race_rebuilds_from_history_row(build_race, race_state, tmp_path):
+    race = build_race("scalar", seed=11, forecast=["clear"] * 5 + ["light_rain"] * 20)
+    race.mark_start()
+    player = race.drivers[0]
+    while not race.race_finished:
+        if race.current_lap == 4:
+            race.apply_input(player, "pit", "hard")
+        race.step()
+    
+    repository = Repository(Database(str(tmp_path / "f1_racing.db")))
+    # Two drivers from one race share its start state
+    history_rows = [
+        (driver.id, driver.position, 0, driver.best_lap, "2026-01-01 12:00:00", race.track, race.weather,
+         driver.grid_position, driver.positions_gained, driver.pit_stops, int(driver.dnf), driver.dnf_reason,
+         0, 0, 0, 0, 0, 0.0, driver.total_time, 0.0, driver.tyre_compound, 0, race.race_mode, race.seed,
+         json.dumps(race.inputs), race.start_state)
+        for driver in race.drivers[:2]
+    ]
+    repository.write_race_results([], history_rows)
+    
+    conn = sqlite3.connect(repository.db.db_name)
+    race_ids = [row[0] for row in conn.execute("SELECT race_id FROM race_history ORDER BY race_id")]
+    assert conn.execute("SELECT COUNT(*) FROM race_start_states").fetchone() == (1,)
+    conn.close()
+    
+    start_state, race_inputs = repository.read_race_start(race_ids[0])
+    rebuilt = RaceEngine.rebuild(start_state, race_inputs)
+    assert race_state(rebuilt) == race_state(race)
+
+def test_leaderboard_ranks_match_sort(monkeypatch):
+    # Small chunks so the moves split and drop chunks
+    monkeypatch.setattr(SortedScores, "CHUNK", 4)
+    rng = np.random.default_rng(3)
+    columns = ("wins", "points")
+    rows = [tuple(rng.integers(0, 8, size=2).astype(float)) for _ in range(60)]
+    
+    ranks = LeaderboardRanks(columns)
+    ranks.scores = {column: SortedScores([row[i] for row in rows]) for i, column in enumerate(columns)}
+    
+    for _ in range(20):
+        changes = []
+        for index in rng.choice(len(rows), size=5, replace=False):
+            old = rows[index]
+            new = tuple(value + rng.integers(-2, 3) for value in old)
+            rows[index] = new
+            changes.append((old, new))
+        for _ in range(rng.integers(0, 3)):
+            new = tuple(rng.integers(0, 8, size=2).astype(float))
+            rows.append(new)
+            changes.append((None, new))
+        ranks.apply(changes)
+        
+        for i, column in enumerate(columns):
+            values = [row[i] for row in rows]
+            assert list(ranks.scores[column]) == sorted(values)
+            for value in set(values):
+                assert ranks.rank(column, value) == 1 + sum(other > value for other in values)
+
+def test_pit_stop_refuels(build_race):
+    race = build_race("scalar")
+    driver = race.drivers[0]
+    driver.fuel_load = 20.0
+    driver.tyre_condition = 35.0
+    
+    race.pit_stop(driver)
+    
+    assert driver.fuel_load == 70.0
+    assert driver.tyre_condition == 100.0
+    assert driver.pit_stops == 1
+    
+    race.pit_stop(driver)
+    
+    assert driver.fuel_load == 100.0
+
+@pytest.mark.parametrize("laps, low, high", [(60, 0.0, 0.15), (400, 0.3, 0.55)])
+def test_endurance_attrition(build_race, laps, low, high):
+    retired = []
+    for seed in range(10):
+        race = build_race("scalar", seed=seed, laps=laps, race_mode="endurance")
+        race.run_to_finish()
+        retired += [driver.dnf for driver in race.drivers]
+    assert low <= np.mean(retired) <= high
+
+def test_strategy_prefers_slicks_when_dry(build_race):
+    race = build_race("scalar", seed=6, laps=50, forecast=["clear"] * 51)
+    # Without retirements the finishing order reflects pace and time lost in the pits
+    race.hazard_scale = 0.0
+    player = race.drivers[0]
+    for _ in range(20):
+        race.step()
+    
+    positions = run_strategy_rollouts(race.snapshot(), player.id, list(range(8)), time.time() + 60)
+    means = {plan: np.mean(finishes) for plan, finishes in positions.items()}
+    
+    assert all(len(finishes) == 8 for finishes in positions.values())
+    assert max(means["soft"], means["medium"], means["hard"]) < min(means["inter"], means["wet"])
+
+def test_strategy_rollouts_stop_at_deadline(build_race):
+    race = build_race("vector", laps=400)
+    
+    started = time.time()
+    positions = run_strategy_rollouts(race.snapshot(), 0, list(range(100)), started + 0.3)
+    
+    assert time.time() - started < 0.6
+    assert len({len(finishes) for finishes in positions.values()}) == 1
+
+def kernel_statistics(build_race, kernel: str, races: int = 100) -> tuple:
+    """Mean finishing time and overtakes per race over a run of dry races"""
+    times, overtakes = [], []
+    for seed in range(races):
+        race = build_race(kernel, seed=seed, laps=15, forecast=["clear"] * 16)
+        # The model is the same on any grid, so small ones run on the kernel too
+        if race.lap_kernel:
+            race.lap_kernel.min_grid = 0
+        race.run_to_finish()
+        times.append(np.mean([d.total_time for d in race.drivers if not d.dnf]))
+        overtakes.append(sum(d.overtakes_made for d in race.drivers))
+    return np.mean(times), np.mean(overtakes)
+
+def test_sector_engine_matches_scalar(build_race):
+    scalar_time, scalar_overtakes = kernel_statistics(build_race, "scalar")
+    sector_time, sector_overtakes = kernel_statistics(build_race, "sector")
+    
+    assert abs(sector_time - scalar_time) < 0.01 * scalar_time
+    assert abs(sector_overtakes - scalar_overtakes) < 0.2 * scalar_overtakes
+
+def test_vector_kernel_matches_scalar(build_race):
+    scalar_time, scalar_overtakes = kernel_statistics(build_race, "scalar")
+    vector_time, vector_overtakes = kernel_statistics(build_race, "vector")
+    
+    assert abs(vector_time - scalar_time) < 0.01 * scalar_time
+    assert abs(vector_overtakes - scalar_overtakes) < 0.2 * scalar_overtakes
+
+def test_vector_kernel_runs_large_grids_only(build_race):
+    small = build_race("vector")
+    small.step()
+    
+    assert not small.uses_lap_kernel() and not small.lap_kernel.drivers
+    
+    race = build_race("vector", grid_size=VectorLapKernel.min_grid)
+    race.hazard_scale = 0.0
+    race.step()
+    driver = race.drivers[0]
+    
+    assert race.uses_lap_kernel() and driver in race.lap_kernel.drivers
+    assert type(driver) is Driver and driver.lap == 1 and driver.tyre_age == 1
+    
+    # Changes made between laps reach the next kernel lap
+    driver.tyre_condition = 42.0
+    driver.tyre_compound = "wet"
+    race.step()
+    
+    assert 30.0 < driver.tyre_condition < 42.0
+    assert driver.tyre_compound == "wet" and driver.lap == 2
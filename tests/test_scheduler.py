@@ -0,0 +1,66 @@
+import asyncio
+
+from bot import RaceEngine, RaceScheduler, RaceWorker, ScheduledRace
+
+def test_worker_deltas_keep_mirror_in_sync(build_race, race_state):
+    scheduler = RaceScheduler()
+    worker = RaceWorker(scheduler.context)
+    race = build_race("scalar")
+    reference = RaceEngine.from_snapshot(race.snapshot())
+    
+    async def run():
+        worker.add(1, race)
+        while not race.race_finished:
+            if race.current_lap == 4:
+                race.apply_input(race.drivers[0], "pit", "hard")
+                reference.apply_input(reference.drivers[0], "pit", "hard")
+            (race_id, delta, result, snapshot), = await worker.step([1])
+            race.apply_delta(delta, result.events)
+            expected = reference.step()
+            
+            assert result.order == expected.order and result.events == expected.events
+            assert race_state(race) == race_state(reference)
+            assert race.weather == reference.weather and race.safety_car == reference.safety_car
+            # Normal races checkpoint every lap until the flag
+            assert (snapshot is None) == race.race_finished
+            if snapshot:
+                assert race_state(RaceEngine.from_snapshot(snapshot)) == race_state(reference)
+    
+    try:
+        asyncio.run(run())
+    finally:
+        worker.close()
+
+def test_dead_worker_races_resume_locally(build_race):
+    scheduler = RaceScheduler(worker_count=1)
+    worker = RaceWorker(scheduler.context)
+    scheduler.workers = [worker]
+    race = build_race("scalar")
+    entry = ScheduledRace(1, race, None)
+    scheduler.races[1] = entry
+    
+    async def run():
+        entry.worker = worker
+        worker.add(1, race)
+        for _ in range(3):
+            (race_id, delta, result, snapshot), = await worker.step([1])
+            race.apply_delta(delta, result.events)
+            scheduler.write_checkpoint(entry, snapshot)
+        
+        worker.process.kill()
+        worker.process.join()
+        await scheduler.step_remote(worker, [entry])
+    
+    try:
+        asyncio.run(run())
+        
+        assert entry.worker is None and race.on_input is None
+        assert race.current_lap == 3
+        assert scheduler.workers[0] is not worker and scheduler.workers[0].process.is_alive()
+        
+        # The race carries on in this process
+        race.run_to_finish()
+        assert race.race_finished
+    finally:
+        for running in scheduler.workers:
+            running.close()